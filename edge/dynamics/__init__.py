@@ -2,4 +2,6 @@ from .dynamics import DiscreteTimeDynamics, TimestepIntegratedDynamics
 from .dynamics import EventBased
 from .event import event, EventBased
 from .hovership import HovershipDynamics, DiscreteHovershipDynamics
-from .slip import SlipDynamics
\ No newline at end of file
+from .slip import SlipDynamics
+from .transition_cache import TransitionCache
+from .transition_map import TransitionMap
@@ -1,13 +1,20 @@
 import numpy as np
 
 from .event import EventBased
+from .transition_cache import TransitionCache
+from .transition_map import TransitionMap
 from edge import error
+from edge.utils.map_computation import compute_map_by_shards
 
 
 class DiscreteTimeDynamics(EventBased):
     """Represents discrete time dynamics.
-    The 'step' method computes the state at the next time.
+    The 'step' method computes the state at the next time. Subclasses can also provide the optional 'step_batch' method,
+    which computes the next states of many state-action pairs at once.
     """
+    # Number of stateactions processed at once when computing the dynamics map
+    MAP_BLOCK_SIZE = 65536
+
     def __init__(self, stateaction_space):
         """Initializer.
         Subclasses should initialize the stateaction_space object. The given space should be the one that will be
@@ -16,6 +23,10 @@ class DiscreteTimeDynamics(EventBased):
         :param stateaction_space: edge.space.StateActionSpace. The externally-accessed stateaction_space
         """
         self.stateaction_space = stateaction_space
+        self.transition_cache = None
+        # Whether `step` checks that its inputs are in the stateaction space. Disabling this is only safe when the
+        # inputs are known to be valid (see Environment.trusted)
+        self.validate = True
 
     @property
     def parameters(self):
@@ -35,34 +46,187 @@ class DiscreteTimeDynamics(EventBased):
         """
         raise NotImplementedError
 
+    def step_batch(self, states, actions):
+        """ Optional method
+        Batch version of `step`: computes the next states of a list of state-action pairs. Subclasses should redefine
+        this method with a vectorized implementation when possible: this one simply loops over the pairs and calls
+        `step`.
+        :param states: np.ndarray of shape (N, state_space.data_length). The current states
+        :param actions: np.ndarray of shape (N, action_space.data_length). The actions taken
+        :return: np.ndarray of shape (N, state_space.data_length). The next states
+        :return: np.ndarray<bool> of shape (N,). Whether each next state is feasible
+        """
+        state_space = self.stateaction_space.state_space
+        new_states = np.empty((len(states), state_space.data_length))
+        is_feasible = np.empty(len(states), dtype=bool)
+        for n, (state, action) in enumerate(zip(states, actions)):
+            new_states[n], is_feasible[n] = self.step(state, action)
+        return new_states, is_feasible
+
+    def enable_transition_cache(self, max_size=TransitionCache.DEFAULT_MAX_SIZE,
+                                Q_map=None, side_effects=None):
+        """
+        Memoizes the transitions computed by `step`. This is only valid for deterministic dynamics. Transitions are
+        cached only when the state and the action are on the grid of the stateaction space, and are keyed by the flat
+        index of the stateaction. If the cache is full, the least recently used transition is evicted.
+        :param max_size: int: the maximal number of cached transitions
+        :param Q_map: optional: a dynamics map (see compute_map) used to preload the cache. The next states of the map
+            are projected on the grid of the state space, so they are only exact if the dynamics stay on the grid
+        :param side_effects: optional: array of the same shape as Q_map, with the side effects of each transition
+            (see get_step_side_effects)
+        """
+        self.transition_cache = TransitionCache(max_size)
+        # The instance attribute shadows the method of the class: the subclasses do not need to know about the cache
+        self.step = self._cached_step
+        if Q_map is not None:
+            self.preload_transition_cache(Q_map, side_effects)
+
+    def disable_transition_cache(self):
+        """
+        Stops memoizing the transitions and deletes the cache
+        """
+        self.transition_cache = None
+        self.__dict__.pop('step', None)
+
+    def preload_transition_cache(self, Q_map, side_effects=None):
+        """
+        Fills the transition cache with the transitions of a dynamics map. The transitions are read from the map
+        when they are first queried, so that preloading does not depend on the size of the map, and the cache stays
+        bounded
+        :param Q_map: the dynamics map (see compute_map)
+        :param side_effects: optional: array of the same shape as Q_map, with the side effects of each transition
+        """
+        state_space = self.stateaction_space.state_space
+        next_state_ids = np.asarray(Q_map).reshape(-1)
+        if side_effects is not None:
+            side_effects = np.asarray(side_effects).reshape(-1)
+
+        def load_transition(flat_id):
+            next_state = state_space.element_at_flat(next_state_ids[flat_id])[0]
+            return (
+                next_state,
+                self.is_feasible_state(next_state),
+                None if side_effects is None else side_effects[flat_id]
+            )
+
+        self.transition_cache.loader = load_transition
+
+    def get_step_side_effects(self):
+        """ Hook for the transition cache
+        Returns the side effects of the last call to `step` on the dynamics, so they can be replayed when the
+        transition is read from the cache. Subclasses whose `step` has side effects should redefine this method and
+        `apply_step_side_effects`
+        :return: the side effects, or None
+        """
+        return None
+
+    def apply_step_side_effects(self, side_effects):
+        """ Hook for the transition cache
+        Replays the side effects of a cached transition
+        :param side_effects: the output of `get_step_side_effects`, or None if they are unknown
+        """
+        pass
+
+    def _cached_step(self, state, action):
+        stateaction_space = self.stateaction_space
+        on_grid = stateaction_space.state_space.is_on_grid(state) and \
+            stateaction_space.action_space.is_on_grid(action)
+        if not on_grid:
+            return type(self).step(self, state, action)
+        key = int(stateaction_space.flat_index_of(
+            np.concatenate((np.atleast_1d(state), np.atleast_1d(action)))
+        ))
+        transition = self.transition_cache.get(key)
+        if transition is None:
+            new_state, is_feasible = type(self).step(self, state, action)
+            transition = (new_state, is_feasible, self.get_step_side_effects())
+            self.transition_cache.put(key, transition)
+        else:
+            new_state, is_feasible, side_effects = transition
+            self.apply_step_side_effects(side_effects)
+        return np.array(new_state), is_feasible
+
+    @property
+    def has_step_batch(self):
+        """Whether the class provides a vectorized implementation of `step_batch`
+        :return: boolean
+        """
+        return type(self).step_batch is not DiscreteTimeDynamics.step_batch
+
     def is_feasible_state(self, state):
         """Unused, returns True"""
         return True
 
-    def compute_map(self):
-        """Computes the dynamics map
-        :return: np.ndarray. The dynamics map. The array has n_s + n_a dimensions, and the values are the indexes in
-            self.stateaction_space
-        """
-        # General note: Q_map stores the index of the next state. This
-        # approximates the dynamics by projecting the state we end up in, and
-        # may lead to errors. A more precise implementation would keep the
-        # exact value of the next state instead of its index. So far, this
-        # method is only used for the computation of the viability sets, and
-        # this requires the index of the next state: implementing the more
-        # precise method is useless for this.
-        # However, the following implementation may need to change if this
-        # method is used for something else.
-
-        # This probably breaks when self.stateaction_space.state_space.ndim > 1: then, indexes are tuples, not ints
-        Q_map = np.zeros(self.stateaction_space.shape, dtype=int)
-        for sa_index, stateaction in iter(self.stateaction_space):
-            state, action = self.stateaction_space.get_tuple(stateaction)
-            next_state, failed = self.step(state, action)
-            next_state_index = self.stateaction_space.state_space.get_index_of(
-                next_state
-            )
-            Q_map[sa_index] = next_state_index
+    def compute_map_block(self, stateactions):
+        """Computes the dynamics map on a block of stateactions
+        :param stateactions: np.ndarray of shape (N, stateaction_space.data_length). The stateactions
+        :return: np.ndarray<int> of shape (N,). The flat indexes of the next states in the state space
+        :return: np.ndarray of shape (N, state_space.data_length). The exact next states
+        :return: np.ndarray<bool> of shape (N,). Whether each transition fails, i.e., leads to an unfeasible state
+        """
+        state_space = self.stateaction_space.state_space
+        states, actions = self.stateaction_space.get_tuple_batch(stateactions)
+        next_states, is_feasible = self.step_batch(states, actions)
+        # The map approximates the dynamics by projecting the next state on the grid: see compute_map
+        next_state_ids = state_space.flat_index_of(next_states, around_ok=True)
+        return next_state_ids, next_states, np.logical_not(is_feasible)
+
+    def compute_transition_map(self, path=None, store_next_states=True,
+                               block_size=None, n_workers=None,
+                               shard_directory=None, shard_size=None):
+        """Computes the dynamics map with the flat indexes of the next states, the exact next states and the failures.
+        The stateaction space is processed by blocks with `step_batch`, which is vectorized if the subclass provides
+        it. The computation can be split in shards computed by several processes and saved on disk, so an interrupted
+        computation can be resumed (see edge.utils.compute_map_by_shards)
+        :param path: the directory where the map is written (see TransitionMap). If None, the map is kept in memory
+        :param store_next_states: whether the map stores the exact next states
+        :param block_size: the number of stateactions processed at once. Defaults to MAP_BLOCK_SIZE
+        :param n_workers: the number of worker processes. If None, the map is computed in the current process
+        :param shard_directory: the directory where the shards are saved. If None, the shards are not saved
+        :param shard_size: the number of stateactions in one shard
+        :return: the TransitionMap
+        """
+        if block_size is None:
+            block_size = self.MAP_BLOCK_SIZE
+        transition_map = TransitionMap.empty(
+            self.stateaction_space, path=path,
+            store_next_states=store_next_states
+        )
+        try:
+            parameters = self.parameters
+        except NotImplementedError:
+            parameters = None
+        return compute_map_by_shards(
+            self.compute_map_block, self.stateaction_space, block_size,
+            transition_map, n_workers=n_workers,
+            shard_directory=shard_directory, shard_size=shard_size,
+            parameters={'dynamics': type(self).__name__,
+                        'parameters': parameters}
+        )
+
+    def compute_map(self, block_size=None, return_failures=False,
+                    n_workers=None, shard_directory=None, shard_size=None):
+        """Computes the dynamics map. See compute_transition_map for the parameters
+        :param block_size: the number of stateactions processed at once. Defaults to MAP_BLOCK_SIZE
+        :param return_failures: whether to also return the map of failures
+        :param n_workers: the number of worker processes. If None, the map is computed in the current process
+        :param shard_directory: the directory where the shards are saved. If None, the shards are not saved
+        :param shard_size: the number of stateactions in one shard
+        :return: np.ndarray. The dynamics map. The array has n_s + n_a dimensions, and the values are the flat indexes
+            of the next states in self.stateaction_space.state_space (see DiscretizableSpace.ravel_index)
+        :return: if return_failures is True, np.ndarray<bool> of the same shape: whether each transition leads to an
+            unfeasible state
+        """
+        # Indexes of multidimensional state spaces are tuples: we store flat indexes instead, so the map is a compact
+        # array of integers whatever the dimension of the state space
+        transition_map = self.compute_transition_map(
+            store_next_states=False, block_size=block_size,
+            n_workers=n_workers, shard_directory=shard_directory,
+            shard_size=shard_size
+        )
+        Q_map = transition_map.next_state_ids
+        if return_failures:
+            return Q_map, transition_map.failures
         return Q_map
 
 
@@ -107,8 +271,9 @@ class TimestepIntegratedDynamics(DiscreteTimeDynamics):
         :param action: np.ndarray. The action taken
         :return: np.ndarray. The next state
         """
-        if (state not in self.stateaction_space.state_space) or (
-                action not in self.stateaction_space.action_space):
+        if self.validate and (
+                (state not in self.stateaction_space.state_space) or
+                (action not in self.stateaction_space.action_space)):
             raise error.OutOfSpace
         if not self.is_feasible_state(state):
             return state, False
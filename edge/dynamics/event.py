@@ -77,16 +77,29 @@ class EventBased:
     """
     Provides the get_events function to all inheriting classes
     """
+    # Names of the event methods of each class. Events are methods, so they only need to be looked up once per class
+    _event_names = {}
+
+    @classmethod
+    def get_event_names(cls):
+        """
+        :return: list<str>. The names of the methods of the class that are decorated with the `@event` decorator.
+        """
+        event_names = EventBased._event_names.get(cls)
+        if event_names is None:
+            attributes = [(f, getattr(cls, f))
+                          for f in dir(cls)
+                          if not f.startswith("__")
+                          ]
+            event_names = [f
+                           for f, m in attributes
+                           if callable(m) and getattr(m, 'is_event', False)
+                           ]
+            EventBased._event_names[cls] = event_names
+        return event_names
+
     def get_events(self):
         """
         :return: list<method>. The list of methods that are decorated with the `@event` decorator.
         """
-        methods = [getattr(self, f)
-                   for f in dir(self)
-                   if callable(getattr(self, f)) and not f.startswith("__")
-                   ]
-        evt_methods = [m
-                       for m in methods
-                       if hasattr(m, 'is_event') and getattr(m, 'is_event')
-                       ]
-        return evt_methods
+        return [getattr(self, f) for f in self.get_event_names()]
@@ -8,8 +8,22 @@ from edge import error
 
 
 class HovershipDynamics(TimestepIntegratedDynamics):
+    """Continuous hovership dynamics, integrated between two timesteps.
+    With integrator='solve_ivp', each transition is integrated with scipy.integrate.solve_ivp. With integrator='rk4',
+    transitions are integrated by batches with a vectorized fixed-step Runge-Kutta scheme: the number of substeps is
+    doubled until two successive integrations differ by less than `tolerance`.
+    """
+    INTEGRATORS = ('solve_ivp', 'rk4')
+    # Bounds on the number of substeps of the 'rk4' integrator
+    RK4_MIN_SUBSTEPS = 4
+    RK4_MAX_SUBSTEPS = 4096
+
     def __init__(self, ground_gravity, gravity_gradient, control_frequency,
-                 max_thrust, max_altitude, shape=(200, 150)):
+                 max_thrust, max_altitude, shape=(200, 150),
+                 integrator='solve_ivp', tolerance=1e-6):
+        if integrator not in self.INTEGRATORS:
+            raise ValueError(f'Unknown integrator {integrator}. Available '
+                             f'integrators are {self.INTEGRATORS}')
         stateaction_space = StateActionSpace.from_product(
             Box([0, 0], [max_altitude, max_thrust], shape)
         )
@@ -19,9 +33,11 @@ class HovershipDynamics(TimestepIntegratedDynamics):
         self.control_frequency = control_frequency
         self.ceiling_value = stateaction_space.state_space.high
         self.max_thrust = stateaction_space.action_space.high
+        self.integrator = integrator
+        self.tolerance = tolerance
 
     def is_feasible_state(self, state):
-        if state not in self.stateaction_space.state_space:
+        if self.validate and state not in self.stateaction_space.state_space:
             raise error.OutOfSpace
         return True
 
@@ -61,6 +77,74 @@ class HovershipDynamics(TimestepIntegratedDynamics):
         )
         return trajectory
 
+    def get_force_on_ship_batch(self, states, actions):
+        grav_field = np.maximum(
+            0,
+            np.tanh(0.75 * (self.ceiling_value - states))
+        ) * self.gravity_gradient
+        return - self.ground_gravity - grav_field + actions
+
+    def integrate_rk4(self, states, actions, n_substeps):
+        """
+        Integrates the dynamics of a batch of states with a fixed-step RK4 scheme. The ceiling event is handled by
+        masking: a state that reaches the ceiling stays there until the end of the integration
+        :param states: np.ndarray of shape (N, 1). The initial states
+        :param actions: np.ndarray of shape (N, 1). The actions
+        :param n_substeps: the number of RK4 steps
+        :return: np.ndarray of shape (N, 1). The states at the end of the timestep
+        """
+        dt = 1. / (self.control_frequency * n_substeps)
+        y = np.array(states, dtype=float)
+        running = np.ones(len(y), dtype=bool)
+        for _ in range(n_substeps):
+            yr = y[running]
+            ar = actions[running]
+            k1 = self.get_force_on_ship_batch(yr, ar)
+            k2 = self.get_force_on_ship_batch(yr + 0.5 * dt * k1, ar)
+            k3 = self.get_force_on_ship_batch(yr + 0.5 * dt * k2, ar)
+            k4 = self.get_force_on_ship_batch(yr + dt * k3, ar)
+            yr = yr + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            hit_ceiling = (yr >= self.ceiling_value)[:, 0]
+            yr[hit_ceiling] = self.ceiling_value
+            y[running] = yr
+            running[np.flatnonzero(running)[hit_ceiling]] = False
+            if not running.any():
+                break
+        return y
+
+    def step_batch(self, states, actions):
+        if self.integrator != 'rk4':
+            return super(HovershipDynamics, self).step_batch(states, actions)
+        state_space = self.stateaction_space.state_space
+        if self.validate and not (
+                state_space.contains_batch(states).all() and
+                self.stateaction_space.action_space.contains_batch(actions).all()):
+            raise error.OutOfSpace
+
+        # Step doubling: the number of substeps is doubled until the result does not change by more than the tolerance
+        n_substeps = self.RK4_MIN_SUBSTEPS
+        new_states = self.integrate_rk4(states, actions, n_substeps)
+        while n_substeps < self.RK4_MAX_SUBSTEPS:
+            n_substeps *= 2
+            finer_states = self.integrate_rk4(states, actions, n_substeps)
+            converged = np.abs(finer_states - new_states).max(initial=0) <= \
+                self.tolerance
+            new_states = finer_states
+            if converged:
+                break
+
+        new_states = state_space.closest_in_batch(new_states)
+        is_feasible = np.ones(len(states), dtype=bool)
+        return new_states, is_feasible
+
+    def step(self, state, action):
+        if self.integrator != 'rk4':
+            return super(HovershipDynamics, self).step(state, action)
+        new_states, is_feasible = self.step_batch(
+            np.atleast_2d(state), np.atleast_2d(action)
+        )
+        return new_states[0], is_feasible[0]
+
 
 class DiscreteHovershipDynamics(DiscreteTimeDynamics):
     def __init__(self, ground_gravity, gravity_gradient, max_thrust,
@@ -76,14 +160,26 @@ class DiscreteHovershipDynamics(DiscreteTimeDynamics):
         self.minimum_gravity_altitude = minimum_gravity_altitude
         self.maximum_gravity_altitude = maximum_gravity_altitude
 
+    @property
+    def parameters(self):
+        return {
+            'ground_gravity': self.ground_gravity,
+            'gravity_gradient': self.gravity_gradient,
+            'max_thrust': self.stateaction_space.action_space.n - 1,
+            'max_altitude': self.stateaction_space.state_space.n - 1,
+            'minimum_gravity_altitude': self.minimum_gravity_altitude,
+            'maximum_gravity_altitude': self.maximum_gravity_altitude
+        }
+
     def is_feasible_state(self, state):
-        if state not in self.stateaction_space.state_space:
+        if self.validate and state not in self.stateaction_space.state_space:
             raise error.OutOfSpace
         return True
 
     def step(self, state, action):
-        if (state not in self.stateaction_space.state_space) or (
-                action not in self.stateaction_space.action_space):
+        if self.validate and (
+                (state not in self.stateaction_space.state_space) or
+                (action not in self.stateaction_space.action_space)):
             raise error.OutOfSpace
         if not self.is_feasible_state(state):
             return state, False
@@ -106,3 +202,28 @@ class DiscreteHovershipDynamics(DiscreteTimeDynamics):
         )
         is_feasible = self.is_feasible_state(new_state)
         return new_state, is_feasible
+
+    def step_batch(self, states, actions):
+        state_space = self.stateaction_space.state_space
+        if self.validate and not (
+                state_space.contains_batch(states).all() and
+                self.stateaction_space.action_space.contains_batch(actions).all()):
+            raise error.OutOfSpace
+        z = states[:, 0]
+        gravity_field = np.select(
+            [z >= self.minimum_gravity_altitude,
+             z <= self.maximum_gravity_altitude],
+            [0,
+             self.gravity_gradient * (
+                self.minimum_gravity_altitude - self.maximum_gravity_altitude
+             )],
+            self.gravity_gradient * (self.minimum_gravity_altitude - z)
+        )
+
+        dynamics_step = actions - self.ground_gravity - gravity_field.reshape(
+            (-1, 1)
+        )
+
+        new_states = state_space.closest_in_batch(states + dynamics_step)
+        is_feasible = np.ones(len(states), dtype=bool)
+        return new_states, is_feasible
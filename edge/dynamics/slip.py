@@ -8,6 +8,23 @@ from edge import error
 
 
 class SlipDynamics(DiscreteTimeDynamics):
+    """Dynamics of the spring-loaded inverted pendulum, from apex to apex.
+    A hop is made of three phases: flight until touchdown, stance until liftoff, and flight until apex. The flight
+    phases are ballistic: with analytic_flight=True, they are solved in closed form and only the stance phase is
+    integrated numerically.
+    The stance phase is integrated with one of the following solvers, which trade accuracy for speed:
+        * 'accurate': RK45 with a maximal step of 0.0005,
+        * 'fast': LSODA with the analytic Jacobian of the stance dynamics and tolerances rtol=1e-6, atol=1e-9,
+        * 'very_fast': fixed-step RK4 with a step of STANCE_FIXED_STEP.
+    Use `get_stance_solver_error` to measure the error of a solver against the 'accurate' one before using it for a
+    given set of parameters.
+    """
+    # Maximal duration of each phase of a hop
+    MAX_TIME = 3
+    STANCE_SOLVERS = ('accurate', 'fast', 'very_fast')
+    # Step of the 'very_fast' stance solver
+    STANCE_FIXED_STEP = 0.01
+
     def __init__(self,
                  gravity,
                  mass,
@@ -17,7 +34,12 @@ class SlipDynamics(DiscreteTimeDynamics):
                  failed=False,
                  state_bounds=(0.0, 1),
                  action_bounds=(-1/18*np.pi, 7/18*np.pi),
-                 shape=(200, 100)):
+                 shape=(200, 100),
+                 analytic_flight=False,
+                 stance_solver='accurate'):
+        if stance_solver not in self.STANCE_SOLVERS:
+            raise ValueError(f'Unknown stance solver {stance_solver}. '
+                             f'Available solvers are {self.STANCE_SOLVERS}')
         stateaction_space = StateActionSpace.from_product(
             Box([state_bounds[0], action_bounds[0]],
                 [state_bounds[1], action_bounds[1]], shape)
@@ -29,9 +51,13 @@ class SlipDynamics(DiscreteTimeDynamics):
         self.resting_length = resting_length
         self.energy = energy
         self.failed = False
+        # Whether the last hop failed: this is the side effect of `step` replayed by the transition cache
+        self.last_hop_failed = False
+        self.analytic_flight = analytic_flight
+        self.stance_solver = stance_solver
 
     def is_feasible_state(self, state):
-        if state not in self.stateaction_space.state_space:
+        if self.validate and state not in self.stateaction_space.state_space:
             raise error.OutOfSpace
         return True
 
@@ -46,13 +72,196 @@ class SlipDynamics(DiscreteTimeDynamics):
             'shape': self.stateaction_space.shape
         }
 
+    def get_flight_end(self, t, x, stop_at_apex):
+        """
+        Solves a flight phase in closed form. The flight stops when the body falls on the ground, when the foot
+        touches down (or at the apex if stop_at_apex is True), or after MAX_TIME
+        :param t: the time at the beginning of the flight
+        :param x: np.ndarray of shape (6,). The high-dimensional state at the beginning of the flight
+        :param stop_at_apex: whether the flight stops at the apex instead of at touchdown
+        :return: the time at the end of the flight, the high-dimensional state at the end of the flight, and whether
+            the body fell
+        """
+        vy = x[3]
+
+        def first_downward_crossing(height):
+            # First time t >= 0 such that height + vy * t - gravity * t**2 / 2 = 0 with a negative vertical speed
+            discriminant = vy**2 + 2*self.gravity*height
+            if discriminant < 0:
+                return np.inf
+            crossing = (vy + np.sqrt(discriminant))/self.gravity
+            return crossing if crossing >= 0 else np.inf
+
+        fall_time = first_downward_crossing(x[1])
+        if stop_at_apex:
+            event_time = vy/self.gravity if vy >= 0 else np.inf
+        else:
+            event_time = first_downward_crossing(x[5])
+        duration = min(fall_time, event_time, self.MAX_TIME)
+
+        # The foot moves along with the body during flight
+        x_end = np.array(x, dtype=float)
+        x_end[[0, 4]] += x[2]*duration
+        x_end[[1, 5]] += vy*duration - self.gravity*duration**2/2
+        x_end[3] = vy - self.gravity*duration
+        fell = fall_time <= min(event_time, self.MAX_TIME)
+        return t + duration, x_end, fell
+
+    def stance_dynamics(self, t, y):
+        alpha = np.arctan2(y[1] - y[5], y[0] - y[4]) - np.pi/2.0
+        spring_length = np.hypot(y[0]-y[4], y[1]-y[5])
+        leg_force = self.stiffness/self.mass*(self.resting_length
+                                              - spring_length)
+        xdotdot = -leg_force*np.sin(alpha)
+        ydotdot = leg_force*np.cos(alpha) - self.gravity
+        return np.array([y[2], y[3], xdotdot, ydotdot, 0, 0])
+
+    def stance_jacobian(self, t, y):
+        # With (dx, dy) the vector from the foot to the body and l its length, the stance accelerations are
+        # xdotdot = c*(L/l - 1)*dx and ydotdot = c*(L/l - 1)*dy - g, where c = k/m and L is the resting length
+        dx = y[0] - y[4]
+        dy = y[1] - y[5]
+        spring_length = np.hypot(dx, dy)
+        c = self.stiffness/self.mass
+        compression = c*(self.resting_length/spring_length - 1)
+        coupling = c*self.resting_length/spring_length**3
+        d_xdotdot = np.array([compression - coupling*dx**2,
+                              -coupling*dx*dy])
+        d_ydotdot = np.array([-coupling*dx*dy,
+                              compression - coupling*dy**2])
+        jacobian = np.zeros((6, 6))
+        jacobian[0, 2] = 1
+        jacobian[1, 3] = 1
+        jacobian[2, [0, 1]] = d_xdotdot
+        jacobian[2, [4, 5]] = -d_xdotdot
+        jacobian[3, [0, 1]] = d_ydotdot
+        jacobian[3, [4, 5]] = -d_ydotdot
+        return jacobian
+
+    def get_stance_end_fixed_step(self, t, x):
+        """
+        Integrates the stance phase with a fixed-step RK4 scheme. The stance stops when the body falls on the ground,
+        at liftoff, or after MAX_TIME. The time of the event is interpolated linearly between the two steps around it,
+        and the state is integrated until that time.
+        :param t: the time at the beginning of the stance
+        :param x: np.ndarray of shape (6,). The high-dimensional state at the beginning of the stance
+        :return: the time at the end of the stance, the high-dimensional state at the end of the stance, and whether
+            the body fell
+        """
+        def rk4_step(x, dt):
+            k1 = self.stance_dynamics(t, x)
+            k2 = self.stance_dynamics(t, x + dt/2*k1)
+            k3 = self.stance_dynamics(t, x + dt/2*k2)
+            k4 = self.stance_dynamics(t, x + dt*k3)
+            return x + dt/6*(k1 + 2*k2 + 2*k3 + k4)
+
+        def event_values(x):
+            # The fall event is triggered downwards, the liftoff event upwards
+            return (-x[1],
+                    np.hypot(x[0]-x[4], x[1]-x[5]) - self.resting_length)
+
+        dt = self.STANCE_FIXED_STEP
+        t_end = t + self.MAX_TIME
+        values = event_values(x)
+        while t < t_end:
+            step = min(dt, t_end - t)
+            x_new = rk4_step(x, step)
+            new_values = event_values(x_new)
+            # Fraction of the step at which each event is triggered
+            fractions = [
+                (value/(value - new_value) if value != new_value else 0.)
+                if value <= 0 <= new_value else np.inf
+                for value, new_value in zip(values, new_values)
+            ]
+            fraction = min(fractions)
+            if fraction <= 1:
+                x = rk4_step(x, fraction*step)
+                fell = fractions[0] == fraction
+                return t + fraction*step, x, fell
+            t, x, values = t + step, x_new, new_values
+        return t, x, False
+
+    def get_stance_end(self, t, x, events):
+        """
+        Integrates the stance phase with the stance solver of the dynamics
+        :param t: the time at the beginning of the stance
+        :param x: np.ndarray of shape (6,). The high-dimensional state at the beginning of the stance
+        :param events: the fall and liftoff events, in this order
+        :return: the time at the end of the stance, the high-dimensional state at the end of the stance, and whether
+            the body fell
+        """
+        if self.stance_solver == 'very_fast':
+            return self.get_stance_end_fixed_step(t, x)
+        if self.stance_solver == 'fast':
+            options = {'method': 'LSODA', 'jac': self.stance_jacobian,
+                       'rtol': 1e-6, 'atol': 1e-9}
+        else:
+            options = {'max_step': 0.0005}
+        traj = solve_ivp(self.stance_dynamics, t_span=[t, t+self.MAX_TIME],
+                         y0=x, events=events, **options)
+        fell = traj.t_events[0].size != 0  # if not empty
+        return traj.t[-1], traj.y[:, -1], fell
+
+    def get_stance_solver_error(self, stance_solver, stateactions):
+        """
+        Measures the error of a stance solver against the 'accurate' one
+        :param stance_solver: the stance solver to evaluate
+        :param stateactions: iterable of stateactions where the solvers are compared
+        :return: dict: 'max_error' and 'mean_error', the absolute errors on the next state before its projection on the
+            grid, and 'failure_mismatches', the number of stateactions where the solvers disagree on failure
+        """
+        current_solver = self.stance_solver
+        errors = []
+        failure_mismatches = 0
+        try:
+            for stateaction in stateactions:
+                state, action = self.stateaction_space.get_tuple(stateaction)
+                results = []
+                for solver in ['accurate', stance_solver]:
+                    self.stance_solver = solver
+                    results.append(self.simulate_hop(state, action))
+                (accurate_state, accurate_failed), (new_state, failed) = \
+                    results
+                errors.append(np.abs(new_state - accurate_state).max())
+                failure_mismatches += int(failed != accurate_failed)
+        finally:
+            self.stance_solver = current_solver
+        return {
+            'max_error': np.max(errors),
+            'mean_error': np.mean(errors),
+            'failure_mismatches': failure_mismatches
+        }
+
+    def get_step_side_effects(self):
+        return self.last_hop_failed
+
+    def apply_step_side_effects(self, side_effects):
+        if side_effects:
+            self.failed = True
+
     def step(self, state, action):
+        new_state, failed = self.simulate_hop(state, action)
+        self.last_hop_failed = failed
+        if failed:
+            self.failed = True
+
+        new_state = self.stateaction_space.state_space.closest_in(new_state)
+
+        return new_state, self.is_feasible_state(new_state)
+
+    def simulate_hop(self, state, action):
+        """
+        Simulates a hop, from apex to apex, without projecting the resulting state on the state space
+        :param state: the normalized height at the apex
+        :param action: the angle of attack
+        :return: np.ndarray of shape (1,): the normalized height at the next apex, and whether the hop failed
+        """
         # low-dimensional representation:
         # state is normalized height, state = m*g*h = m*g*x[1]
         state = np.atleast_1d(state)
         action = np.atleast_1d(action)
         # * set some simulation parameters
-        MAX_TIME = 3
+        MAX_TIME = self.MAX_TIME
 
         # * map to high-dimensional state
         # forward velocity
@@ -90,55 +299,48 @@ class SlipDynamics(DiscreteTimeDynamics):
         def flight(t, y):
             return np.array([y[2], y[3], 0, -self.gravity, y[2], y[3]])
 
-        def stance(t, y):
-            alpha = np.arctan2(y[1] - y[5], y[0] - y[4]) - np.pi/2.0
-            spring_length = np.hypot(y[0]-y[4], y[1]-y[5])
-            leg_force = self.stiffness/self.mass*(self.resting_length
-                                                  - spring_length)
-            xdotdot = -leg_force*np.sin(alpha)
-            ydotdot = leg_force*np.cos(alpha) - self.gravity
-            return np.array([y[2], y[3], xdotdot, ydotdot, 0, 0])
-
-        # TODO: implement jacobian of stance
-
         # * simulate:
 
         while True:
             # while statement is just to allow breaks. It does not loop
 
             # * FLIGHT: simulate till touchdown
-            events = [fall_event, touchdown_event]
-            traj = solve_ivp(flight, t_span=[0, 0+MAX_TIME],
-                             y0=x0, events=events, max_step=0.01)
+            if self.analytic_flight:
+                t, x, fell = self.get_flight_end(0, x0, stop_at_apex=False)
+            else:
+                events = [fall_event, touchdown_event]
+                traj = solve_ivp(flight, t_span=[0, 0+MAX_TIME],
+                                 y0=x0, events=events, max_step=0.01)
+                t, x = traj.t[-1], traj.y[:, -1]
+                fell = traj.t_events[0].size != 0  # if not empty
 
             # if you fell, stop now
-            if traj.t_events[0].size != 0:  # if empty
+            if fell:
                 break
 
             # * STANCE: simulate till liftoff
-            events = [fall_event, liftoff_event]
-            traj = solve_ivp(stance, t_span=[traj.t[-1], traj.t[-1]+MAX_TIME],
-                             y0=traj.y[:, -1], events=events, max_step=0.0005)
+            t, x, fell = self.get_stance_end(t, x,
+                                             [fall_event, liftoff_event])
 
             # if you fell, stop now
-            if traj.t_events[0].size != 0:  # if empty
+            if fell:
                 break
 
             # * FLIGHT: simulate till apex
-            events = [fall_event, apex_event]
-            traj = solve_ivp(flight, t_span=[traj.t[-1], traj.t[-1]+MAX_TIME],
-                             y0=traj.y[:, -1], events=events, max_step=0.01)
+            if self.analytic_flight:
+                t, x, fell = self.get_flight_end(t, x, stop_at_apex=True)
+            else:
+                events = [fall_event, apex_event]
+                traj = solve_ivp(flight, t_span=[t, t+MAX_TIME],
+                                 y0=x, events=events, max_step=0.01)
+                t, x = traj.t[-1], traj.y[:, -1]
 
             break
 
         # * Check if low-level failured conditions are triggered
         # point mass touches the ground, or reverses direction
-        if traj.y[1, -1] < 1e-3 or traj.y[2, -1] < 0:
-            self.failed = True
+        failed = x[1] < 1e-3 or x[2] < 0
 
         # * map back to high-level state.
-        new_state = self.mass*self.gravity*traj.y[1, -1]/self.energy
-        new_state = np.atleast_1d(new_state)
-        new_state = self.stateaction_space.state_space.closest_in(new_state)
-
-        return new_state, self.is_feasible_state(new_state)
+        new_state = self.mass*self.gravity*x[1]/self.energy
+        return np.atleast_1d(new_state), failed
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+
+class TransitionCache:
+    """Least-recently-used cache of the transitions of deterministic dynamics.
+    The keys are the flat indexes of the stateactions in the stateaction space, and the values are whatever the
+    dynamics need to replay the transition (see DiscreteTimeDynamics.enable_transition_cache).
+    """
+    DEFAULT_MAX_SIZE = 2 ** 20
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, loader=None):
+        """
+        :param max_size: int: the maximal number of transitions stored
+        :param loader: optional: function taking a key and returning its transition, or None if it is unknown. It is
+            called when a key is not in the cache, e.g., to read the transitions from a dynamics map lazily
+        """
+        if max_size is None or max_size < 1:
+            raise ValueError(f'The maximal size of the cache should be a '
+                             f'positive integer, got {max_size}')
+        self.max_size = max_size
+        self.loader = loader
+        self.transitions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def __contains__(self, key):
+        return key in self.transitions
+
+    def get(self, key):
+        """
+        Returns the transition stored for a key, and marks it as recently used. If the key is not in the cache, the
+        transition is obtained from the loader, if any, and stored
+        :param key: int: the flat index of the stateaction
+        :return: the transition, or None if it is not in the cache
+        """
+        transition = self.transitions.get(key)
+        if transition is not None:
+            self.hits += 1
+            self.transitions.move_to_end(key)
+            return transition
+        if self.loader is not None:
+            transition = self.loader(key)
+        if transition is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.put(key, transition)
+        return transition
+
+    def put(self, key, transition):
+        """
+        Stores a transition, and evicts the least recently used one if the cache is full
+        :param key: int: the flat index of the stateaction
+        :param transition: the transition
+        """
+        self.transitions[key] = transition
+        self.transitions.move_to_end(key)
+        if len(self.transitions) > self.max_size:
+            self.transitions.popitem(last=False)
+
+    def clear(self):
+        self.transitions.clear()
+        self.hits = 0
+        self.misses = 0
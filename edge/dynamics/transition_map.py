@@ -0,0 +1,157 @@
+from pathlib import Path
+
+import numpy as np
+
+
+class TransitionMap:
+    """Dynamics map of a stateaction space, stored in compact arrays.
+    The map holds, for each stateaction:
+        * the flat index of the next state in the state space (see DiscretizableSpace.ravel_index),
+        * optionally, the exact next state, in float32,
+        * whether the transition fails, in a bit-packed mask.
+    The map can be kept in memory, or stored in a directory as three .npy files. These files are written incrementally
+    through memory maps, and can be loaded lazily, read-only, and without pickle, so the map can be shared by many
+    processes without being copied.
+    """
+    NEXT_STATE_IDS = 'next_state_ids.npy'
+    NEXT_STATES = 'next_states.npy'
+    FAILURES = 'failures.npy'
+
+    def __init__(self, next_state_ids, next_states=None, packed_failures=None,
+                 path=None):
+        """
+        Initializer. Use `TransitionMap.empty` or `TransitionMap.load` instead
+        :param next_state_ids: np.ndarray<int> with the shape of the stateaction space. The flat indexes of the next
+            states
+        :param next_states: np.ndarray<float32> of shape stateaction_space.shape + (state_space.data_length,), or None.
+            The exact next states
+        :param packed_failures: np.ndarray<uint8>. The bit-packed failure mask (see np.packbits)
+        :param path: the directory where the map is stored, or None if it is only in memory
+        """
+        self.next_state_ids = next_state_ids
+        self.next_states = next_states
+        self.packed_failures = packed_failures
+        self.path = path
+
+    @property
+    def shape(self):
+        return self.next_state_ids.shape
+
+    @property
+    def size(self):
+        return self.next_state_ids.size
+
+    @property
+    def failures(self):
+        """
+        The failure mask, unpacked
+        :return: np.ndarray<bool> with the shape of the stateaction space
+        """
+        return np.unpackbits(
+            self.packed_failures, count=self.size
+        ).astype(bool).reshape(self.shape)
+
+    @staticmethod
+    def empty(stateaction_space, path=None, store_next_states=True):
+        """
+        Creates an empty transition map for a stateaction space
+        :param stateaction_space: the StateActionSpace
+        :param path: the directory where the map is written. If None, the map is kept in memory
+        :param store_next_states: whether the map stores the exact next states
+        :return: the TransitionMap
+        """
+        state_space = stateaction_space.state_space
+        shape = stateaction_space.shape
+        arrays = {
+            TransitionMap.NEXT_STATE_IDS: (shape,
+                                           state_space.flat_index_dtype),
+            TransitionMap.FAILURES: ((-(-stateaction_space.size // 8),),
+                                     np.uint8),
+        }
+        if store_next_states:
+            arrays[TransitionMap.NEXT_STATES] = (
+                shape + (state_space.data_length,), np.float32
+            )
+
+        if path is None:
+            arrays = {name: np.zeros(array_shape, dtype=dtype)
+                      for name, (array_shape, dtype) in arrays.items()}
+        else:
+            path = Path(path)
+            path.mkdir(parents=True, exist_ok=True)
+            arrays = {
+                name: np.lib.format.open_memmap(
+                    path / name, mode='w+', dtype=dtype, shape=array_shape
+                )
+                for name, (array_shape, dtype) in arrays.items()
+            }
+        return TransitionMap(
+            next_state_ids=arrays[TransitionMap.NEXT_STATE_IDS],
+            next_states=arrays.get(TransitionMap.NEXT_STATES),
+            packed_failures=arrays[TransitionMap.FAILURES],
+            path=path
+        )
+
+    @staticmethod
+    def load(path, mmap_mode='r'):
+        """
+        Loads a transition map stored in a directory. The arrays are memory-mapped, so they are only read from disk
+        when they are accessed
+        :param path: the directory where the map is stored
+        :param mmap_mode: the memory-map mode (see np.load). Use None to load the arrays in memory
+        :return: the TransitionMap
+        """
+        path = Path(path)
+
+        def load_array(name):
+            return np.load(path / name, mmap_mode=mmap_mode, allow_pickle=False)
+
+        next_states = None
+        if (path / TransitionMap.NEXT_STATES).exists():
+            next_states = load_array(TransitionMap.NEXT_STATES)
+        return TransitionMap(
+            next_state_ids=load_array(TransitionMap.NEXT_STATE_IDS),
+            next_states=next_states,
+            packed_failures=load_array(TransitionMap.FAILURES),
+            path=path
+        )
+
+    @staticmethod
+    def is_transition_map(path):
+        """
+        Whether a path is a directory where a transition map is stored
+        :param path: the path
+        :return: boolean
+        """
+        return (Path(path) / TransitionMap.NEXT_STATE_IDS).exists()
+
+    def write(self, start, stop, next_state_ids, next_states, failures):
+        """
+        Writes the transitions of the stateactions whose flat indexes are in [start, stop)
+        :param start: the first flat index
+        :param stop: the flat index after the last one
+        :param next_state_ids: np.ndarray<int> of shape (stop - start,). The flat indexes of the next states
+        :param next_states: np.ndarray of shape (stop - start, state_space.data_length). The next states. Ignored if
+            the map does not store the next states
+        :param failures: np.ndarray<bool> of shape (stop - start,). Whether the transitions fail
+        """
+        self.next_state_ids.reshape(-1)[start:stop] = next_state_ids
+        if self.next_states is not None:
+            self.next_states.reshape((-1, self.next_states.shape[-1]))[
+                start:stop
+            ] = next_states
+        # The bytes at the boundaries may be shared with other blocks, so they are unpacked and packed again
+        first_byte = start // 8
+        last_byte = -(-stop // 8)
+        bits = np.unpackbits(self.packed_failures[first_byte:last_byte])
+        bits[start - 8 * first_byte:stop - 8 * first_byte] = failures
+        self.packed_failures[first_byte:last_byte] = np.packbits(bits)
+
+    def flush(self):
+        """
+        Writes the changes to disk, if the map is stored on disk
+        """
+        for array in [self.next_state_ids, self.next_states,
+                      self.packed_failures]:
+            if isinstance(array, np.memmap):
+                array.flush()
@@ -1,4 +1,5 @@
 from .environments import Environment
 from .hovership import Hovership, DiscreteHovership
 from .slip import Slip
+from .vector_environment import VectorEnvironment
 # from .continuous_cartpole import ContinuousCartPole
\ No newline at end of file
@@ -75,6 +75,25 @@ class ContinuousCartPoleEnv(gym.Env):
         theta_dot = theta_dot + self.tau * thetaacc
         return (x, x_dot, theta, theta_dot)
 
+    def step_physics_batch(self, states, forces):
+        """
+        Vectorized version of stepPhysics
+        :param states: np.ndarray of shape (N, 4). The states
+        :param forces: np.ndarray of shape (N,). The forces applied to the carts
+        :return: np.ndarray of shape (N, 4). The next states
+        """
+        x, x_dot, theta, theta_dot = np.asarray(states, dtype=float).T
+        costheta = np.cos(theta)
+        sintheta = np.sin(theta)
+        temp = (forces + self.polemass_length * theta_dot * theta_dot * sintheta) / self.total_mass
+        thetaacc = (self.gravity * sintheta - costheta * temp) / \
+            (self.length * (4.0/3.0 - self.masspole * costheta * costheta / self.total_mass))
+        xacc = temp - self.polemass_length * thetaacc * costheta / self.total_mass
+        return np.stack((x + self.tau * x_dot,
+                         x_dot + self.tau * xacc,
+                         theta + self.tau * theta_dot,
+                         theta_dot + self.tau * thetaacc), axis=1)
+
     def step(self, action):
         assert self.action_space.contains(action), \
             "%r (%s) invalid" % (action, type(action))
@@ -161,6 +180,12 @@ Any further steps are undefined behavior.
             or theta < -self.theta_threshold_radians \
             or theta > self.theta_threshold_radians
 
+    def is_failure_state_batch(self, x, theta):
+        return (x < -self.x_threshold) \
+            | (x > self.x_threshold) \
+            | (theta < -self.theta_threshold_radians) \
+            | (theta > self.theta_threshold_radians)
+
     def close(self):
         if self.viewer:
             self.viewer.close()
@@ -199,6 +224,29 @@ class ContinuousCartPole(GymEnvironmentWrapper):
         self.reward_accumulator += reward
         return new_state, reward, failed
 
+    def transition_batch(self, states, actions):
+        states = self.state_space._as_batch(states)
+        forces = self.gym_env.force_mag * np.asarray(actions,
+                                                     dtype=float).reshape(-1)
+        n_substeps = 1 if self.control_frequency is None \
+            else self.control_frequency
+        # Like in `step`, a state stops moving once the gym environment is done
+        next_states = np.array(states, dtype=float)
+        running = np.ones(len(states), dtype=bool)
+        for _ in range(n_substeps):
+            next_states[running] = self.gym_env.step_physics_batch(
+                next_states[running], forces[running]
+            )
+            running &= np.logical_not(self.gym_env.is_failure_state_batch(
+                next_states[:, 0], next_states[:, 2]
+            ))
+            if not running.any():
+                break
+        next_states = self.state_space.closest_in_batch(next_states)
+        failures = self.gym_env.is_failure_state_batch(next_states[:, 0],
+                                                       next_states[:, 2])
+        return next_states, failures
+
     def linearization(self, discrete_time=True):
         # The full equations are taken from
         # https://coneural.org/florian/papers/05_cart_pole.pdf
@@ -6,6 +6,9 @@ class Environment:
     Relevant properties are:
     :param s: the current state of the environment
     :param has_failed: whether self.s is a failure state
+    :param trusted: whether the environment runs in trusted mode. In this mode, the dynamics do not check that the
+        states and actions are in the stateaction space, and whether the current state is a failure state is computed
+        once per step. The state should then only be changed through `reset` and `step`
     """
     def __init__(self, dynamics, reward, default_initial_state,
                  random_start=False, reward_done_threshold=None,
@@ -29,6 +32,8 @@ class Environment:
         self.reward_accumulator = 0
         self.steps_done_threshold = steps_done_threshold
         self.n_steps = 0
+        self._trusted = False
+        self._in_failure_state = None
         self.reset()
 
     @property
@@ -52,6 +57,16 @@ class Environment:
         """
         return self.stateaction_space.action_space
 
+    @property
+    def trusted(self):
+        return self._trusted
+
+    @trusted.setter
+    def trusted(self, trusted):
+        self._trusted = trusted
+        self._in_failure_state = None
+        self.dynamics.validate = not trusted
+
     @property
     def has_failed(self):
         """ Whether the state is feasible and the environment has not failed. In general, the state is always
@@ -70,10 +85,14 @@ class Environment:
 
     @property
     def in_failure_state(self):
-        """ Whether the current state is a failure state.
+        """ Whether the current state is a failure state. In trusted mode, this is only computed once per step.
         :return: boolean
         """
-        return self.is_failure_state(self.s)
+        if not self._trusted:
+            return self.is_failure_state(self.s)
+        if self._in_failure_state is None:
+            self._in_failure_state = self.is_failure_state(self.s)
+        return self._in_failure_state
 
     @property
     def done(self):
@@ -113,6 +132,7 @@ class Environment:
             self.s = self.stateaction_space.state_space.sample()
         else:
             self.s = self.default_initial_state
+        self._in_failure_state = None
         self.feasible = self.dynamics.is_feasible_state(self.s)
         self.reward_accumulator = 0
         self.n_steps = 0
@@ -130,6 +150,7 @@ class Environment:
         old_state = self.s
         if not self.has_failed:
             self.s, self.feasible = self.dynamics.step(old_state, action)
+            self._in_failure_state = None
 
         reward = self.reward.get_reward(old_state,
                                         action,
@@ -143,8 +164,32 @@ class Environment:
     def render(self):
         pass
 
-    def compute_dynamics_map(self):
-        return self.dynamics.compute_map()
+    def compute_dynamics_map(self, **kwargs):
+        """
+        Computes the dynamics map of the environment. The keyword arguments are passed to the dynamics' compute_map
+        method, and can be used for example to compute the map with several processes
+        (see DiscreteTimeDynamics.compute_map)
+        :return: the dynamics map
+        """
+        return self.dynamics.compute_map(**kwargs)
+
+    def compute_transition_map(self, **kwargs):
+        """
+        Computes the dynamics map of the environment with the exact next states and the failures. The keyword
+        arguments are passed to the dynamics' compute_transition_map method
+        :return: edge.dynamics.TransitionMap
+        """
+        return self.dynamics.compute_transition_map(**kwargs)
+
+    def compute_dynamics_map_block(self, stateactions):
+        """
+        Computes the dynamics map on a block of stateactions only (see DiscreteTimeDynamics.compute_map_block)
+        :param stateactions: np.ndarray of shape (N, stateaction_space.data_length). The stateactions
+        :return: np.ndarray<int> of shape (N,). The flat indexes of the next states in the state space
+        :return: np.ndarray of shape (N, state_space.data_length). The exact next states
+        :return: np.ndarray<bool> of shape (N,). Whether each transition fails
+        """
+        return self.dynamics.compute_map_block(stateactions)
 
     def linearization(self):
         """
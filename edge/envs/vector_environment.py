@@ -0,0 +1,158 @@
+import numpy as np
+
+from edge.dynamics import DiscreteTimeDynamics
+
+
+class VectorEnvironment:
+    """ Runs several copies of an Environment in lockstep
+    The copies share the dynamics and the reward of the wrapped environment, but each one has its own state, its own
+    failure and done flags, and its own reward accumulator and step counter. The states are stored in an array of shape
+    (n_envs, state_space.data_length), and the transitions of all the copies are computed at once with the `step_batch`
+    method of the dynamics, which is vectorized if the dynamics class provides it.
+    Environments whose failure depends on something else than the current state (e.g., Slip, where it is stored in the
+    dynamics) are not supported: the constructor raises a ValueError.
+    Relevant properties are:
+    :param s: np.ndarray of shape (n_envs, state_space.data_length): the current states
+    :param has_failed: np.ndarray<bool> of shape (n_envs,): whether each environment has failed
+    :param done: np.ndarray<bool> of shape (n_envs,): whether each environment is done
+    """
+    def __init__(self, env, n_envs, auto_reset=True):
+        """ Initializer
+        :param env: the Environment to copy. Its initial states, thresholds and failure states are used by all copies
+        :param n_envs: the number of copies
+        :param auto_reset: whether the copies that are done are reset automatically at the end of `step`
+        """
+        if VectorEnvironment._has_step_side_effects(env.dynamics):
+            raise ValueError('The dynamics of the environment have side effects when stepping, so they cannot be '
+                             'shared by several copies of the environment')
+        self.env = env
+        self.n_envs = n_envs
+        self.auto_reset = auto_reset
+        self.s = np.zeros((n_envs, self.state_space.data_length))
+        self.feasible = np.ones(n_envs, dtype=bool)
+        self.in_failure_state = np.zeros(n_envs, dtype=bool)
+        self.reward_accumulator = np.zeros(n_envs)
+        self.n_steps = np.zeros(n_envs, dtype=int)
+        # States reached at the last step, before the automatic resets
+        self.final_states = self.s.copy()
+        self.reset()
+
+    @staticmethod
+    def _has_step_side_effects(dynamics):
+        """ Whether stepping the dynamics changes their state, e.g., the failure flag of SlipDynamics
+        :param dynamics: the dynamics
+        :return: boolean
+        """
+        if hasattr(dynamics, 'failed'):
+            return True
+        return isinstance(dynamics, DiscreteTimeDynamics) and \
+            type(dynamics).get_step_side_effects is not \
+            DiscreteTimeDynamics.get_step_side_effects
+
+    @property
+    def dynamics(self):
+        return self.env.dynamics
+
+    @property
+    def stateaction_space(self):
+        return self.env.stateaction_space
+
+    @property
+    def state_space(self):
+        return self.env.state_space
+
+    @property
+    def action_space(self):
+        return self.env.action_space
+
+    @property
+    def has_failed(self):
+        """ Whether each environment has failed. See Environment.has_failed
+        :return: np.ndarray<bool> of shape (n_envs,)
+        """
+        return np.logical_not(self.feasible) | self.in_failure_state
+
+    @property
+    def done(self):
+        """ Whether each environment is done. See Environment.done
+        :return: np.ndarray<bool> of shape (n_envs,)
+        """
+        done = self.in_failure_state.copy()
+        if self.env.reward_done_threshold is not None:
+            done |= self.reward_accumulator >= self.env.reward_done_threshold
+        if self.env.steps_done_threshold is not None:
+            done |= self.n_steps >= self.env.steps_done_threshold
+        return done
+
+    def is_failure_state_batch(self, states):
+        """ Whether each state is a failure state
+        :param states: np.ndarray of shape (N, state_space.data_length)
+        :return: np.ndarray<bool> of shape (N,)
+        """
+        return np.array([self.env.is_failure_state(state) for state in states],
+                        dtype=bool)
+
+    def reset(self, mask=None, s=None):
+        """ Resets the states of some of the environments
+        If s is specified, the states are reset to these values. If not, and env.random_start = True, then the states
+        are sampled randomly in the state space. Otherwise, they take the default value of the wrapped environment.
+        :param mask: optional: np.ndarray<bool> of shape (n_envs,): which environments are reset. Defaults to all
+        :param s: optional: np.ndarray of shape (mask.sum(), state_space.data_length): the new states
+        :return: the states of all the environments (after reinitialization)
+        """
+        if mask is None:
+            mask = np.ones(self.n_envs, dtype=bool)
+        n_reset = int(np.sum(mask))
+        if n_reset == 0:
+            return self.s.copy()
+        if s is not None:
+            new_states = self.state_space._as_batch(s)
+        elif self.env.random_start:
+            new_states = self.state_space.sample(n_reset)
+        else:
+            new_states = np.tile(self.env.default_initial_state, (n_reset, 1))
+        self.s[mask] = new_states
+        self.feasible[mask] = [self.dynamics.is_feasible_state(state)
+                               for state in new_states]
+        self.in_failure_state[mask] = self.is_failure_state_batch(new_states)
+        self.reward_accumulator[mask] = 0
+        self.n_steps[mask] = 0
+        return self.s.copy()
+
+    def step(self, actions):
+        """ Takes a step in all the environments. The environments that have failed do not move, like in
+        Environment.step. If auto_reset is True, the environments that are done after this step are reset, and the
+        states they reached are stored in `final_states`.
+        :param actions: np.ndarray of shape (n_envs, action_space.data_length): the actions taken
+        :return: s: np.ndarray of shape (n_envs, state_space.data_length): the new states
+        :return: rewards: np.ndarray of shape (n_envs,): the rewards sampled
+        :return: has_failed: np.ndarray<bool> of shape (n_envs,): whether each environment has failed
+        :return: done: np.ndarray<bool> of shape (n_envs,): whether each environment is done
+        """
+        actions = self.action_space._as_batch(actions)
+        old_states = self.s.copy()
+        moving = np.logical_not(self.has_failed)
+        if moving.any():
+            new_states, feasible = self.dynamics.step_batch(
+                self.s[moving], actions[moving]
+            )
+            self.s[moving] = new_states
+            self.feasible[moving] = feasible
+            self.in_failure_state[moving] = self.is_failure_state_batch(
+                new_states
+            )
+
+        has_failed = self.has_failed
+        rewards = np.array([
+            self.env.reward.get_reward(old_state, action, new_state, failed)
+            for old_state, action, new_state, failed
+            in zip(old_states, actions, self.s, has_failed)
+        ], dtype=float)
+        self.reward_accumulator += rewards
+        self.n_steps += 1
+        done = self.done
+
+        self.final_states = self.s.copy()
+        if self.auto_reset:
+            self.reset(mask=done)
+        return self.s.copy(), rewards, has_failed, done
@@ -1,7 +1,11 @@
+import copy
 import gym.spaces as gspaces
+import numpy as np
 
+from edge.dynamics import TransitionMap
 from edge.envs.environments import Environment
 from edge.space import StateActionSpace
+from edge.utils.map_computation import compute_map_by_shards
 from . import BoxWrapper, DiscreteWrapper
 
 
@@ -18,6 +22,12 @@ def get_index_length(gym_box):
 
 
 class GymEnvironmentWrapper(Environment):
+    # Number of stateactions processed at once when computing the dynamics map
+    MAP_BLOCK_SIZE = 4096
+    # Scalar attributes of gym environments that change during an episode, and are not parameters of the dynamics
+    EPISODE_ATTRIBUTES = ('steps_beyond_done', 'steps_beyond_terminated',
+                          'last_u', 'render_mode')
+
     def __init__(self, gym_env, shape=None, failure_critical=False,
                  control_frequency=None):
         self.gym_env = gym_env
@@ -53,6 +63,10 @@ class GymEnvironmentWrapper(Environment):
 
         self.info = {}
         self._done = False
+        # Copy of the environment stepped by `transition_batch`, created at its first call, and the parameters of the
+        # environment when it was copied
+        self._transition_env = None
+        self._transition_env_parameters = None
         self.failure_critical = failure_critical
         self.control_frequency = control_frequency
 
@@ -125,33 +139,143 @@ class GymEnvironmentWrapper(Environment):
     def render(self):
         self.gym_env.render()
 
-    def compute_dynamics_map(self):
-        # General note: Q_map stores the index of the next state. This
-        # approximates the dynamics by projecting the state we end up in, and
-        # may lead to errors. A more precise implementation would keep the
-        # exact value of the next state instead of its index. So far, this
-        # method is only used for the computation of the viability sets, and
-        # this requires the index of the next state: implementing the more
-        # precise method is useless for this.
-        # However, the following implementation may need to change if this
-        # method is used for something else.
-
-        import numpy as np
-        unwrapped_gym_env = self.gym_env.unwrapped
-        Q_map = np.zeros(self.stateaction_space.shape, dtype=tuple)
-        for sa_index, stateaction in iter(self.stateaction_space):
-            state, action = self.stateaction_space.get_tuple(stateaction)
-            state = self.state_space.to_gym(state)
-            action = self.action_space.to_gym(action)
-            unwrapped_gym_env.state = state
-            next_state, reward, failed = self.step(action)
-            next_state = self.state_space.from_gym(next_state)
+    @property
+    def map_parameters(self):
+        """
+        The parameters the dynamics map depends on, used to check that saved shards of the map can be reused. The
+        physics parameters of the gym environment are its scalar attributes, such as the gravity or the time step of
+        the cart-pole. Subclasses wrapping environments whose dynamics depend on other attributes should redefine this
+        property
+        :return: dictionary of parameters
+        """
+        unwrapped = self.gym_env.unwrapped
+        spec = getattr(self.gym_env, 'spec', None)
+        physics = {
+            name: value for name, value in sorted(vars(unwrapped).items())
+            if isinstance(value, (bool, int, float, str, np.number))
+            and not name.startswith('_')
+            and name not in GymEnvironmentWrapper.EPISODE_ATTRIBUTES
+        }
+        return {
+            'environment': type(self).__name__,
+            'gym_environment': spec.id if spec is not None
+            else type(unwrapped).__name__,
+            'control_frequency': self.control_frequency,
+            'failure_critical': self.failure_critical,
+            'physics': physics,
+        }
+
+    def _get_transition_env(self):
+        """
+        Returns the copy of the environment stepped by `transition_batch`, so the live environment is not modified.
+        The copy is made again only if the parameters of the environment changed since it was made
+        :return: GymEnvironmentWrapper
+        """
+        parameters = self.map_parameters
+        if self._transition_env is None or \
+                parameters != self._transition_env_parameters:
+            self._transition_env = None
+            self._transition_env = copy.deepcopy(self)
+            self._transition_env_parameters = parameters
+        return self._transition_env
+
+    def transition_batch(self, states, actions):
+        """
+        Computes the transitions of a batch of states and actions, with the same substeps and failure checks as
+        `step`. The state of the environment is not modified. Subclasses can redefine this method with a vectorized
+        implementation: this one steps a copy of the environment, whose state is reset before each pair
+        :param states: np.ndarray of shape (N, state_space.data_length). The states
+        :param actions: np.ndarray of shape (N, action_space.data_length). The actions
+        :return: np.ndarray of shape (N, state_space.data_length). The next states, projected in the state space
+        :return: np.ndarray<bool> of shape (N,). Whether each transition fails
+        """
+        env = self._get_transition_env()
+        unwrapped_gym_env = env.gym_env.unwrapped
+        next_states = np.zeros((len(states), self.state_space.data_length))
+        failures = np.zeros(len(states), dtype=bool)
+        for n, (state, action) in enumerate(zip(states, actions)):
+            # The state is set directly, so the transition does not depend on the previous ones
+            unwrapped_gym_env.state = env.state_space.to_gym(state)
+            env.s = state
+            env._done = False
+            env.info = {}
+            env.reward_accumulator = 0
+            if hasattr(unwrapped_gym_env, 'steps_beyond_done'):
+                # Classic control environments warn when they are stepped after failing
+                unwrapped_gym_env.steps_beyond_done = None
+            next_state, reward, failures[n] = env.step(action)
             # Gym does not ensure the stability of the stateaction space under
             # the dynamics, so we enforce it.
             # This may lead to edge effects.
-            next_state = self.state_space.closest_in(next_state)
-            next_state_index = self.state_space.get_index_of(
-                next_state, around_ok=True
+            next_states[n] = self.state_space.closest_in(
+                self.state_space.from_gym(next_state)
             )
-            Q_map[sa_index] = next_state_index
-        return Q_map
\ No newline at end of file
+        return next_states, failures
+
+    def compute_dynamics_map_block(self, stateactions):
+        """
+        Computes the dynamics map on a block of stateactions with `transition_batch`
+        :param stateactions: np.ndarray of shape (N, stateaction_space.data_length). The stateactions
+        :return: np.ndarray<int> of shape (N,). The flat indexes of the next states in the state space
+        :return: np.ndarray of shape (N, state_space.data_length). The next states, before their projection on the grid
+        :return: np.ndarray<bool> of shape (N,). Whether each transition fails
+        """
+        states, actions = self.stateaction_space.get_tuple_batch(stateactions)
+        next_states, failures = self.transition_batch(states, actions)
+        next_state_ids = self.state_space.flat_index_of(next_states,
+                                                        around_ok=True)
+        return next_state_ids, next_states, failures
+
+    def compute_transition_map(self, path=None, store_next_states=True,
+                               block_size=None, n_workers=None,
+                               shard_directory=None, shard_size=None):
+        """
+        Computes the dynamics map with the flat indexes of the next states, the exact next states and the failures.
+        The computation can be split in shards computed by several processes and saved on disk, so an interrupted
+        computation can be resumed (see edge.utils.compute_map_by_shards)
+        :param path: the directory where the map is written (see TransitionMap). If None, the map is kept in memory
+        :param store_next_states: whether the map stores the exact next states
+        :param block_size: the number of stateactions processed at once
+        :param n_workers: the number of worker processes. If None, the map is computed in the current process
+        :param shard_directory: the directory where the shards are saved. If None, the shards are not saved
+        :param shard_size: the number of stateactions in one shard
+        :return: edge.dynamics.TransitionMap
+        """
+        if block_size is None:
+            block_size = self.MAP_BLOCK_SIZE
+        transition_map = TransitionMap.empty(
+            self.stateaction_space, path=path,
+            store_next_states=store_next_states
+        )
+        # transition_batch leaves the state of the environment untouched, and each worker process has its own copy of
+        # the environment
+        return compute_map_by_shards(
+            self.compute_dynamics_map_block, self.stateaction_space,
+            block_size, transition_map, n_workers=n_workers,
+            shard_directory=shard_directory, shard_size=shard_size,
+            parameters=self.map_parameters
+        )
+
+    def compute_dynamics_map(self, block_size=None, n_workers=None,
+                             shard_directory=None, shard_size=None):
+        """
+        Computes the dynamics map. See compute_transition_map for the parameters
+        :param block_size: the number of stateactions processed at once
+        :param n_workers: the number of worker processes. If None, the map is computed in the current process
+        :param shard_directory: the directory where the shards are saved. If None, the shards are not saved
+        :param shard_size: the number of stateactions in one shard
+        :return: np.ndarray. The dynamics map, storing the flat indexes of the next states
+        """
+        # General note: Q_map stores the index of the next state. This
+        # approximates the dynamics by projecting the state we end up in, and
+        # may lead to errors. The exact next states are available with
+        # compute_transition_map. So far, this method is only used for the
+        # computation of the viability sets, and this requires the index of
+        # the next state.
+        # The map stores the flat indexes of the next states, which are plain integers even though the state space is
+        # multidimensional
+        return self.compute_transition_map(
+            store_next_states=False, block_size=block_size,
+            n_workers=n_workers, shard_directory=shard_directory,
+            shard_size=shard_size
+        ).next_state_ids
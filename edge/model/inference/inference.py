@@ -6,13 +6,104 @@ from edge.utils import atleast_2d, dynamically_import
 from .tensorwrap import tensorwrap
 
 
+def _cholesky_update(cholesky, vector, start=0):
+    """
+    Rank-one update of the trailing block of a Cholesky factor, in place: cholesky[start:, start:] becomes the factor
+    of L L^T + v v^T, where L is the trailing block, in O(n^2) operations.
+    The factor of I + w w^T, with w = L^-1 v, is semi-separable and has a closed form (Gill et al., 1974), so the
+    update is vectorized instead of looping over the columns
+    :param cholesky: torch.Tensor of shape (n, n): the lower-triangular factor. It is modified in place
+    :param vector: torch.Tensor of shape (n - start,): the vector v
+    :param start: the first row and column of the trailing block
+    """
+    # Solving with the whole factor and a right-hand side that is zero on the first rows gives L^-1 v, without copying
+    # the trailing block to make it contiguous
+    rhs = vector.new_zeros((cholesky.shape[0], 1))
+    rhs[start:, 0] = vector
+    w = torch.linalg.solve_triangular(cholesky, rhs, upper=False)[start:, 0]
+    t = 1 + torch.cumsum(w ** 2, dim=0)
+    t_previous = torch.cat((t.new_ones(1), t[:-1]))
+    diagonal = torch.sqrt(t / t_previous)
+    below_diagonal = w / torch.sqrt(t * t_previous)
+
+    block = cholesky[start:, start:]
+    # tail_sums[:, j] is the sum of block[:, i] * w[i] over i > j
+    tail_sums = torch.cumsum(block * w, dim=1)
+    row_sums = tail_sums[:, -1:].clone()
+    tail_sums.neg_().add_(row_sums)
+    block.mul_(diagonal).addcmul_(tail_sums, below_diagonal)
+
+
+def _cholesky_remove(cholesky, keeping_filter):
+    """
+    Removes points from a Cholesky factor in O(n^2 k) operations, where k is the number of points removed. The rows
+    before the first removed point are unchanged, and the trailing block is obtained by k rank-one updates
+    :param cholesky: torch.Tensor of shape (n, n): the factor L
+    :param keeping_filter: torch.Tensor<bool> of shape (n,): which points are kept
+    :return: torch.Tensor of shape (m, m): the factor of the covariance of the m points kept
+    """
+    removed = torch.nonzero(~keeping_filter).reshape(-1)
+    if removed.numel() == 0:
+        return cholesky
+    first = int(removed[0])
+    kept = torch.nonzero(keeping_filter).reshape(-1)
+    # Removing rows and the corresponding columns of a lower-triangular matrix leaves it lower-triangular
+    if first == 0 and removed.numel() == int(removed[-1]) + 1:
+        # Forgetting the oldest points, as TimeForgettingDataset does, only needs a slice
+        n_removed = removed.numel()
+        reduced = cholesky[n_removed:, n_removed:].contiguous()
+        removed_columns = cholesky[n_removed:, :n_removed]
+    else:
+        reduced = cholesky[kept.unsqueeze(-1), kept]
+        removed_columns = cholesky[kept[first:].unsqueeze(-1), removed]
+    for column in removed_columns.T:
+        _cholesky_update(reduced, column, start=first)
+    return reduced
+
+
+def _cholesky_append(cholesky, cross_covariance, covariance):
+    """
+    Extends a Cholesky factor with new points in O(n^2 k) operations
+    :param cholesky: torch.Tensor of shape (n, n): the factor L of the covariance of the current points
+    :param cross_covariance: torch.Tensor of shape (n, k): the covariance between the current and the new points
+    :param covariance: torch.Tensor of shape (k, k): the covariance of the new points
+    :return: torch.Tensor of shape (n + k, n + k): the factor of the covariance of all the points
+    """
+    lower_left = torch.linalg.solve_triangular(cholesky, cross_covariance,
+                                               upper=False).T
+    lower_right = torch.linalg.cholesky(
+        covariance - lower_left @ lower_left.T
+    )
+    n, k = cross_covariance.shape
+    extended = cholesky.new_zeros((n + k, n + k))
+    extended[:n, :n] = cholesky
+    extended[n:, :n] = lower_left
+    extended[n:, n:] = lower_right
+    return extended
+
+
+class Prediction:
+    """
+    Marginal predictions of a GP, computed without GPyTorch. Exposes the same `mean`, `variance` and `stddev`
+    attributes as the gpytorch.distributions.MultivariateNormal returned by GP.predict
+    """
+    def __init__(self, mean, variance):
+        self.mean = mean
+        self.variance = variance
+
+    @property
+    def stddev(self):
+        return self.variance.sqrt()
+
+
 class GP(gpytorch.models.ExactGP):
     """
     Base class for Gaussian Processes. Provides a wrapping around GPyTorch to encapsulate it from the rest of the code.
     """
     @tensorwrap('train_x', 'train_y')
     def __init__(self, train_x, train_y, mean_module, covar_module,
-                 likelihood, dataset_type=None, dataset_params=None):
+                 likelihood, dataset_type=None, dataset_params=None,
+                 incremental_cholesky=False):
         """
         Initializer
         :param train_x: np.ndarray: training input data. Should be 2D, and interpreted as a list of points.
@@ -26,6 +117,10 @@ class GP(gpytorch.models.ExactGP):
             * anything else: use a standard Dataset
         :param dataset_params: dictionary or None. The entries are passed as keyword arguments to the constructor of
             the chosen dataset.
+        :param incremental_cholesky: whether the GP keeps the Cholesky factor of its covariance matrix and updates it
+            when data is appended or forgotten, instead of letting GPyTorch factorize it again after each change of the
+            dataset. The predictions are then exact, computed in float64, and only for a Gaussian likelihood with
+            homoscedastic noise
         """
         # The @tensorwrap decorator automatically transforms train_x and train_y into torch.Tensors.
         # Hence, we only deal with tensors inside the methods
@@ -48,6 +143,13 @@ class GP(gpytorch.models.ExactGP):
         self.optimizer = torch.optim.Adam
         self.mll = gpytorch.mlls.ExactMarginalLogLikelihood
 
+        # Incremented whenever the hyperparameters are changed by initialize or optimize_hyperparameters
+        self.hyperparameters_version = 0
+
+        self.incremental_cholesky = incremental_cholesky
+        # Cholesky factor of the covariance of the dataset, with the hyperparameters it was computed with
+        self._factorization = None
+
     @property
     def train_x(self):
         return self.dataset.train_x
@@ -55,6 +157,7 @@ class GP(gpytorch.models.ExactGP):
     @train_x.setter
     def train_x(self, new_train_x):
         self.dataset.train_x = new_train_x
+        self._factorization = None
 
     @property
     def train_y(self):
@@ -63,6 +166,14 @@ class GP(gpytorch.models.ExactGP):
     @train_y.setter
     def train_y(self, new_train_y):
         self.dataset.train_y = new_train_y
+        self._factorization = None
+
+    @property
+    def data_version(self):
+        """
+        Counter incremented whenever the dataset changes, so cached predictions can be invalidated
+        """
+        return self.dataset.version
 
     @property
     def structure_dict(self):
@@ -100,6 +211,15 @@ class GP(gpytorch.models.ExactGP):
         covar = self.covar_module(x)
         return gpytorch.distributions.MultivariateNormal(mean, covar)
 
+    def initialize(self, **kwargs):
+        """
+        Sets the values of the hyperparameters. See GPyTorch documentation for more information
+        :param kwargs: the names of the hyperparameters and their values
+        :return: self
+        """
+        self.hyperparameters_version += 1
+        return super(GP, self).initialize(**kwargs)
+
     def optimize_hyperparameters(self, epochs, **optimizer_kwargs):
         """
         Optimizes the hyperparameters of the GP on its current dataset. This function can be run several times with
@@ -108,6 +228,7 @@ class GP(gpytorch.models.ExactGP):
         :param epochs: the number of epochs
         :param optimizer_kwargs: the parameters passed to the optimizer. See GPyTorch documentation for more information
         """
+        self.hyperparameters_version += 1
         self.train()
         self.likelihood.train()
 
@@ -129,6 +250,10 @@ class GP(gpytorch.models.ExactGP):
         self.eval()
         self.likelihood.eval()
 
+        if self.incremental_cholesky:
+            with torch.no_grad():
+                return self._predict_from_factorization(x, gp_only)
+
         # This `with` clause is taken from the GPyTorch tutorials. I don't know whether they truly improve performance
         with torch.no_grad(), gpytorch.settings.fast_pred_var():
             if gp_only:
@@ -136,6 +261,100 @@ class GP(gpytorch.models.ExactGP):
             else:
                 return self.likelihood(self(x))
 
+    def _hyperparameters(self):
+        return [p.detach().clone() for p in self.parameters()]
+
+    def _covariance(self, x1, x2):
+        return self.covar_module.forward(x1, x2).double()
+
+    def _noise_covariance(self, n):
+        noise = self.likelihood.noise.detach().double().reshape(-1)[0]
+        return noise * torch.eye(n, dtype=torch.float64)
+
+    def _factorization_is_valid(self):
+        """
+        Whether the Cholesky factor is up to date, that is, it exists and the hyperparameters did not change since it
+        was computed
+        :return: boolean
+        """
+        return self._factorization is not None and all(
+            torch.equal(old, new) for old, new in
+            zip(self._factorization['hyperparameters'], self._hyperparameters())
+        )
+
+    def _get_factorization(self):
+        """
+        Returns the Cholesky factor L of the covariance matrix K of the dataset and the whitened vector
+        alpha = L^-1 (y - m). The covariance matrix is only factorized again if the dataset was replaced or if the
+        hyperparameters changed
+        :return: dict with keys 'cholesky', 'alpha' and 'hyperparameters'
+        """
+        if self._factorization_is_valid():
+            return self._factorization
+
+        train_x = self.train_x
+        covariance = self._covariance(train_x, train_x) + \
+            self._noise_covariance(train_x.shape[0])
+        self._factorization = {
+            'cholesky': torch.linalg.cholesky(covariance),
+            'hyperparameters': self._hyperparameters(),
+        }
+        self._update_alpha()
+        return self._factorization
+
+    def _update_alpha(self):
+        # The predictive mean is k(x, X) K^-1 (y - m) = (L^-1 k(X, x))^T L^-1 (y - m), and L^-1 k(X, x) is needed for
+        # the variance anyway: storing alpha in the whitened form L^-1 (y - m) saves a triangular solve per update
+        residuals = self.train_y.reshape(-1).double() - \
+            self.mean_module(self.train_x).double()
+        self._factorization['alpha'] = torch.linalg.solve_triangular(
+            self._factorization['cholesky'], residuals.unsqueeze(-1),
+            upper=False
+        ).squeeze(-1)
+
+    def _update_factorization(self, old_train_x, append_x, kept):
+        """
+        Updates the Cholesky factor after the dataset appended new points and possibly forgot some of them, in
+        O(n^2 k) operations where k is the number of points added or removed
+        :param old_train_x: torch.Tensor: the dataset before the points were appended
+        :param append_x: torch.Tensor: the points appended
+        :param kept: torch.Tensor<int>: indexes of the points in the new dataset, in the concatenation of
+            old_train_x and append_x
+        """
+        n_old = old_train_x.shape[0]
+        cholesky = self._factorization['cholesky']
+
+        keeping_filter = torch.zeros(n_old, dtype=bool)
+        keeping_filter[kept[kept < n_old]] = True
+        cholesky = _cholesky_remove(cholesky, keeping_filter)
+
+        new_x = append_x[kept[kept >= n_old] - n_old]
+        if new_x.shape[0] > 0:
+            cross_covariance = self._covariance(old_train_x[keeping_filter],
+                                                new_x)
+            covariance = self._covariance(new_x, new_x) + \
+                self._noise_covariance(new_x.shape[0])
+            cholesky = _cholesky_append(cholesky, cross_covariance, covariance)
+
+        self._factorization['cholesky'] = cholesky
+        self._update_alpha()
+
+    def _predict_from_factorization(self, x, gp_only):
+        x = atleast_2d(x)
+        factorization = self._get_factorization()
+        v = torch.linalg.solve_triangular(
+            factorization['cholesky'],
+            self._covariance(self.train_x, x),
+            upper=False
+        )
+        mean = self.mean_module(x).double() + v.T @ factorization['alpha']
+        prior_variance = self.covar_module.forward(x, x, diag=True).double()
+        variance = (prior_variance - (v ** 2).sum(dim=0)).clamp_min(0)
+        if not gp_only:
+            variance = variance + self._noise_covariance(1)[0, 0]
+        dtype = self.train_x.dtype
+        return Prediction(mean.to(dtype), variance.to(dtype))
+
     def _set_gp_data_to_dataset(self):
         self.set_train_data(
             inputs=self.train_x,
@@ -180,7 +399,18 @@ class GP(gpytorch.models.ExactGP):
         """
         # GPyTorch provides an additional, more efficient way of adding data with the ExactGP.get_fantasy_model method,
         # but it seems to require that the model is called at least once before it can be used
-        self.dataset.append(atleast_2d(x), y, **kwargs)
+        old_train_x = self.train_x
+        kept = self.dataset.append(atleast_2d(x), y, **kwargs)
+        if self.incremental_cholesky and self._factorization_is_valid():
+            try:
+                with torch.no_grad():
+                    self._update_factorization(old_train_x, atleast_2d(x),
+                                               kept)
+            except RuntimeError:
+                # The update failed numerically: the covariance is factorized again at the next prediction
+                self._factorization = None
+        else:
+            self._factorization = None
         self._set_gp_data_to_dataset()
         return self
 
@@ -247,6 +477,8 @@ class Dataset:
     def __init__(self, train_x, train_y):
         self._train_x = train_x
         self._train_y = train_y
+        # Incremented by the setters, so that subclasses redefining them should do the same
+        self.version = 0
 
     @property
     def train_x(self):
@@ -255,6 +487,7 @@ class Dataset:
     @train_x.setter
     def train_x(self, new_train_x):
         self._train_x = new_train_x
+        self.version += 1
 
     @property
     def train_y(self):
@@ -263,10 +496,20 @@ class Dataset:
     @train_y.setter
     def train_y(self, new_train_y):
         self._train_y = new_train_y
+        self.version += 1
 
     def append(self, append_x, append_y, **kwargs):
+        """
+        Appends points to the dataset. Subclasses may forget some points in the process
+        :param append_x: torch.Tensor, the additional input data
+        :param append_y: torch.Tensor, the additional output data
+        :return: torch.Tensor<int>: the indexes of the points of the new dataset, in the concatenation of the old
+            dataset and the appended points
+        """
+        n_points = self.train_x.shape[0] + atleast_2d(append_x).shape[0]
         self.train_x = torch.cat((self.train_x, atleast_2d(append_x)), dim=0)
         self.train_y = torch.cat((self.train_y, append_y), dim=0)
+        return torch.arange(n_points)
 
 
 class TimeForgettingDataset(Dataset):
@@ -292,10 +535,17 @@ class TimeForgettingDataset(Dataset):
     @Dataset.train_x.setter
     def train_x(self, new_train_x):
         self._train_x = new_train_x[-self.keep:]
+        self.version += 1
 
     @Dataset.train_y.setter
     def train_y(self, new_train_y):
         self._train_y = new_train_y[-self.keep:]
+        self.version += 1
+
+    def append(self, append_x, append_y, **kwargs):
+        kept = super(TimeForgettingDataset, self).append(append_x, append_y,
+                                                         **kwargs)
+        return kept[-self.keep:]
 
 
 class NeighborErasingDataset(Dataset):
@@ -360,6 +610,11 @@ class NeighborErasingDataset(Dataset):
 
         self._kdtree = self._create_kdtree()
 
+        return torch.cat((
+            torch.nonzero(keeping_filter).reshape(-1),
+            keeping_filter.shape[0] + torch.arange(append_x.shape[0])
+        ))
+
     def _create_kdtree(self):
         kdtree = KDTree(self.train_x.numpy(), leaf_size=40)  # This is expensive
         return kdtree
\ No newline at end of file
@@ -16,7 +16,8 @@ class MaternGP(GP):
                  lengthscale_prior=None, lengthscale_constraint=None,
                  outputscale_prior=None, outputscale_constraint=None,
                  hyperparameters_initialization=None,
-                 dataset_type=None, dataset_params=None):
+                 dataset_type=None, dataset_params=None,
+                 incremental_cholesky=False):
         """
         Initializer
         :param train_x: training input data. Should be 2D, and interpreted as a list of points.
@@ -40,6 +41,8 @@ class MaternGP(GP):
         :param dataset_type: If 'timeforgetting', use a TimeForgettingDataset. Otherwise, a default Dataset is used
         :param dataset_params: dictionary or None. The entries are passed as keyword arguments to the constructor of
             the chosen dataset.
+        :param incremental_cholesky: whether the Cholesky factor of the covariance matrix is updated when data is
+            appended or forgotten, instead of being recomputed from scratch (see GP)
         """
         train_x = atleast_2d(train_x)
 
@@ -53,6 +56,7 @@ class MaternGP(GP):
             'outputscale_constraint': outputscale_constraint,
             'dataset_type': dataset_type,
             'dataset_params': dataset_params,
+            'incremental_cholesky': incremental_cholesky,
         }
 
         # Using a ConstantMean here performs much worse than a ZeroMean
@@ -98,7 +102,8 @@ class MaternGP(GP):
         )
 
         super(MaternGP, self).__init__(train_x, train_y, mean_module,
-                                       covar_module, likelihood, dataset_type, dataset_params)
+                                       covar_module, likelihood, dataset_type, dataset_params,
+                                       incremental_cholesky)
 
         initialization = {}
         if noise_prior is not None:
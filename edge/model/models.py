@@ -1,5 +1,6 @@
 import numpy as np
 import json
+from collections import OrderedDict
 from pathlib import Path
 
 
@@ -67,13 +68,8 @@ class DiscreteModel(Model):
         stateactions = self.space[index].reshape(
             (-1, self.space.data_length)
         )
-        if stateactions.ndim == 1:
-            stateactions = np.atleast_2d(stateactions).tolist()
-        index = np.array(list(map(
-            self.space.get_index_of,
-            stateactions
-        )))
-        # `index` is now a list of n indexes, each of length d (index.shape = (n,d))
+        index = self.space.get_index_of_batch(stateactions)
+        # `index` is now an array of n indexes, each of length d (index.shape = (n,d))
         # We need d lists of n points to index on a np.ndarray (or use the `np.take` method)
         # This is achieved by taking the transpose of index
         return tuple(index.T)
@@ -82,11 +78,12 @@ class DiscreteModel(Model):
 class ContinuousModel(Model):
     def _get_query_from_index(self, index):
         """
-        Transforms a StateActionSpace index into a list of stateactions.
+        Transforms a StateActionSpace index into a list of stateactions. The grid is queried in grid-view mode, so
+        querying the same grid repeatedly does not allocate it again: the output is read-only.
         :param index: tuple: the index
         :return: np.ndarray of stateactions
         """
-        return self.space[index].reshape(
+        return self.space.get_grid_view(index).reshape(
             (-1, self.space.data_length)
         )
 
@@ -94,16 +91,109 @@ class ContinuousModel(Model):
 class GPModel(ContinuousModel):
     GP_SAVE_NAME = 'gp.pth'  # name of file containing the GP when saving
     SAVE_NAME = 'model.json'  # name of file containing the Model's metadata when saving
+    PREDICTION_CACHE_SIZE = 2 ** 20  # maximal number of points whose predictions are cached
 
     def __init__(self, space, gp):
         """
         Initializer
+        The predictions of the GP are cached, so querying the model repeatedly with the same index does not call the
+        GP again as long as its dataset and its hyperparameters do not change. The cache is keyed by the index and by
+        the versions of the dataset and of the hyperparameters of the GP, which are bumped by append_data, set_data,
+        initialize and optimize_hyperparameters: hyperparameters modified in another way are not detected, so call
+        clear_prediction_cache in that case. The cache is a LRU cache holding the predictions of at most
+        `prediction_cache_size` points: set it to 0 to disable caching. Since updating the model appends data to the
+        GP, a query made right after an update is never served from the cache.
         :param space: the space the model lives in
         :param gp: the GP model, an instance of a subclass of edge.model.inference.GP. Should be initialized by
             a subclass
         """
         super(GPModel, self).__init__(space)
         self.gp = gp
+        self.prediction_cache_size = GPModel.PREDICTION_CACHE_SIZE
+        self.prediction_cache_hits = 0
+        self.prediction_cache_misses = 0
+        self._prediction_cache = OrderedDict()
+        self._prediction_cache_n_points = 0
+        self._prediction_cache_version = None
+
+    def clear_prediction_cache(self):
+        """
+        Empties the cache of predictions. The hit and miss counters are not reset
+        """
+        self._prediction_cache.clear()
+        self._prediction_cache_n_points = 0
+
+    def _get_prediction_cache_version(self):
+        """
+        Identifies the state of the GP: the predictions cached with another version are outdated
+        :return: tuple
+        """
+        return self.gp, self.gp.data_version, self.gp.hyperparameters_version
+
+    def _get_prediction_cache_key(self, index):
+        """
+        Computes a hashable key identifying the stateactions described by the index. Like the keys of the grid-view
+        mode of the space, it is computed from the index itself and not from the queried stateactions, so its cost does
+        not depend on the size of the query. Besides integers and slices, values given as 1D np.ndarrays (e.g., the
+        current state of an agent) are supported. Other indexes are not cached
+        :param index: the index
+        :return: tuple or None: the key, or None if the query should not be cached
+        """
+        if isinstance(index, tuple) and len(index) == 2:
+            index = self.space.get_stateaction(*index)
+        if not isinstance(index, tuple):
+            index = tuple([index])
+        key = []
+        for index_ns in index:
+            if isinstance(index_ns, slice):
+                key.append(('slice', index_ns.start, index_ns.stop,
+                            index_ns.step))
+            elif isinstance(index_ns, (int, np.integer)):
+                key.append(('index', int(index_ns)))
+            elif isinstance(index_ns, np.ndarray) and index_ns.ndim <= 1:
+                key.append(('element', index_ns.dtype.str, index_ns.shape,
+                            index_ns.tobytes()))
+            else:
+                return None
+        return tuple(key)
+
+    def query(self, index, return_covar=False):
+        """
+        Queries the model on the passed index. The predictions are cached: see __init__
+        :param index: the index the model was called with. Should be the same format as a StateActionSpace index.
+        :param return_covar: boolean: whether the covariance should be returned as well
+        :return: the mean value of the GP at the queried stateactions, and if return_covar=True, the covariance at these
+            stateactions
+        """
+        key = None
+        if self.prediction_cache_size > 0:
+            key = self._get_prediction_cache_key(index)
+        if key is None:
+            return self._query(self._get_query_from_index(index),
+                               return_covar=return_covar)
+
+        version = self._get_prediction_cache_version()
+        if version != self._prediction_cache_version:
+            self.clear_prediction_cache()
+            self._prediction_cache_version = version
+
+        mean, variance = self._prediction_cache.get(key, (None, None))
+        if mean is not None and (variance is not None or not return_covar):
+            self.prediction_cache_hits += 1
+            self._prediction_cache.move_to_end(key)
+        else:
+            self.prediction_cache_misses += 1
+            # The variance is only computed when it is needed, since GPyTorch computes it lazily
+            output = self._query(self._get_query_from_index(index),
+                                 return_covar=return_covar)
+            mean, variance = output if return_covar else (output, None)
+            self._cache_prediction(key, mean, variance)
+
+        # The cached arrays are copied, so the caller can modify the output
+        if return_covar:
+            return mean.copy(), variance.copy()
+        else:
+            return mean.copy()
 
     def _query(self, x, return_covar=False):
         """
@@ -119,6 +209,27 @@ class GPModel(ContinuousModel):
         else:
             return mean
 
+    def _cache_prediction(self, key, mean, variance):
+        """
+        Stores a prediction in the cache, and evicts the least recently used predictions if the cache is full
+        :param key: the key of the query
+        :param mean: np.ndarray: the mean of the prediction
+        :param variance: np.ndarray or None: the variance of the prediction, if it was computed
+        """
+        n_points = mean.size
+        if n_points > self.prediction_cache_size:
+            return
+        if key in self._prediction_cache:
+            self._prediction_cache_n_points -= self._prediction_cache[key][0].size
+        self._prediction_cache[key] = (mean.copy(),
+                                       None if variance is None
+                                       else variance.copy())
+        self._prediction_cache.move_to_end(key)
+        self._prediction_cache_n_points += n_points
+        while self._prediction_cache_n_points > self.prediction_cache_size:
+            _, (evicted_mean, _) = self._prediction_cache.popitem(last=False)
+            self._prediction_cache_n_points -= evicted_mean.size
+
     def fit(self, train_x, train_y, epochs, **optimizer_kwargs):
         """
         Fits the GP's hyperparameters to the data. After training, the GP's dataset is reset to what it was before
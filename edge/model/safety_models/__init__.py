@@ -1,2 +1,3 @@
 from .safety_measure import SafetyMeasure, MaternSafety
 from .safety_truth import SafetyTruth
+from .truth_sweep import compute_truth_sweep
@@ -1,10 +1,66 @@
+import hashlib
+import json
+import os
 import pickle as pkl
+import zlib
 import numpy as np
 from pathlib import Path
 
 from .. import GroundTruth
+from edge.dynamics import TransitionMap
 from edge.space import Segment, ProductSpace, StateActionSpace
 from edge.utils import get_parameters_lookup_dictionary
+from .viability import VIABILITY_METHODS, viable_set_by_worklist, \
+    viable_set_by_sweeps, viable_set_by_blocks, dilate
+
+
+def _file_digest(path):
+    """
+    Hashes the content of a file
+    :param path: the path of the file
+    :return: str: the first 16 hexadecimal digits of the SHA-256 digest of the file
+    """
+    digest = hashlib.sha256()
+    with Path(path).open('rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _from_json(value):
+    if isinstance(value, list):
+        return np.array(value)
+    return value
+
+
+def _lazy_set(name):
+    """
+    Creates the property of a boolean set of SafetyTruth. If the set is loaded in its bit-packed form, it is only
+    unpacked when it is first accessed
+    :param name: the name of the set
+    :return: property
+    """
+    def getter(self):
+        if self._sets.get(name) is None and name in self._packed_sets:
+            packed = self._packed_sets.pop(name)
+            self._sets[name] = np.unpackbits(
+                packed, count=self.stateaction_space.size
+            ).view(bool).reshape(self.stateaction_space.shape)
+        return self._sets.get(name)
+
+    def setter(self, value):
+        self._packed_sets.pop(name, None)
+        self._sets[name] = value
+
+    return property(getter, setter)
 
 
 class SafetyTruth(GroundTruth):
@@ -12,6 +68,28 @@ class SafetyTruth(GroundTruth):
     Represents the ground truth about a safety measure. A realistic Agent typically does not have access to that,
     but instead to a SafetyMeasure model.
     """
+    # Files where the arrays are written when the ground truth is computed out of core (see SafetyTruth.compute)
+    VIABLE_SET = 'viable_set.npy'
+    FAILURE_SET = 'failure_set.npy'
+    UNVIABLE_SET = 'unviable_set.npy'
+    MEASURE_VALUE = 'measure_value.npy'
+    STATE_MEASURE = 'state_measure.npy'
+    TRANSITION_MAP = 'transition_map'
+    # Files of the compact format (see SafetyTruth.save). The boolean sets are stored in '<name>_bits.npy' files
+    PACKED_SET_SUFFIX = '_bits.npy'
+    METADATA = 'truth.json'
+    SETS = ('viable_set', 'failure_set', 'unviable_set')
+
+    viable_set = _lazy_set('viable_set')
+    failure_set = _lazy_set('failure_set')
+    unviable_set = _lazy_set('unviable_set')
+
+    # Default number of bytes used by a block when the ground truth is computed out of core
+    DEFAULT_MEMORY_BUDGET = 2 ** 30
+    # Approximate number of bytes used per stateaction of a block: the next state index, the boolean sets, the measure,
+    # and the temporary arrays
+    BYTES_PER_ENTRY = 48
+
     def __init__(self, env):
         """
         Initializer
@@ -22,6 +100,12 @@ class SafetyTruth(GroundTruth):
         super(SafetyTruth, self).__init__()
         self.env = env
 
+        # Boolean sets, and bit-packed boolean sets that are not unpacked yet. See the viable_set property
+        self._sets = {}
+        self._packed_sets = {}
+        # Parameters of the vibly computation, if the ground truth comes from vibly
+        self._vibly_parameters = None
+
         # These attributes are initialized either by compute, load, or from_vibly_file
         self.stateaction_space = None
         self.viable_set = None
@@ -29,6 +113,13 @@ class SafetyTruth(GroundTruth):
         self.failure_set = None
         self.state_measure = None
         self.measure_value = None
+        # Number of iterations of the fixed-point computation during the last call to compute
+        self.n_sweeps = None
+        # Number of stateactions where the dynamics were evaluated by compute_multiresolution
+        self.n_dynamics_evaluations = None
+        # Results of viable_set_like, indexed by target grid, and the viable set and checksum they were computed from
+        self._viable_set_like_cache = {}
+        self._viable_set_like_source = None
 
     @property
     def viability_kernel(self):
@@ -56,27 +147,23 @@ class SafetyTruth(GroundTruth):
             :return: a list of n stateactions for which `condition` is true
             """
             if n > 0:
-                idx_satisfying_condition = np.argwhere(condition)
+                flat_idx_satisfying_condition = np.flatnonzero(condition)
             else:
-                idx_satisfying_condition = np.empty(
-                    shape=(0, len(condition.shape)),
-                    dtype=int
-                )
+                flat_idx_satisfying_condition = np.empty(0, dtype=int)
 
-            n = min(n, len(idx_satisfying_condition))
+            n = min(n, len(flat_idx_satisfying_condition))
             sample = np.random.choice(
-                idx_satisfying_condition.shape[0], n, replace=False
+                flat_idx_satisfying_condition.shape[0], n, replace=False
             )  # Samples indexes where the condition is true
-            sample_idx_list = idx_satisfying_condition[sample]
-            sample_idx_tuple = tuple(zip(*sample_idx_list))
-            if len(sample_idx_tuple) == 0:
-                sample_idx_tuple = ((), ())
-
-            sample_x = np.array([
-                self.stateaction_space[tuple(idx)]
-                for idx in sample_idx_list
-            ]).reshape((-1, self.stateaction_space.index_dim))
-            sample_y = self.measure_value[sample_idx_tuple].squeeze()
+            sample_flat_idx = flat_idx_satisfying_condition[sample]
+            sample_idx_list = np.stack(
+                np.unravel_index(sample_flat_idx, condition.shape), axis=1
+            ).reshape((-1, self.stateaction_space.index_dim))
+
+            sample_x = self.stateaction_space.get_element_of_index_batch(
+                sample_idx_list
+            ).reshape((-1, self.stateaction_space.index_dim))
+            sample_y = self.measure_value.reshape(-1)[sample_flat_idx]
             return sample_x, sample_y
 
         n_viable = 0 if not from_viable\
@@ -97,70 +184,122 @@ class SafetyTruth(GroundTruth):
 
         return train_x, train_y
 
-    def measure(self, state, action):
+    def _get_stateactions(self, state=None, action=None, stateaction=None):
+        """
+        Builds the stateactions queried by measure, is_viable, is_unviable and is_failure
+        :param state: the state, or np.ndarray of shape (N, state_space.data_length) of states
+        :param action: the action, or np.ndarray of shape (N, action_space.data_length) of actions
+        :param stateaction: the stateaction, or np.ndarray of shape (N, stateaction_space.data_length) of stateactions.
+            If specified, state and action are ignored
+        :return: np.ndarray of shape (..., stateaction_space.data_length): the stateactions
+        """
+        if stateaction is not None:
+            return np.asarray(stateaction)
+        if np.ndim(state) == 2 or np.ndim(action) == 2:
+            # Batches of states and actions. A single state or action is used with all the elements of the other batch
+            states = self.stateaction_space.state_space._as_batch(state)
+            actions = self.stateaction_space.action_space._as_batch(action)
+            n = max(len(states), len(actions))
+            return np.hstack((
+                np.broadcast_to(states, (n, states.shape[1])),
+                np.broadcast_to(actions, (n, actions.shape[1]))
+            ))
+        return self.stateaction_space[state, action]
+
+    def _get_values_at(self, values, stateactions):
+        """
+        Returns the values of an array over the stateaction space at the closest grid points of the stateactions
+        :param values: np.ndarray with the shape of the stateaction space
+        :param stateactions: np.ndarray of shape (..., stateaction_space.data_length)
+        :return: np.ndarray of shape stateactions.shape[:-1]
+        """
+        index = self.stateaction_space.get_index_of_batch(stateactions,
+                                                          around_ok=True)
+        # Indexing with an empty tuple turns 0-dimensional arrays into scalars, and leaves the others unchanged
+        return values[tuple(index.T)].reshape(np.shape(stateactions)[:-1])[()]
+
+    def measure(self, state=None, action=None, stateaction=None):
         """
-        Returns the measure
-        :param state: the state index over the stateaction space on which we want the measure
-        :param action: the action index over the stateaction space on which we want the measure
-        :return: np.ndarray: the value of the measure at the queried indexes
+        Returns the measure. The queries can be batched: see is_viable
+        :param state: the state, or the index of the state over the stateaction space (see StateActionSpace.__getitem__)
+        :param action: the action, or the index of the action over the stateaction space
+        :param stateaction: the stateaction. If specified, state and action are ignored
+        :return: np.ndarray: the value of the measure at the queried stateactions
         """
         # TODO uniformize the call to this function with SafetyMeasure.measure
-        stateactions = self.stateaction_space[state, action]
-        if len(stateactions.shape) > 1:
-            index = [
-                self.stateaction_space.get_index_of(sa, around_ok=True)
-                for sa in stateactions
-            ]
-            # We need a tuple of indexes along each coordinate to index the
-            # NumPy array
-            index = tuple(zip(*index))
-        else:
-            index = tuple(self.stateaction_space.get_index_of(stateactions,
-                                                              around_ok=True))
-        return self.measure_value[index]
+        stateactions = self._get_stateactions(state, action, stateaction)
+        return self._get_values_at(self.measure_value, stateactions)
 
     def is_viable(self, state=None, action=None, stateaction=None):
         """
-        Returns True iff. the state-action pair (resp. the stateaction) is viable
+        Returns True iff. the state-action pair (resp. the stateaction) is viable.
+        The queries can be batched: state and action can be arrays of shape (N, data_length), or indexes with slices
+        over the stateaction space, and stateaction can be an array of shape (N, stateaction_space.data_length). The
+        output then has one element per stateaction
         :param state: the state
         :param action: the action
         :param stateaction: the stateaction
-        :return: boolean: whether the state-action pair (resp. the stateaction) is viable
+        :return: boolean or np.ndarray<bool>: whether the state-action pairs (resp. the stateactions) are viable
         """
-        if stateaction is None:
-            stateaction = self.stateaction_space[state, action]
-        index = self.stateaction_space.get_index_of(
-            stateaction, around_ok=True
-        )
-        return self.viable_set[index] == 1
+        stateactions = self._get_stateactions(state, action, stateaction)
+        return self._get_values_at(self.viable_set, stateactions) == 1
 
-    def is_unviable(self, state, action):
+    def is_unviable(self, state=None, action=None, stateaction=None):
         """
-        Returns True iff. the state-action pair (resp. the stateaction) is unviable
+        Returns True iff. the state-action pair (resp. the stateaction) is unviable. The queries can be batched: see
+        is_viable
         :param state: the state
         :param action: the action
         :param stateaction: the stateaction
-        :return: boolean: whether the state-action pair (resp. the stateaction) is unviable
+        :return: boolean or np.ndarray<bool>: whether the state-action pairs (resp. the stateactions) are unviable
         """
-        sa = self.stateaction_space[state, action]
-        index = self.stateaction_space.get_index_of(
-            sa, around_ok=True
-        )
-        out = self.unviable_set[index] == 1
-        return out
+        stateactions = self._get_stateactions(state, action, stateaction)
+        return self._get_values_at(self.unviable_set, stateactions) == 1
 
-    def is_failure(self, state, action):
+    def is_failure(self, state=None, action=None, stateaction=None):
         """
-        Returns True iff. the state-action pair (resp. the stateaction) is a failure
+        Returns True iff. the state-action pair (resp. the stateaction) is a failure. The queries can be batched: see
+        is_viable
         :param state: the state
         :param action: the action
         :param stateaction: the stateaction
-        :return: boolean: whether the state-action pair (resp. the stateaction) is a failure
+        :return: boolean or np.ndarray<bool>: whether the state-action pairs (resp. the stateactions) are failures
         """
-        index = self.stateaction_space.get_index_of(
-            (state, action), around_ok=True
-        )
-        return self.failure_set[index] == 1
+        stateactions = self._get_stateactions(state, action, stateaction)
+        return self._get_values_at(self.failure_set, stateactions) == 1
+
+    def _get_resampling_index(self, stateaction_space):
+        """
+        Computes, for each grid point of stateaction_space, the index of the closest grid point of
+        self.stateaction_space.
+        :param stateaction_space: the target StateActionSpace
+        :return: tuple of np.ndarray<int> that indexes arrays over self.stateaction_space, and gives arrays with the
+            shape of stateaction_space
+        """
+        space = self.stateaction_space
+        if space.data_length != space.index_dim or \
+                stateaction_space.index_dim != space.index_dim:
+            # The coordinates are not independent: each grid point is projected
+            full_index = tuple([slice(None, None, None)] *
+                               stateaction_space.index_dim)
+            stateactions = stateaction_space[full_index]
+            index = space.get_index_of_batch(
+                space.closest_in_batch(stateactions), around_ok=True
+            )
+            return tuple(index.T)
+        # Each coordinate is projected independently: the projection of the grid is the product of the projections of
+        # its axes
+        axes_index = []
+        for axis, n_points in enumerate(stateaction_space.shape):
+            target_index = np.zeros((n_points, space.index_dim), dtype=int)
+            target_index[:, axis] = np.arange(n_points)
+            stateactions = stateaction_space.get_element_of_index_batch(
+                target_index
+            )
+            axes_index.append(space.get_index_of_batch(
+                space.closest_in_batch(stateactions), around_ok=True
+            )[:, axis])
+        return np.ix_(*axes_index)
 
     def viable_set_like(self, stateaction_space):
         """
@@ -170,27 +309,48 @@ class SafetyTruth(GroundTruth):
         the viable set along a dimension, this method will NOT fail. You
         should make sure you are actually undersampling the viable set for this
         method to give accurate outputs.
+        The result is cached for each target grid, until the viable set changes. Since the viable set can be modified
+        in place, changes are detected with a checksum of its content.
         :param output_shape: the desired output shape
         :return: the viable set as an array of shape output_shape
         """
-        resampled_viable_set = np.array([
-            self.viable_set[
-                self.stateaction_space.get_index_of(
-                    self.stateaction_space.closest_in(sa),
-                    around_ok=True
-                )
-            ] for _, sa in iter(stateaction_space)
-        ]).reshape(stateaction_space.shape)
+        viable_set = self.viable_set
+        checksum = zlib.crc32(np.ascontiguousarray(viable_set))
+        source = self._viable_set_like_source
+        if source is None or source[0] is not viable_set or \
+                source[1] != checksum:
+            self._viable_set_like_cache.clear()
+            self._viable_set_like_source = (viable_set, checksum)
+        key = (stateaction_space.shape, stateaction_space.limits)
+        resampled_viable_set = self._viable_set_like_cache.get(key)
+        if resampled_viable_set is None:
+            index = self._get_resampling_index(stateaction_space)
+            resampled_viable_set = np.asarray(viable_set)[index].reshape(
+                stateaction_space.shape
+            )
+            resampled_viable_set.flags.writeable = False
+            self._viable_set_like_cache[key] = resampled_viable_set
         return resampled_viable_set
 
-    def from_vibly_file(self, vibly_file_path):
+    def from_vibly_file(self, vibly_file_path, cache_directory=None):
         """
         Loads the ground truth from a vibly file
         Important note: for this method to work, you need to define the lookup dictionary in
         utils.vibly_compatibility_utils for your environment, if it is not done by default.
         :param vibly_file_path: str or Path: the file from where the ground truth should be loaded
+        :param cache_directory: optional: a directory where the ground truth is converted to the compact format of
+            SafetyTruth.save the first time the file is loaded. The conversion is identified by the hash of the content
+            of the file, so the next loads read the compact format instead of unpickling the file
         """
         vibly_file_path = Path(vibly_file_path)
+        cache_path = None
+        if cache_directory is not None:
+            cache_path = Path(cache_directory) / \
+                f'{vibly_file_path.stem}_{_file_digest(vibly_file_path)}'
+            if (cache_path / SafetyTruth.METADATA).exists():
+                self._load_compact(cache_path)
+                return
+
         with vibly_file_path.open('rb') as f:
             data = pkl.load(f)
         # `data` is a dictionary with: data.keys() = ['grids', 'Q_map', 'Q_F', 'Q_V', 'Q_M', 'S_M', 'p', 'x0']
@@ -206,37 +366,59 @@ class SafetyTruth(GroundTruth):
                              f'{self.env.action_space.index_dim} dimensions, '
                              f'got {len(actions)}')
 
-        def get_product_space(np_components):
-            segments = [Segment(comp[0], comp[-1], comp.shape[0])
-                        for comp in np_components]
-            product_space = ProductSpace(*segments)
-            return product_space
-
         # Vibly stores grids lazily, by only storing each dimension independently and only doing meshgrids when
         # required. Our StateActionSpace structure enables us to use an efficient ProductSpace instead
-        state_space = get_product_space(states)
-        action_space = get_product_space(actions)
-        self.stateaction_space = StateActionSpace(state_space, action_space)
+        self.stateaction_space = SafetyTruth._get_grid_space(
+            [(comp[0], comp[-1], comp.shape[0]) for comp in states + actions],
+            len(states)
+        )
 
         self.state_measure = data['S_M']
         self.measure_value = data['Q_M']
         self.viable_set = data['Q_V']
         self.failure_set = data['Q_F']
-        self.unviable_set = ~self.failure_set
-        self.unviable_set[self.viable_set] = False
+        unviable_set = ~self.failure_set
+        unviable_set[self.viable_set] = False
+        self.unviable_set = unviable_set
+
+        self._check_vibly_parameters(data['p'])
+        self._vibly_parameters = data['p']
+
+        if cache_path is not None:
+            # The conversion is written to a temporary directory first, so an interrupted conversion is never used
+            tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+            self.save(tmp_path, compact=True)
+            try:
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                # Another process converted the same file in the meantime
+                pass
 
-        # TODO get rid of that
-        self.viable_set = self.viable_set.astype(float)
-        self.failure_set = self.failure_set.astype(float)
-        self.unviable_set = self.unviable_set.astype(float)
+    @staticmethod
+    def _get_grid_space(grid, state_dim):
+        """
+        Creates a StateActionSpace that is a product of Segments
+        :param grid: list of (low, high, n_points) tuples: the Segments
+        :param state_dim: the number of Segments of the state space
+        :return: StateActionSpace
+        """
+        segments = [Segment(low, high, n_points)
+                    for low, high, n_points in grid]
+        return StateActionSpace(ProductSpace(*segments[:state_dim]),
+                                ProductSpace(*segments[state_dim:]))
 
+    def _check_vibly_parameters(self, vibly_parameters):
+        """
+        Checks that the parameters of a vibly computation match those of the environment
+        :param vibly_parameters: dictionary of the vibly parameters
+        """
         # This fails if the lookup dictionary is not defined in utils.vibly_compatibility_utils
         lookup_dictionary = get_parameters_lookup_dictionary(self.env)
 
         # We refuse to load a SafetyTruth if the parameters that are defined for the current environment and the ones
         # that were used for the computation of the ground truth are not exactly the same
         # An alternative is to load it nevertheless, but this behaviour may lead to errors that are very hard to debug.
-        for vibly_pname, vibly_value in data['p'].items():
+        for vibly_pname, vibly_value in vibly_parameters.items():
             pname = lookup_dictionary[vibly_pname]
             if pname is not None:
                 value = self.env.dynamics.parameters[pname]
@@ -247,20 +429,117 @@ class SafetyTruth(GroundTruth):
                         f'got {vibly_value}'
                     )
 
-    def compute(self, Q_map_path=None):
+    def _load_Q_map(self, Q_map_path, mmap_mode=None):
+        """
+        Loads the flat indexes of the next states from a dynamics map. See SafetyTruth.compute
+        :param Q_map_path: path to the dynamics map
+        :param mmap_mode: the memory-map mode used to load the map (see np.load)
+        :return: np.ndarray<int> with the shape of the stateaction space
+        """
+        state_space = self.stateaction_space.state_space
+        if TransitionMap.is_transition_map(Q_map_path):
+            Q_map = TransitionMap.load(Q_map_path,
+                                       mmap_mode=mmap_mode).next_state_ids
+        else:
+            try:
+                Q_map = np.load(Q_map_path, mmap_mode=mmap_mode,
+                                allow_pickle=True)
+            except ValueError:
+                # Maps of Python objects cannot be memory-mapped
+                Q_map = np.load(Q_map_path, allow_pickle=True)
+        if Q_map.shape != self.stateaction_space.shape:
+            raise ValueError('Loaded map shape and stateaction space shape '
+                             'don\'t match')
+        if Q_map.dtype == object:
+            # Older maps store the index tuples of the next states
+            Q_map = state_space.ravel_index(
+                np.array(Q_map.reshape(-1).tolist())
+            ).reshape(Q_map.shape)
+        return Q_map
+
+    def _state_failures(self, block_size):
+        """
+        Computes whether each state is a failure state
+        :param block_size: the number of states that are built at once
+        :return: np.ndarray<bool> of shape (state_space.size,), indexed by flat index
+        """
+        state_space = self.stateaction_space.state_space
+        state_fails = np.empty(state_space.size, dtype=bool)
+        for start in range(0, state_space.size, block_size):
+            stop = min(start + block_size, state_space.size)
+            state_fails[start:stop] = [
+                self.env.is_failure_state(state)
+                for state in state_space.element_at_flat(np.arange(start, stop))
+            ]
+        return state_fails
+
+    def compute(self, Q_map_path=None, method='worklist', memory_budget=None,
+                output_directory=None, initial_viable_set=None,
+                initial_limits=None):
         """
         Computes the safety ground truth in a brute-force fashion. This is only suitable for low dimensional spaces.
         This is an adaptation of Steve Heim's code from vibly.
         This method is computationally intensive.
-        :param Q_map_path: path to the dynamics map. If None, the dynamics map is computed beforehand.
+        :param Q_map_path: path to the dynamics map. If None, the dynamics map is computed beforehand. The path is
+            either a directory where an edge.dynamics.TransitionMap is stored, or a .npy file with the flat indexes
+            of the next states (see DiscreteTimeDynamics.compute_map). Maps of index tuples computed with older
+            versions of the code are also supported.
+        :param method: the method used to compute the viable set. Either:
+            * 'worklist': unviability is propagated backwards along the reversed dynamics map, in a time that is linear
+                in the number of stateactions,
+            * 'sweep': the whole viable set is updated until the viability kernel does not change. This uses less
+                memory, but the number of sweeps can be as large as the number of states
+            * 'chunked': like 'sweep', but the arrays are processed by blocks of states, and are memory-mapped from
+                output_directory if it is given. Use this when the arrays do not fit in memory
+        :param memory_budget: only used with method='chunked': the approximate number of bytes used by a block.
+            Defaults to SafetyTruth.DEFAULT_MEMORY_BUDGET
+        :param output_directory: only used with method='chunked': the directory where the arrays of the ground truth
+            are written. If None, the arrays are kept in memory. If Q_map_path is None, the dynamics map is also
+            stored there
+        :param initial_viable_set: optional: np.ndarray<bool> with the shape of the stateaction space, used to
+            warm-start the computation. The computation converges to the largest viable set included in it, so it
+            should contain the true viable set: for example, the viable set of a more permissive parameterization of
+            the environment, computed on the same grid. See compute_truth_sweep
+        :param initial_limits: optional: the limits of the stateaction space initial_viable_set was computed on. Since
+            the initial viable set is used index by index, a ValueError is raised if they differ from the limits of the
+            current stateaction space
         """
+        if method not in VIABILITY_METHODS:
+            raise ValueError(f'Unknown method {method}. Available methods are '
+                             f'{VIABILITY_METHODS}')
         self.stateaction_space = self.env.stateaction_space
+        if initial_viable_set is not None and \
+                initial_viable_set.shape != self.stateaction_space.shape:
+            raise ValueError('Initial viable set shape and stateaction space '
+                             'shape don\'t match')
+        if initial_limits is not None and not np.array_equal(
+                np.asarray(initial_limits, dtype=float),
+                np.asarray(self.stateaction_space.limits, dtype=float)):
+            raise ValueError('Initial viable set limits and stateaction space '
+                             'limits don\'t match')
+        state_space = self.stateaction_space.state_space
+        n_actions = self.stateaction_space.action_space.size
+        if method == 'chunked':
+            if memory_budget is None:
+                memory_budget = SafetyTruth.DEFAULT_MEMORY_BUDGET
+            block_size = max(
+                1, memory_budget // (n_actions * SafetyTruth.BYTES_PER_ENTRY)
+            )
+            if output_directory is not None:
+                output_directory = Path(output_directory)
+                output_directory.mkdir(parents=True, exist_ok=True)
+        else:
+            block_size = state_space.size
 
         if Q_map_path is not None:
-            Q_map = np.load(Q_map_path, allow_pickle=True)
-            if Q_map.shape != self.stateaction_space.shape:
-                raise ValueError('Loaded map shape and stateaction space shape '
-                                 'don\'t match')
+            Q_map = self._load_Q_map(
+                Q_map_path, mmap_mode='r' if method == 'chunked' else None
+            )
+        elif method == 'chunked' and output_directory is not None:
+            Q_map = self.env.compute_transition_map(
+                path=output_directory / SafetyTruth.TRANSITION_MAP,
+                store_next_states=False
+            ).next_state_ids
         else:
             Q_map = self.env.compute_dynamics_map()
         action_axes = tuple([
@@ -268,42 +547,32 @@ class SafetyTruth(GroundTruth):
             for k in range(self.stateaction_space.action_space.index_dim)
         ])
 
-        def next_state_fails(next_index):
-            """
-            Checks whether the next state is a failure state
-            :param next_index: the index of the next state
-            :return: True iff the next state is a failure state
-            """
-            return self.env.is_failure_state(
-                self.stateaction_space.state_space[next_index]
-            )
-
-        failure_set = np.array(
-            list(map(
-                next_state_fails,
-                Q_map.reshape(-1).tolist()
-            ))
-        ).reshape(Q_map.shape)
-        viable_set = np.logical_not(failure_set)  # The viable set is initialized as the complementary of the failure
-        viability_kernel = viable_set.any(axis=action_axes)
-
-        done = False
-        # We iteratively find the largest positively invariant viability kernel with the policy of picking actions in
-        # the current estimate of the viable set
-        while not done:
-            for index, _ in iter(self.stateaction_space):
-                is_viable = viable_set[index]
-                if is_viable:
-                    next_state_index = Q_map[index]
-                    next_is_viable = viability_kernel[next_state_index]
-                    if not next_is_viable:
-                        viable_set[index] = False
-            previous_viability_kernel = viability_kernel
-            viability_kernel = viable_set.any(axis=action_axes)
-            # No change in the viability kernel estimation exactly means that the viability kernel is positively
-            # invariant, which is our stopping condition
-            done = np.all(viability_kernel == previous_viability_kernel)
-
+        # Whether each state is a failure state, indexed by flat index
+        state_fails = self._state_failures(block_size)
+
+        if method == 'chunked':
+            self._compute_by_blocks(Q_map, state_fails, block_size,
+                                    output_directory, initial_viable_set)
+            return
+
+        failure_set = state_fails[Q_map]
+        # The state axes come first in the stateaction space, so the flat index of a stateaction is
+        # state_flat_index * n_actions + action_flat_index
+        flat_shape = (state_space.size, n_actions)
+        flat_Q_map = np.asarray(Q_map).reshape(flat_shape)
+        # The viable set is initialized as the complementary of the failure set
+        viable_set = np.logical_not(failure_set).reshape(flat_shape)
+        if initial_viable_set is not None:
+            viable_set &= initial_viable_set.reshape(flat_shape).astype(bool)
+        # We find the largest positively invariant viability kernel with the policy of picking actions in the current
+        # estimate of the viable set
+        if method == 'worklist':
+            viable_set, self.n_sweeps = viable_set_by_worklist(flat_Q_map,
+                                                               viable_set)
+        else:
+            viable_set, self.n_sweeps = viable_set_by_sweeps(flat_Q_map,
+                                                             viable_set)
+        viable_set = viable_set.reshape(self.stateaction_space.shape)
 
         self.viable_set = viable_set
         self.failure_set = failure_set
@@ -313,38 +582,316 @@ class SafetyTruth(GroundTruth):
         )
         self.state_measure = self.viable_set.mean(axis=action_axes)
 
-        def next_state_measure(next_index):
-            return self.state_measure[next_index]
-        self.measure_value = np.array(
-            list(map(
-                next_state_measure,
-                Q_map.reshape(-1).tolist()
-            ))
-        ).reshape(Q_map.shape)
-
-    def save(self, save_path):
-        save_dict = {
-            'viable_set': self.viable_set,
-            'unviable_set': self.unviable_set,
-            'failure_set': self.failure_set,
-            'state_measure': self.state_measure,
-            'measure_value': self.measure_value
-        }
-        np.savez(save_path, **save_dict)
+        self.measure_value = self.state_measure.reshape(-1)[Q_map]
 
-    @staticmethod
-    def load(load_path, env):
-        truth = SafetyTruth(env)
-        truth.stateaction_space = env.stateaction_space
+    def _compute_by_blocks(self, Q_map, state_fails, block_size,
+                           output_directory, initial_viable_set):
+        """
+        Computes the ground truth by blocks of block_size states. See SafetyTruth.compute with method='chunked'
+        """
+        shape = self.stateaction_space.shape
+        state_shape = self.stateaction_space.state_space.shape
+        n_states = self.stateaction_space.state_space.size
+        flat_shape = (n_states, self.stateaction_space.action_space.size)
+
+        def new_array(name, array_shape, dtype):
+            if output_directory is None:
+                return np.empty(array_shape, dtype=dtype)
+            return np.lib.format.open_memmap(output_directory / name,
+                                             mode='w+', dtype=dtype,
+                                             shape=array_shape)
+
+        viable_set = new_array(SafetyTruth.VIABLE_SET, shape, bool)
+        failure_set = new_array(SafetyTruth.FAILURE_SET, shape, bool)
+        unviable_set = new_array(SafetyTruth.UNVIABLE_SET, shape, bool)
+        measure_value = new_array(SafetyTruth.MEASURE_VALUE, shape, np.float64)
+        state_measure = new_array(SafetyTruth.STATE_MEASURE, state_shape,
+                                  np.float64)
+        flat_Q_map = Q_map.reshape(flat_shape)
+        flat_viable_set = viable_set.reshape(flat_shape)
+        flat_failure_set = failure_set.reshape(flat_shape)
+        flat_unviable_set = unviable_set.reshape(flat_shape)
+        flat_measure_value = measure_value.reshape(flat_shape)
+        flat_state_measure = state_measure.reshape(-1)
+        blocks = [slice(start, min(start + block_size, n_states))
+                  for start in range(0, n_states, block_size)]
+
+        for block in blocks:
+            block_failure_set = state_fails[flat_Q_map[block]]
+            flat_failure_set[block] = block_failure_set
+            block_viable_set = np.logical_not(block_failure_set)
+            if initial_viable_set is not None:
+                block_viable_set &= initial_viable_set.reshape(flat_shape)[
+                    block].astype(bool)
+            flat_viable_set[block] = block_viable_set
+
+        _, self.n_sweeps = viable_set_by_blocks(flat_Q_map, flat_viable_set,
+                                                block_size)
+
+        for block in blocks:
+            block_viable_set = np.asarray(flat_viable_set[block])
+            flat_unviable_set[block] = np.logical_not(
+                block_viable_set | flat_failure_set[block]
+            )
+            flat_state_measure[block] = block_viable_set.mean(axis=1)
+        for block in blocks:
+            flat_measure_value[block] = flat_state_measure[flat_Q_map[block]]
+
+        for array in [viable_set, failure_set, unviable_set, measure_value,
+                      state_measure]:
+            if isinstance(array, np.memmap):
+                array.flush()
+        self.viable_set = viable_set
+        self.failure_set = failure_set
+        self.unviable_set = unviable_set
+        self.state_measure = state_measure
+        self.measure_value = measure_value
+
+    def compute_multiresolution(self, coarsening=4, margin=1,
+                                block_size=4096):
+        """
+        Computes an approximation of the safety ground truth with fewer evaluations of the dynamics than
+        SafetyTruth.compute. The viable set is first computed on a coarse grid made of one stateaction every
+        `coarsening` stateactions along each axis, with the next states projected on the coarse grid. The dynamics are
+        then evaluated on the full grid only for the stateactions close to a coarse stateaction where the viable set or
+        the failure set changes, and the viable set is computed again. The other stateactions take the values of their
+        closest coarse stateaction. The resulting arrays have the shape of the stateaction space, as with
+        SafetyTruth.compute.
+        The number of stateactions where the dynamics were evaluated is stored in self.n_dynamics_evaluations.
+        :param coarsening: the number of stateactions along each axis between two coarse stateactions
+        :param margin: the number of coarse stateactions around a change of the viable or failure set where the
+            dynamics are evaluated on the full grid
+        :param block_size: the number of stateactions where the dynamics are evaluated at once
+        """
+        self.stateaction_space = self.env.stateaction_space
+        state_space = self.stateaction_space.state_space
+        shape = self.stateaction_space.shape
+        state_dim = state_space.index_dim
+        n_states = state_space.size
+        n_actions = self.stateaction_space.action_space.size
+
+        # Indexes of the coarse stateactions along each axis, and index of the closest coarse stateaction of each
+        # stateaction along each axis
+        coarse_indexes = [np.unique(np.append(np.arange(0, n, coarsening), n - 1))
+                          for n in shape]
+        closest_coarse = [
+            np.abs(np.arange(n)[:, np.newaxis] - indexes).argmin(axis=1)
+            for n, indexes in zip(shape, coarse_indexes)
+        ]
+        coarse_shape = tuple(len(indexes) for indexes in coarse_indexes)
+        coarse_state_shape = coarse_shape[:state_dim]
+        n_coarse_actions = int(np.prod(coarse_shape[state_dim:]))
+        # Flat indexes of the closest coarse stateaction of each stateaction, and of the closest coarse state of each
+        # state
+        coarse_of_stateaction = np.ravel_multi_index(
+            np.meshgrid(*closest_coarse, indexing='ij'), coarse_shape
+        ).reshape(-1)
+        coarse_of_state = np.ravel_multi_index(
+            np.meshgrid(*closest_coarse[:state_dim], indexing='ij'),
+            coarse_state_shape
+        ).reshape(-1)
+
+        # The stateactions where the dynamics are not evaluated loop on their state: they stay viable if and only if
+        # the state stays in the viability kernel
+        flat_Q_map = np.repeat(
+            np.arange(n_states, dtype=state_space.flat_index_dtype), n_actions
+        )
+        evaluated = np.zeros(flat_Q_map.size, dtype=bool)
+
+        def evaluate(stateaction_ids):
+            stateaction_ids = stateaction_ids[
+                np.logical_not(evaluated[stateaction_ids])
+            ]
+            for start in range(0, len(stateaction_ids), block_size):
+                ids = stateaction_ids[start:start + block_size]
+                flat_Q_map[ids], _, _ = self.env.compute_dynamics_map_block(
+                    self.stateaction_space.element_at_flat(ids)
+                )
+            evaluated[stateaction_ids] = True
+
+        state_fails = self._state_failures(block_size)
+
+        # Computation on the coarse grid
+        coarse_stateactions = np.ravel_multi_index(
+            np.meshgrid(*coarse_indexes, indexing='ij'), shape
+        ).reshape(-1)
+        evaluate(coarse_stateactions)
+        coarse_Q_map = flat_Q_map[coarse_stateactions]
+        coarse_failure_set = state_fails[coarse_Q_map]
+        coarse_next_states = coarse_of_state[coarse_Q_map].reshape(
+            (-1, n_coarse_actions)
+        )
+        coarse_viable_set, _ = viable_set_by_worklist(
+            coarse_next_states,
+            np.logical_not(coarse_failure_set).reshape(coarse_next_states.shape)
+        )
+        coarse_viable_set = coarse_viable_set.reshape(-1)
+        coarse_measure_value = coarse_viable_set.reshape(
+            coarse_next_states.shape
+        ).mean(axis=1)[coarse_next_states].reshape(-1)
+
+        # The boundary is where the viable set or the failure set changes
+        axes = tuple(range(len(shape)))
+        coarse_boundary = np.zeros(coarse_shape, dtype=bool)
+        for coarse_set in [coarse_viable_set, coarse_failure_set]:
+            coarse_set = coarse_set.reshape(coarse_shape)
+            coarse_boundary |= dilate(coarse_set, margin, axes) & \
+                dilate(np.logical_not(coarse_set), margin, axes)
+        boundary = coarse_boundary.reshape(-1)[coarse_of_stateaction]
+        evaluate(np.flatnonzero(boundary))
+
+        # Computation on the full grid
+        failure_set = coarse_failure_set[coarse_of_stateaction]
+        failure_set[evaluated] = state_fails[flat_Q_map[evaluated]]
+        viable_set = coarse_viable_set[coarse_of_stateaction]
+        viable_set[boundary] = np.logical_not(failure_set[boundary])
+        viable_set, self.n_sweeps = viable_set_by_worklist(
+            flat_Q_map.reshape((n_states, n_actions)),
+            viable_set.reshape((n_states, n_actions))
+        )
+        state_measure = viable_set.mean(axis=1)
+        measure_value = coarse_measure_value[coarse_of_stateaction]
+        measure_value[evaluated] = state_measure[flat_Q_map[evaluated]]
 
-        loaded = np.load(load_path)
+        self.n_dynamics_evaluations = int(evaluated.sum())
+        self.viable_set = viable_set.reshape(shape)
+        self.failure_set = failure_set.reshape(shape)
+        self.unviable_set = np.logical_and(
+            np.logical_not(self.viable_set),
+            np.logical_not(self.failure_set)
+        )
+        self.state_measure = state_measure.reshape(state_space.shape)
+        self.measure_value = measure_value.reshape(shape)
 
-        for attribute_name, attribute in loaded.items():
-            setattr(truth, attribute_name, attribute)
+    def save(self, save_path, compact=False, measure_dtype=np.float32):
+        """
+        Saves the ground truth. By default, all the arrays are saved in a single .npz file (see np.savez). In the compact
+        format, save_path is a directory where the boolean sets are bit-packed, and each array is a separate .npy file,
+        so it can be memory-mapped by SafetyTruth.load
+        :param save_path: str or Path: the .npz file, or the directory of the compact format
+        :param compact: whether the ground truth is saved in the compact format
+        :param measure_dtype: the dtype of the measures in the compact format
+        """
+        if not compact:
+            save_dict = {
+                'viable_set': self.viable_set,
+                'unviable_set': self.unviable_set,
+                'failure_set': self.failure_set,
+                'state_measure': self.state_measure,
+                'measure_value': self.measure_value
+            }
+            np.savez(save_path, **save_dict)
+            return
+
+        save_path = Path(save_path)
+        save_path.mkdir(parents=True, exist_ok=True)
+        block_size = 8 * 2 ** 20
+        for name in SafetyTruth.SETS:
+            values = getattr(self, name).reshape(-1)
+            packed = np.lib.format.open_memmap(
+                save_path / f'{name}{SafetyTruth.PACKED_SET_SUFFIX}',
+                mode='w+', dtype=np.uint8, shape=(-(-values.size // 8),)
+            )
+            # Blocks are a multiple of 8 elements long, so they are packed independently
+            for start in range(0, values.size, block_size):
+                packed[start // 8:(start + block_size) // 8] = np.packbits(
+                    np.asarray(values[start:start + block_size]) != 0
+                )
+            packed.flush()
+        for file_name, values in [
+                (SafetyTruth.STATE_MEASURE, self.state_measure),
+                (SafetyTruth.MEASURE_VALUE, self.measure_value)]:
+            array = np.lib.format.open_memmap(
+                save_path / file_name, mode='w+', dtype=measure_dtype,
+                shape=values.shape
+            )
+            flat_array = array.reshape(-1)
+            flat_values = values.reshape(-1)
+            for start in range(0, flat_values.size, block_size):
+                flat_array[start:start + block_size] = \
+                    flat_values[start:start + block_size]
+            array.flush()
+
+        metadata = {'shape': list(self.stateaction_space.shape)}
+        if self.stateaction_space is not self.env.stateaction_space:
+            # The grid is not the one of the environment, e.g., for ground truths from vibly
+            metadata['grid'] = [
+                [float(low), float(high), int(n_points)]
+                for (low, high), n_points in zip(
+                    self.stateaction_space.limits, self.stateaction_space.shape
+                )
+            ]
+            metadata['state_dim'] = \
+                self.stateaction_space.state_space.index_dim
+        if self._vibly_parameters is not None:
+            metadata['vibly_parameters'] = {
+                pname: _to_json(value)
+                for pname, value in self._vibly_parameters.items()
+            }
+        with (save_path / SafetyTruth.METADATA).open('w') as f:
+            json.dump(metadata, f)
+
+    def _load_compact(self, load_path, mmap_mode='r'):
+        """
+        Loads a ground truth saved in the compact format. See SafetyTruth.load
+        """
+        metadata = {}
+        if (load_path / SafetyTruth.METADATA).exists():
+            with (load_path / SafetyTruth.METADATA).open('r') as f:
+                metadata = json.load(f)
+        if 'grid' in metadata:
+            self.stateaction_space = SafetyTruth._get_grid_space(
+                metadata['grid'], metadata['state_dim']
+            )
+        else:
+            self.stateaction_space = self.env.stateaction_space
+        if 'vibly_parameters' in metadata:
+            vibly_parameters = {
+                pname: _from_json(value)
+                for pname, value in metadata['vibly_parameters'].items()
+            }
+            self._check_vibly_parameters(vibly_parameters)
+            self._vibly_parameters = vibly_parameters
+
+        def load_array(file_name):
+            return np.load(load_path / file_name, mmap_mode=mmap_mode,
+                           allow_pickle=False)
+
+        for name in SafetyTruth.SETS:
+            packed_file_name = f'{name}{SafetyTruth.PACKED_SET_SUFFIX}'
+            if (load_path / packed_file_name).exists():
+                setattr(self, name, None)
+                self._packed_sets[name] = load_array(packed_file_name)
+            else:
+                # Sets written by SafetyTruth.compute with method='chunked'
+                setattr(self, name, load_array(f'{name}.npy'))
+        self.state_measure = load_array(SafetyTruth.STATE_MEASURE)
+        self.measure_value = load_array(SafetyTruth.MEASURE_VALUE)
 
-        if truth.stateaction_space.shape != truth.viable_set.shape:
-            raise ValueError(f'Got {truth.viable_set.shape} shape for the '
-                             'viable set, expected '
+    @staticmethod
+    def load(load_path, env, mmap_mode='r'):
+        """
+        Loads a ground truth saved by SafetyTruth.save, or computed with SafetyTruth.compute(method='chunked'). In the
+        compact format, the arrays are memory-mapped, and the boolean sets are only unpacked when they are first
+        accessed
+        :param load_path: str or Path: the .npz file, or the directory of the compact format
+        :param env: the environment
+        :param mmap_mode: the memory-map mode of the arrays of the compact format (see np.load)
+        :return: the SafetyTruth
+        """
+        load_path = Path(load_path)
+        truth = SafetyTruth(env)
+        if load_path.is_dir():
+            truth._load_compact(load_path, mmap_mode=mmap_mode)
+        else:
+            truth.stateaction_space = env.stateaction_space
+            loaded = np.load(load_path)
+            for attribute_name, attribute in loaded.items():
+                setattr(truth, attribute_name, attribute)
+
+        if truth.stateaction_space.shape != truth.measure_value.shape:
+            raise ValueError(f'Got {truth.measure_value.shape} shape for the '
+                             'ground truth, expected '
                              f'{truth.stateaction_space.shape}')
 
         return truth
@@ -0,0 +1,44 @@
+from .safety_truth import SafetyTruth
+
+
+def compute_truth_sweep(env_builder, parameterizations, permissiveness,
+                        method='sweep', compare_cold_start=False):
+    """
+    Computes the safety ground truths of a family of parameterizations of an environment, warm-starting each
+    computation with the viable set of the previous one.
+    The viable set only shrinks during the fixed-point computation, so a warm start is exact as long as the initial viable
+    set contains the true one. The parameterizations are computed from the most permissive to the least permissive,
+    so each one is warm-started with the viable set of the closest parameterization whose viable set is larger.
+    :param env_builder: function taking a parameterization and returning the corresponding Environment. All the
+        environments should have the same stateaction space, with the same shape and limits: a ValueError is raised
+        otherwise
+    :param parameterizations: list of parameterizations, e.g., dictionaries of dynamics parameters
+    :param permissiveness: function taking a parameterization and returning a number that grows with the viable set.
+        For example, `lambda p: -p['ground_gravity']` for Hovership
+    :param method: the method used to compute the viable sets (see SafetyTruth.compute)
+    :param compare_cold_start: whether each ground truth is also computed without warm start, to measure the number of
+        sweeps saved. This doubles the cost of the sweep
+    :return: list of (parameterization, SafetyTruth, report) tuples, in the order of computation. The report is a
+        dictionary with the number of sweeps of the computation 'n_sweeps' and, if compare_cold_start is True, the
+        number of sweeps without warm start 'cold_n_sweeps' and the number of sweeps saved 'sweeps_saved'
+    """
+    ordered_parameterizations = sorted(parameterizations, key=permissiveness,
+                                       reverse=True)
+    results = []
+    previous_viable_set = None
+    previous_limits = None
+    for parameterization in ordered_parameterizations:
+        env = env_builder(parameterization)
+        truth = SafetyTruth(env)
+        truth.compute(method=method, initial_viable_set=previous_viable_set,
+                      initial_limits=previous_limits)
+        report = {'n_sweeps': truth.n_sweeps}
+        if compare_cold_start:
+            cold_truth = SafetyTruth(env)
+            cold_truth.compute(method=method)
+            report['cold_n_sweeps'] = cold_truth.n_sweeps
+            report['sweeps_saved'] = cold_truth.n_sweeps - truth.n_sweeps
+        results.append((parameterization, truth, report))
+        previous_viable_set = truth.viable_set
+        previous_limits = truth.stateaction_space.limits
+    return results
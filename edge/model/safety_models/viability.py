@@ -0,0 +1,166 @@
+import numpy as np
+
+# Methods available to compute the viable set
+VIABILITY_METHODS = ('worklist', 'sweep', 'chunked')
+
+
+def reverse_transition_graph(next_state_ids, n_states):
+    """
+    Builds the reverse transition graph of a dynamics map, in compressed sparse row format: the predecessors of the
+    state with flat index i are the stateactions predecessors[indptr[i]:indptr[i+1]]
+    :param next_state_ids: np.ndarray<int> of shape (n_stateactions,): the flat index of the next state of each
+        stateaction
+    :param n_states: the number of states
+    :return: np.ndarray<int> of shape (n_states + 1,), np.ndarray<int> of shape (n_stateactions,): the row pointers
+        and the flat indexes of the predecessor stateactions
+    """
+    next_state_ids = np.asarray(next_state_ids).reshape(-1)
+    predecessors = np.argsort(next_state_ids)
+    if next_state_ids.size <= np.iinfo(np.int32).max:
+        predecessors = predecessors.astype(np.int32)
+    indptr = np.zeros(n_states + 1, dtype=np.int64)
+    np.cumsum(np.bincount(next_state_ids, minlength=n_states),
+              out=indptr[1:])
+    return indptr, predecessors
+
+
+def _gather_rows(indptr, values, rows):
+    """
+    Concatenates the rows of a compressed sparse row structure
+    :param indptr: the row pointers
+    :param values: the values
+    :param rows: np.ndarray<int>: the rows to concatenate
+    :return: np.ndarray: the concatenated rows
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return values[:0]
+    # Position of each gathered element in its row, computed without a Python loop over the rows
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[offsets + np.arange(total)]
+
+
+def viable_set_by_worklist(next_state_ids, viable_set, reverse_graph=None):
+    """
+    Computes the largest viable set included in an initial viable set, by propagating unviability backwards along the
+    transitions. A state leaves the viability kernel once all its actions are unviable, which makes all the stateactions
+    leading to it unviable. Each state enters the worklist at most once, and each stateaction is visited at most once,
+    so the total work is linear in the number of stateactions.
+    :param next_state_ids: np.ndarray<int> of shape (n_states, n_actions): the flat index of the next state of each
+        stateaction
+    :param viable_set: np.ndarray<bool> of shape (n_states, n_actions): the initial viable set. It is modified in place
+    :param reverse_graph: optional: the output of reverse_transition_graph, if it is already computed
+    :return: np.ndarray<bool> of shape (n_states, n_actions), int: the viable set, and the number of times the worklist
+        was processed
+    """
+    n_states, n_actions = viable_set.shape
+    flat_viable_set = viable_set.reshape(-1)
+    n_viable_actions = viable_set.sum(axis=1)
+    worklist = np.flatnonzero(n_viable_actions == 0)
+    n_iterations = 0
+    if worklist.size == 0:
+        return viable_set, n_iterations
+
+    if reverse_graph is None:
+        reverse_graph = reverse_transition_graph(next_state_ids, n_states)
+    indptr, predecessors = reverse_graph
+    while worklist.size > 0:
+        n_iterations += 1
+        unviable = _gather_rows(indptr, predecessors, worklist)
+        unviable = unviable[flat_viable_set[unviable]]
+        flat_viable_set[unviable] = False
+        states, n_removed = np.unique(unviable // n_actions,
+                                      return_counts=True)
+        n_viable_actions[states] -= n_removed
+        worklist = states[n_viable_actions[states] == 0]
+    return viable_set, n_iterations
+
+
+def viable_set_by_sweeps(next_state_ids, viable_set):
+    """
+    Computes the largest viable set included in an initial viable set, by removing the stateactions leading outside of
+    the viability kernel from the whole viable set until the kernel does not change. Each sweep is vectorized, but the
+    number of sweeps can be as large as the number of states.
+    :param next_state_ids: np.ndarray<int> of shape (n_states, n_actions): the flat index of the next state of each
+        stateaction
+    :param viable_set: np.ndarray<bool> of shape (n_states, n_actions): the initial viable set. It is modified in place
+    :return: np.ndarray<bool> of shape (n_states, n_actions), int: the viable set, and the number of sweeps
+    """
+    viability_kernel = viable_set.any(axis=1)
+    n_sweeps = 0
+    done = False
+    while not done:
+        n_sweeps += 1
+        viable_set &= viability_kernel[next_state_ids]
+        previous_viability_kernel = viability_kernel
+        viability_kernel = viable_set.any(axis=1)
+        # No change in the viability kernel estimation exactly means that the viability kernel is positively
+        # invariant, which is our stopping condition
+        done = np.array_equal(viability_kernel, previous_viability_kernel)
+    return viable_set, n_sweeps
+
+
+def viable_set_by_blocks(next_state_ids, viable_set, block_size):
+    """
+    Computes the same viable set as viable_set_by_sweeps, but only reads and writes the arrays by blocks of block_size
+    states, so they can be memory-mapped arrays larger than the memory. Only the viability kernel is kept in memory. It
+    is updated as soon as a block is processed, which usually reduces the number of sweeps.
+    :param next_state_ids: np.ndarray<int> of shape (n_states, n_actions): the flat index of the next state of each
+        stateaction
+    :param viable_set: np.ndarray<bool> of shape (n_states, n_actions): the initial viable set. It is modified in place
+    :param block_size: the number of states in a block
+    :return: np.ndarray<bool> of shape (n_states, n_actions), int: the viable set, and the number of sweeps
+    """
+    n_states = viable_set.shape[0]
+    blocks = [slice(start, min(start + block_size, n_states))
+              for start in range(0, n_states, block_size)]
+    viability_kernel = np.empty(n_states, dtype=bool)
+    for block in blocks:
+        viability_kernel[block] = viable_set[block].any(axis=1)
+
+    n_sweeps = 0
+    changed = True
+    while changed:
+        n_sweeps += 1
+        changed = False
+        for block in blocks:
+            block_viable_set = np.asarray(viable_set[block])
+            new_block_viable_set = block_viable_set & \
+                viability_kernel[next_state_ids[block]]
+            # Blocks that do not change are not written, so their pages are not marked as dirty
+            if np.array_equal(new_block_viable_set, block_viable_set):
+                continue
+            viable_set[block] = new_block_viable_set
+            block_viability_kernel = new_block_viable_set.any(axis=1)
+            if not np.array_equal(block_viability_kernel,
+                                  viability_kernel[block]):
+                viability_kernel[block] = block_viability_kernel
+                changed = True
+    # A sweep where the viability kernel does not change means that it is positively invariant
+    return viable_set, n_sweeps
+
+
+def dilate(mask, margin, axes):
+    """
+    Dilates a boolean array along some of its axes: an entry is True if an entry at a distance of at most margin along
+    each of these axes is True
+    :param mask: np.ndarray<bool>: the array to dilate
+    :param margin: the distance of the dilation, in number of entries
+    :param axes: the axes along which the array is dilated
+    :return: np.ndarray<bool> with the same shape as mask: the dilated array
+    """
+    dilated = mask.copy()
+    for axis in axes:
+        length = mask.shape[axis]
+        # The dilation is separable: dilating along each axis successively gives the dilation by a box
+        current = dilated.copy()
+        for shift in range(1, min(margin, length - 1) + 1):
+            lower = [slice(None)] * mask.ndim
+            upper = [slice(None)] * mask.ndim
+            lower[axis] = slice(0, length - shift)
+            upper[axis] = slice(shift, length)
+            dilated[tuple(lower)] |= current[tuple(upper)]
+            dilated[tuple(upper)] |= current[tuple(lower)]
+    return dilated
@@ -22,6 +22,9 @@ class Segment(DiscretizableSpace):
         self.high = high
         self.n_points = n_points
         self.tolerance = (high - low) * 1e-7  # For approximate check of whether a point is on the grid
+        # The values of the grid are computed once, and served as read-only views when slicing
+        self._values = self._get_value_of_index(np.arange(n_points))
+        self._values.flags.writeable = False
 
     def __getitem__(self, index):
         """
@@ -52,20 +55,28 @@ class Segment(DiscretizableSpace):
             else:
                 return np.atleast_1d(self._get_value_of_index(index))
         elif isinstance(index, slice):
-            rangeargs = index.indices(self.n_points)
-            return np.array([
-                np.atleast_1d(self._get_value_of_index(i))
-                for i in range(*rangeargs)
-            ])
+            return self._values[index].reshape((-1, 1)).copy()
         else:
             raise TypeError('Index can only be numpy ndarray, int, slice, '
                             f'or 1d tuple, not {type(index)}')
 
+    def _get_values(self, index):
+        if isinstance(index, tuple) and len(index) == 1:
+            index = index[0]
+        if isinstance(index, slice):
+            return self._values[index]
+        return super(Segment, self)._get_values(index)
+
     def _get_closest_index(self, x):
         return int(np.around(
             (self.n_points - 1) * (x - self.low) / (self.high - self.low)
         ))
 
+    def _get_closest_index_batch(self, x):
+        return np.around(
+            (self.n_points - 1) * (x - self.low) / (self.high - self.low)
+        ).astype(int)
+
     def _get_value_of_index(self, index):
         t = index / (self.n_points - 1)
         return (1 - t) * self.low + t * self.high
@@ -96,6 +107,42 @@ class Segment(DiscretizableSpace):
     def closest_in(self, x):
         return np.clip(x, self.low, self.high)
 
+    def get_element_of_index_batch(self, indexes):
+        indexes = np.asarray(indexes, dtype=int).reshape(-1)
+        indexes = np.where(indexes < 0, indexes + self.n_points, indexes)
+        if ((indexes < 0) | (indexes > self.n_points - 1)).any():
+            raise IndexError(f"Indexes out of bounds for Segment with length "
+                             f"{self.n_points}")
+        return self._values[indexes].reshape((-1, 1))
+
+    def contains_batch(self, x):
+        x = self._as_batch(x)[:, 0]
+        return (self.low <= x) & (self.high >= x)
+
+    def is_on_grid_batch(self, x):
+        x = self._as_batch(x)[:, 0]
+        isin = (self.low <= x) & (self.high >= x)
+        closest_index = self._get_closest_index_batch(x)
+        distance = np.abs(self._get_value_of_index(closest_index) - x)
+        return isin & (distance <= self.tolerance)
+
+    def get_index_of_batch(self, x, around_ok=False):
+        x = self._as_batch(x)[:, 0]
+        isin = (self.low <= x) & (self.high >= x)
+        if not isin.all():
+            raise error.OutOfSpace(f'{np.sum(~isin)} elements out of '
+                                   f'{len(x)} are not in the Segment')
+        index = self._get_closest_index_batch(x)
+        if not around_ok:
+            distance = np.abs(self._get_value_of_index(index) - x)
+            if not (distance <= self.tolerance).all():
+                raise error.NotOnGrid
+        return index.reshape((-1, 1))
+
+    def closest_in_batch(self, x):
+        x = self._as_batch(x)
+        return np.clip(x, self.low, self.high)
+
     @property
     def limits(self):
         return self.low, self.high
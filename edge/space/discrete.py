@@ -1,3 +1,4 @@
+import math
 import numpy as np
 
 from . import DiscretizableSpace
@@ -24,6 +25,8 @@ class Discrete(DiscretizableSpace):
         self.n = n
         self.start = self.__discretization[0,0]
         self.end = self.__discretization[-1,0]
+        # The discretization is evenly spaced, so the index of a value can be computed in closed form
+        self.__step = (self.end - self.start) / (n - 1) if n > 1 else 1.
 
     def __getitem__(self, index):
         if isinstance(index, np.ndarray):
@@ -41,10 +44,46 @@ class Discrete(DiscretizableSpace):
             raise TypeError('Index can only be numpy ndarray, int or slice, '
                             f'not {type(index)}')
 
+    def _get_closest_index(self, value):
+        """
+        Computes the index of the closest value in the discretization in O(1)
+        :param value: float: the value
+        :return: int: the index
+        """
+        if not np.isfinite(value):
+            # Infinite values are closest to an end of the discretization. NaN gives the first index, as np.argmin would
+            return self.n - 1 if value == np.inf else 0
+        # Ties are broken towards the lower index, as np.argmin would
+        index = math.ceil((value - self.start) / self.__step - 0.5)
+        return min(max(index, 0), self.n - 1)
+
+    def _get_closest_index_batch(self, x):
+        """
+        Computes the index of the closest value in the discretization in O(1) for each value
+        :param x: np.ndarray of shape (N,): the values
+        :return: np.ndarray<int> of shape (N,): the indexes
+        """
+        # Ties are broken towards the lower index, as np.argmin would
+        index = np.ceil((x - self.start) / self.__step - 0.5)
+        index[np.isnan(index)] = 0
+        return np.clip(index, 0, self.n - 1).astype(int)
+
+    def _get_index_and_membership_batch(self, x):
+        """
+        Computes the index of the closest value in the discretization, and whether the value is exactly on it
+        :param x: np.ndarray of shape (N,): the values
+        :return: np.ndarray<int> of shape (N,): the indexes, np.ndarray<bool> of shape (N,): whether each value is in
+            the space
+        """
+        index = self._get_closest_index_batch(x)
+        isin = self.__discretization[index, 0] == x
+        return index, isin
+
     def contains(self, x):
-        if x.shape != (1,):
+        if x.shape != (1,) or not np.isfinite(x[0]):
             return False
-        return x[0] in self.__discretization
+        index = self._get_closest_index(x[0])
+        return bool(self.__discretization[index, 0] == x[0])
 
     def is_on_grid(self, x):
         return x in self
@@ -53,10 +92,34 @@ class Discrete(DiscretizableSpace):
         if x not in self:
             raise error.OutOfSpace
 
-        return np.argmax(self.__discretization == x)
+        return self._get_closest_index(x[0])
 
     def closest_in(self, x):
-        return self[np.argmin(np.abs(self.__discretization - x))]
+        return self[self._get_closest_index(np.atleast_1d(x)[0])]
+
+    def get_element_of_index_batch(self, indexes):
+        indexes = np.asarray(indexes, dtype=int).reshape(-1)
+        return self.__discretization[indexes]
+
+    def contains_batch(self, x):
+        x = self._as_batch(x)[:, 0]
+        _, isin = self._get_index_and_membership_batch(x)
+        return isin
+
+    def is_on_grid_batch(self, x):
+        return self.contains_batch(x)
+
+    def get_index_of_batch(self, x, around_ok=False):
+        x = self._as_batch(x)[:, 0]
+        index, isin = self._get_index_and_membership_batch(x)
+        if not isin.all():
+            raise error.OutOfSpace(f'{np.sum(~isin)} elements out of '
+                                   f'{len(x)} are not in the Discrete space')
+        return index.reshape((-1, 1))
+
+    def closest_in_batch(self, x):
+        x = self._as_batch(x)[:, 0]
+        return self.__discretization[self._get_closest_index_batch(x)]
 
     @property
     def limits(self):
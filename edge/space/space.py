@@ -77,6 +77,14 @@ class DiscretizableSpace(Space):
         # are np.ndarrays of shape `(data_length,)`
         self.data_length = self.index_dim
 
+        # Elements can also be identified by a single integer, their flat index, which is their position when
+        # iterating over the space. The strides convert index tuples into flat indexes, as for C-ordered np.ndarrays
+        self.size = int(np.prod(self.index_shape))
+        strides = np.ones(self.index_dim, dtype=np.int64)
+        for d in range(self.index_dim - 2, -1, -1):
+            strides[d] = strides[d + 1] * self.index_shape[d + 1]
+        self.index_strides = strides
+
     @property
     def shape(self):
         return self.index_shape
@@ -109,22 +117,201 @@ class DiscretizableSpace(Space):
         """
         raise NotImplementedError
 
-    def sample_idx(self):
-        """Samples an index from the space
-        :return: tuple
+    def _get_values(self, index):
+        """
+        Returns the values of a 1-dimensional space at the given index as a 1-dimensional array. The output may be a
+        read-only view on data cached by the space, and should not be modified.
+        :param index: int, slice or np.ndarray: the index
+        :return: np.ndarray of shape (n,): the values
+        """
+        return np.atleast_1d(self[index]).reshape(-1)
+
+    def get_grid_view(self, index):
+        """
+        Same as indexing the space, but the output is read-only. Subclasses may use this to return views on cached data
+        instead of allocating a new array at every call. If you need to modify the output, copy it first.
+        :param index: the index
+        :return: np.ndarray: the read-only item
+        """
+        items = np.asarray(self[index])
+        if items.flags.writeable:
+            items = items.view()
+            items.flags.writeable = False
+        return items
+
+    def _as_batch(self, x):
+        """
+        Reshapes a list of elements of the space into an array of shape (N, data_length)
+        :param x: np.ndarray or list: the elements
+        :return: np.ndarray of shape (N, data_length)
+        """
+        x = np.asarray(x)
+        if x.ndim > 1 and x.shape[-1] != self.data_length:
+            raise ValueError(f'Size mismatch: expected size {self.data_length}'
+                             f', got {x.shape[-1]}')
+        return x.reshape((-1, self.data_length))
+
+    def contains_batch(self, x):
+        """
+        Batch version of `contains`. Subclasses should redefine this method with a vectorized implementation: this
+        one simply loops over the elements.
+        :param x: np.ndarray of shape (N, data_length): the elements
+        :return: np.ndarray<bool> of shape (N,): whether each element is in the space
+        """
+        x = self._as_batch(x)
+        return np.array([self.contains(xi) for xi in x], dtype=bool)
+
+    def is_on_grid_batch(self, x):
+        """
+        Batch version of `is_on_grid`. Subclasses should redefine this method with a vectorized implementation: this
+        one simply loops over the elements.
+        :param x: np.ndarray of shape (N, data_length): the elements
+        :return: np.ndarray<bool> of shape (N,): whether each element is on the discretization grid
+        """
+        x = self._as_batch(x)
+        return np.array([self.is_on_grid(xi) for xi in x], dtype=bool)
+
+    def get_index_of_batch(self, x, around_ok=False):
+        """
+        Batch version of `get_index_of`. Subclasses should redefine this method with a vectorized implementation: this
+        one simply loops over the elements.
+        Raises error.OutOfSpace if any element is out of the space, and error.NotOnGrid if around_ok is False and any
+        element is not on the grid.
+        :param x: np.ndarray of shape (N, data_length): the elements
+        :param around_ok: boolean: whether the elements should be exactly on the grid (False) or if some tolerance
+            is accepted (True)
+        :return: np.ndarray<int> of shape (N, index_dim): the indexes of the elements
+        """
+        x = self._as_batch(x)
+        index = [np.atleast_1d(self.get_index_of(xi, around_ok)) for xi in x]
+        return np.array(index, dtype=int).reshape((-1, self.index_dim))
+
+    def closest_in_batch(self, x):
+        """
+        Batch version of `closest_in`. Subclasses should redefine this method with a vectorized implementation: this
+        one simply loops over the elements.
+        :param x: np.ndarray of shape (N, data_length): the elements
+        :return: np.ndarray of shape (N, data_length): the closest elements in the space
+        """
+        x = self._as_batch(x)
+        closest = [self.closest_in(xi) for xi in x]
+        return np.array(closest, dtype=float).reshape((-1, self.data_length))
+
+    def get_element_of_index_batch(self, indexes):
+        """
+        Batch version of the indexing method, restricted to integer indexes. Subclasses should redefine this method
+        with a vectorized implementation: this one simply loops over the indexes.
+        :param indexes: np.ndarray<int> of shape (N, index_dim): the indexes
+        :return: np.ndarray of shape (N, data_length): the corresponding elements
+        """
+        indexes = np.asarray(indexes, dtype=int).reshape((-1, self.index_dim))
+        elements = [np.atleast_1d(self[tuple(index)]) for index in indexes]
+        return np.array(elements).reshape((-1, self.data_length))
+
+    @property
+    def flat_index_dtype(self):
+        """
+        The smallest integer type that can store all the flat indexes of the space. Useful to store compact arrays of
+        flat indexes.
+        :return: np.int32 or np.int64
+        """
+        return np.int32 if self.size <= np.iinfo(np.int32).max else np.int64
+
+    def ravel_index(self, index):
+        """
+        Converts indexes into flat indexes
+        :param index: int or tuple: a single index, or np.ndarray<int> of shape (N, index_dim): a list of indexes
+        :return: int if a single index was given, np.ndarray<int> of shape (N,) otherwise
+        """
+        is_single = isinstance(index, (tuple, int, np.integer))
+        index = np.asarray(index, dtype=np.int64).reshape((-1, self.index_dim))
+        if ((index < 0) | (index >= np.array(self.index_shape))).any():
+            raise IndexError(f'Index out of bounds for space of shape '
+                             f'{self.index_shape}')
+        flat_ids = index @ self.index_strides
+        if is_single:
+            return int(flat_ids[0])
+        return flat_ids
+
+    def unravel_index(self, flat_ids):
+        """
+        Converts flat indexes into indexes
+        :param flat_ids: int: a single flat index, or np.ndarray<int> of shape (N,): a list of flat indexes
+        :return: if a single flat index was given, an int (1-dimensional index) or a tuple, with the same convention as
+            get_index_of. Otherwise, np.ndarray<int> of shape (N, index_dim)
+        """
+        is_single = isinstance(flat_ids, (int, np.integer))
+        flat_ids = np.asarray(flat_ids, dtype=np.int64).reshape((-1, 1))
+        if ((flat_ids < 0) | (flat_ids >= self.size)).any():
+            raise IndexError(f'Flat index out of bounds for space of size '
+                             f'{self.size}')
+        index = (flat_ids // self.index_strides) % np.array(self.index_shape)
+        if is_single:
+            index = tuple(index[0].tolist())
+            return index[0] if self.index_dim == 1 else index
+        return index
+
+    def flat_index_of(self, x, around_ok=False):
+        """
+        Returns the flat indexes of a list of elements. See get_index_of_batch.
+        :param x: np.ndarray of shape (N, data_length): the elements
+        :param around_ok: boolean: whether the elements should be exactly on the grid (False) or if some tolerance
+            is accepted (True)
+        :return: np.ndarray<int> of shape (N,): the flat indexes of the elements
+        """
+        return self.ravel_index(self.get_index_of_batch(x, around_ok))
+
+    def element_at_flat(self, flat_ids):
         """
-        ids = tuple(map(np.random.choice, self.index_shape))
-        if len(ids) == 1:
-            return ids[0]
+        Returns the elements corresponding to a list of flat indexes
+        :param flat_ids: np.ndarray<int> of shape (N,): the flat indexes
+        :return: np.ndarray of shape (N, data_length): the elements
+        """
+        return self.get_element_of_index_batch(
+            self.unravel_index(np.atleast_1d(flat_ids))
+        )
+
+    def iter_blocks(self, block_size):
+        """
+        Iterates over the space by contiguous blocks of elements, in the same order as iter(self).
+        :param block_size: the maximal number of elements in a block
+        :return: DiscretizableSpaceBlockIterator
+        """
+        return DiscretizableSpaceBlockIterator(self, block_size)
+
+    def sample_idx(self, n=None, rng=None):
+        """Samples an index from the space, or a batch of indexes
+        :param n: optional: the number of indexes to sample. If None, a single index is sampled
+        :param rng: optional: the np.random.Generator to sample from. If None, NumPy's global random state is used
+        :return: tuple (or int if index_dim is 1) if n is None, otherwise np.ndarray<int> of shape (n, index_dim)
+        """
+        if n is None:
+            if rng is None:
+                ids = tuple(map(np.random.choice, self.index_shape))
+            else:
+                ids = tuple(int(rng.integers(l_k)) for l_k in self.index_shape)
+            if len(ids) == 1:
+                return ids[0]
+            else:
+                return ids
+
+        high = np.array(self.index_shape)
+        size = (n, self.index_dim)
+        if rng is None:
+            return np.random.randint(0, high, size=size)
         else:
-            return ids
+            return rng.integers(0, high, size=size)
 
-    def sample(self):
-        """Samples an element from the space
-        :return: np.ndarray
+    def sample(self, n=None, rng=None):
+        """Samples an element from the space, or a batch of elements
+        :param n: optional: the number of elements to sample. If None, a single element is sampled
+        :param rng: optional: the np.random.Generator to sample from. If None, NumPy's global random state is used
+        :return: np.ndarray: the element if n is None, otherwise an array of shape (n, data_length)
         """
-        k = self.sample_idx()
-        return self[k]
+        if n is None:
+            k = self.sample_idx(rng=rng)
+            return self[k]
+        return self.get_element_of_index_batch(self.sample_idx(n, rng))
 
     def __iter__(self):
         """
@@ -160,10 +347,55 @@ class DiscretizableSpaceIterator:
         return (index, data)
 
 
+class DiscretizableSpaceBlockIterator:
+    """
+    An iterator over a DiscretizableSpace that yields contiguous blocks of elements instead of single elements. The
+    elements are identified by their flat index, i.e., their position when iterating over the space with iter(space).
+    Only one block is in memory at a time.
+    """
+    def __init__(self, space, block_size):
+        """
+        :param space: the DiscretizableSpace
+        :param block_size: the maximal number of elements in a block
+        """
+        if block_size < 1:
+            raise ValueError(f'Block size should be positive, got {block_size}')
+        self.space = space
+        self.block_size = int(block_size)
+        self.n_elements = space.size
+        self.current = 0
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        """
+        :return: the total number of blocks
+        """
+        return -(-self.n_elements // self.block_size)
+
+    def __next__(self):
+        """
+        Next block
+        :return: tuple<(np.ndarray, np.ndarray)>. The first item is the array of the flat indexes of the block, of shape
+            (n,), and the second is the array of the elements of the block, of shape (n, data_length)
+        """
+        if self.current >= self.n_elements:
+            raise StopIteration
+        end = min(self.current + self.block_size, self.n_elements)
+        flat_ids = np.arange(self.current, end)
+        self.current = end
+        elements = self.space.element_at_flat(flat_ids)
+        return flat_ids, elements
+
+
 class ProductSpace(DiscretizableSpace):
     """
     Handles product of spaces. This class mainly implements the __getitem__ method, and provides some helper functions.
     """
+    # Maximal number of bytes of grids kept in memory by get_grid_view. Larger grids are not cached
+    GRID_VIEW_CACHE_BYTES = 2 ** 27
+
     def __init__(self, *sets):
         """
         Initializer
@@ -194,6 +426,9 @@ class ProductSpace(DiscretizableSpace):
             self._index_slices[ns] = slice(current_index, end_index)
             current_index = end_index
 
+        self._grid_view_cache = {}
+        self._grid_view_cache_nbytes = 0
+
     def __getitem__(self, index):
         """
         The indexing method. Indexes are tuples, and each element should be one of the following:
@@ -212,6 +447,73 @@ class ProductSpace(DiscretizableSpace):
         :param index: tuple: the index
         :return: np.ndarray
         """
+        return self._get_items(index)
+
+    def get_grid_view(self, index):
+        """
+        Grid-view mode of the indexing method. The output is the same as self[index], but it is read-only, and grids
+        that are only indexed with integers and slices are cached: querying the same grid again does not allocate
+        anything. If you need to modify the output, copy it first.
+        :param index: tuple: the index. See ProductSpace.__getitem__
+        :return: np.ndarray: the read-only item
+        """
+        key = self._get_grid_view_key(index)
+        if key is None:
+            items = self._get_items(index)
+        else:
+            items = self._grid_view_cache.get(key)
+            if items is None:
+                items = self._get_items(index)
+                if items.nbytes <= self.GRID_VIEW_CACHE_BYTES:
+                    self._cache_grid_view(key, items)
+        if items.flags.writeable:
+            items = items.view()
+            items.flags.writeable = False
+        return items
+
+    def _cache_grid_view(self, key, items):
+        """
+        Stores a grid in the cache of get_grid_view, and evicts the oldest grids until the cache fits in
+        GRID_VIEW_CACHE_BYTES
+        :param key: the key of the grid (see _get_grid_view_key)
+        :param items: np.ndarray: the grid
+        """
+        self._grid_view_cache[key] = items
+        self._grid_view_cache_nbytes += items.nbytes
+        while self._grid_view_cache_nbytes > self.GRID_VIEW_CACHE_BYTES:
+            # Dictionaries are ordered: this evicts the oldest grid
+            oldest_key = next(iter(self._grid_view_cache))
+            self._grid_view_cache_nbytes -= \
+                self._grid_view_cache.pop(oldest_key).nbytes
+
+    def _get_grid_view_key(self, index):
+        """
+        Computes a hashable key identifying the grid described by the index. Only indexes made of integers and
+        slices are supported, since values given as np.ndarrays are unlikely to be queried again.
+        :param index: the index
+        :return: tuple or None: the key, or None if the index should not be cached
+        """
+        if not isinstance(index, tuple):
+            index = tuple([index])
+        if len(index) > self._n_flattened_sets:
+            return None
+        key = []
+        for ns, index_ns in enumerate(index):
+            n_points = self._flattened_sets[ns].index_shape[0]
+            if isinstance(index_ns, slice):
+                key.append(index_ns.indices(n_points))
+            elif isinstance(index_ns, (int, np.integer)):
+                key.append(int(index_ns) % n_points)
+            else:
+                return None
+        return tuple(key)
+
+    def _get_items(self, index):
+        """
+        Builds the output of the indexing method. See ProductSpace.__getitem__
+        :param index: tuple: the index
+        :return: np.ndarray
+        """
         if isinstance(index, np.ndarray):
             if index in self:
                 return index
@@ -230,12 +532,12 @@ class ProductSpace(DiscretizableSpace):
         def get_dim(ns):
             """
             Queries the set corresponding to dimension ns with its corresponding index. In general, the set is
-            1-dimensional (Segment or Discrete), since it is a flattened set. Then, the output is of shape (n,1), where
+            1-dimensional (Segment or Discrete), since it is a flattened set. Then, the output is of shape (n,), where
             n is the number of values required by the index
             :param ns: the number of the dimension
             :return: np.ndarray: the elements corresponding to the index on that dimension
             """
-            return np.atleast_1d(self._flattened_sets[ns][index[ns]])
+            return self._flattened_sets[ns]._get_values(index[ns])
 
         def isnotslice(x):
             """
@@ -248,35 +550,33 @@ class ProductSpace(DiscretizableSpace):
         list_of_items = list(map(get_dim, list(range(self._n_flattened_sets))))
         item_is_1d = list(map(isnotslice, index))
 
-        # NumPy limits the dimension of arrays to 32, so we need to be careful when meshgridding, and only extend
+        # NumPy limits the dimension of arrays to 32, so we need to be careful when building the grid, and only extend
         # the dimensions along which the user has asked for more than 1 value (i.e., a slice)
         items_multidimensional = [item for item, is_1d in zip(list_of_items, item_is_1d) if not is_1d]
         if len(items_multidimensional) > 0:
-            items_multidimensional_meshgrid = np.meshgrid(*items_multidimensional, indexing='ij')
-            items_shape = items_multidimensional_meshgrid[0].shape
+            items_shape = tuple([len(item) for item in items_multidimensional])
+            # Fixed dimensions used to be filled with `value * np.ones`, which casts them to float
+            dtypes = [item.dtype for item in items_multidimensional]
+            if any(item_is_1d):
+                dtypes.append(float)
+            # Instead of meshgridding and stacking, which allocates several copies of the grid, we allocate the output
+            # once and fill each dimension with a broadcast view of its values
+            items = np.empty(items_shape + (self._n_flattened_sets,),
+                             dtype=np.result_type(*dtypes))
             idx_in_multidim = 0
             for item_index in range(len(list_of_items)):
                 if not item_is_1d[item_index]:
-                    list_of_items[item_index] = items_multidimensional_meshgrid[idx_in_multidim]
+                    broadcast_shape = [1] * len(items_shape)
+                    broadcast_shape[idx_in_multidim] = -1
+                    items[..., item_index] = list_of_items[item_index].reshape(broadcast_shape)
                     idx_in_multidim += 1
                 else:
                     assert list_of_items[item_index].shape == (1,)
-                    value = list_of_items[item_index][0]
-                    list_of_items[item_index] = value * np.ones(items_shape)
-            items = np.stack(list_of_items, axis=-1)
+                    items[..., item_index] = list_of_items[item_index][0]
         else:
             # squeeze returns a np scalar if the input is of shape (1,), so we ensure it is still an array
             items = np.atleast_1d(np.stack(list_of_items, axis=0).squeeze())
 
-        # squeeze_dim = list(map(isnotslice, index))
-        #
-        # items_meshgrid = np.meshgrid(*list_of_items, indexing='ij')
-        # items = np.stack(items_meshgrid, axis=-1)
-        #
-        # dims_to_squeeze = tuple([dim
-        #                         for dim in range(len(squeeze_dim))
-        #                         if squeeze_dim[dim]])
-        # items = np.squeeze(items, axis=dims_to_squeeze)
         return items
 
     def _get_components(self, x, ns):
@@ -334,6 +634,50 @@ class ProductSpace(DiscretizableSpace):
             y[mask] = self.sets[ns].closest_in(x[mask])
         return y
 
+    def get_element_of_index_batch(self, indexes):
+        indexes = np.asarray(indexes, dtype=int).reshape((-1, self.index_dim))
+        elements = np.empty((indexes.shape[0], self.data_length))
+        for ns in range(self.n_sets):
+            index_slice = self._index_slices[ns]
+            elements[:, index_slice] = self.sets[ns].get_element_of_index_batch(
+                indexes[:, index_slice]
+            )
+        return elements
+
+    def contains_batch(self, x):
+        x = self._as_batch(x)
+        isin = np.ones(x.shape[0], dtype=bool)
+        for ns in range(self.n_sets):
+            x_slice = x[:, self._index_slices[ns]]
+            isin &= self.sets[ns].contains_batch(x_slice)
+        return isin
+
+    def is_on_grid_batch(self, x):
+        x = self._as_batch(x)
+        ison = np.ones(x.shape[0], dtype=bool)
+        for ns in range(self.n_sets):
+            x_slice = x[:, self._index_slices[ns]]
+            ison &= self.sets[ns].is_on_grid_batch(x_slice)
+        return ison
+
+    def get_index_of_batch(self, x, around_ok=False):
+        x = self._as_batch(x)
+        index = np.empty((x.shape[0], self.index_dim), dtype=int)
+        for ns in range(self.n_sets):
+            index_slice = self._index_slices[ns]
+            index[:, index_slice] = self.sets[ns].get_index_of_batch(
+                x[:, index_slice], around_ok
+            )
+        return index
+
+    def closest_in_batch(self, x):
+        x = self._as_batch(x)
+        y = np.array(x, dtype=float)
+        for ns in range(self.n_sets):
+            mask = self._index_slices[ns]
+            y[:, mask] = self.sets[ns].closest_in_batch(x[:, mask])
+        return y
+
     @property
     def limits(self):
         limits = [None] * self._n_flattened_sets
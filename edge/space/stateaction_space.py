@@ -17,6 +17,11 @@ class StateActionSpace(ProductSpace):
             index = self.get_stateaction(*index)
         return super(StateActionSpace, self).__getitem__(index)
 
+    def get_grid_view(self, index):
+        if isinstance(index, tuple) and len(index) == 2:
+            index = self.get_stateaction(*index)
+        return super(StateActionSpace, self).get_grid_view(index)
+
     @staticmethod
     def from_product(product_space):
         """
@@ -62,6 +67,17 @@ class StateActionSpace(ProductSpace):
         """
         return (self.get_state(stateaction), self.get_action(stateaction))
 
+    def get_tuple_batch(self, stateactions):
+        """
+        Splits a list of StateActionSpace elements into a list of states and a list of actions
+        :param stateactions: np.ndarray of shape (N, data_length): the stateactions
+        :return: tuple: np.ndarray of shape (N, state_space.data_length), np.ndarray of shape
+            (N, action_space.data_length): the states and the actions
+        """
+        stateactions = self._as_batch(stateactions)
+        return (stateactions[:, self._index_slices[0]],
+                stateactions[:, self._index_slices[1]])
+
     def get_state_index(self, stateaction_index):
         """
         Extracts the index of the state in its original space from a stateaction index
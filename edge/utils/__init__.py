@@ -1,3 +1,4 @@
 from .bind_utils import bind
+from .map_computation import compute_map_by_shards
 from .gp_utils import atleast_2d, constraint_from_tuple, dynamically_import
 from .vibly_compatibility_utils import get_parameters_lookup_dictionary
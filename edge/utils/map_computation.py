@@ -0,0 +1,195 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Default number of blocks of stateactions in one shard
+BLOCKS_PER_SHARD = 16
+# Name of the file describing what the shards of a shard directory were computed with
+SHARD_METADATA = 'shards.json'
+
+# Arguments of _compute_shard that are common to all shards. They are set once per worker process, so they do not need
+# to be sent with every task
+_worker_arguments = None
+
+
+def _initialize_worker(*arguments):
+    global _worker_arguments
+    _worker_arguments = arguments
+
+
+def _shard_path(shard_directory, start, stop):
+    return Path(shard_directory) / f'shard_{start}_{stop}.npz'
+
+
+def _serialize_parameter(value):
+    """
+    Makes the values that JSON does not support serializable when computing the fingerprint of shards. The
+    representation of NumPy arrays is truncated when they are large, so arrays are described by their content instead
+    :param value: the value
+    :return: a serializable description of the value
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        value = np.ascontiguousarray(value)
+        return {
+            'dtype': value.dtype.str,
+            'shape': value.shape,
+            'sha256': hashlib.sha256(value.tobytes()).hexdigest(),
+        }
+    return str(value)
+
+
+def _shard_fingerprint(stateaction_space, shard_size, parameters=None):
+    """
+    Hashes what the shards of a map depend on: the stateaction space, the parameters of the dynamics, and the shard size
+    :param stateaction_space: the StateActionSpace
+    :param shard_size: the number of stateactions in one shard
+    :param parameters: dictionary or None: the parameters of the dynamics
+    :return: str: the hexadecimal digest
+    """
+    description = {
+        'shape': stateaction_space.shape,
+        'limits': stateaction_space.limits,
+        'shard_size': shard_size,
+        'parameters': parameters,
+    }
+    serialized = json.dumps(description, sort_keys=True,
+                            default=_serialize_parameter)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def _prepare_shard_directory(shard_directory, fingerprint):
+    """
+    Creates the shard directory, or checks that the shards it holds were computed with the same fingerprint. If they
+    were not, or if the directory has no metadata, the shards are deleted since they cannot be reused
+    :param shard_directory: Path: the shard directory
+    :param fingerprint: the output of _shard_fingerprint
+    """
+    shard_directory.mkdir(parents=True, exist_ok=True)
+    metadata_path = shard_directory / SHARD_METADATA
+    if metadata_path.exists():
+        with open(metadata_path) as f:
+            if json.load(f).get('fingerprint') == fingerprint:
+                return
+    for stale_shard in shard_directory.glob('shard_*.npz*'):
+        stale_shard.unlink()
+    tmp_path = metadata_path.with_name(metadata_path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'fingerprint': fingerprint}, f)
+    os.replace(tmp_path, metadata_path)
+
+
+def _compute_shard(compute_block, stateaction_space, start, stop, block_size):
+    """
+    Computes the map on the stateactions whose flat indexes are in [start, stop), by blocks of block_size stateactions
+    :return: np.ndarray, np.ndarray<float32>, np.ndarray<bool>: the flat indexes of the next states, the next states,
+        and the failure flags
+    """
+    state_space = stateaction_space.state_space
+    next_state_ids = np.empty(stop - start, dtype=state_space.flat_index_dtype)
+    next_states = np.empty((stop - start, state_space.data_length),
+                           dtype=np.float32)
+    failures = np.empty(stop - start, dtype=bool)
+    for block_start in range(start, stop, block_size):
+        block_stop = min(block_start + block_size, stop)
+        stateactions = stateaction_space.element_at_flat(
+            np.arange(block_start, block_stop)
+        )
+        block = slice(block_start - start, block_stop - start)
+        next_state_ids[block], next_states[block], failures[block] = \
+            compute_block(stateactions)
+    return next_state_ids, next_states, failures
+
+
+def _save_shard(path, next_state_ids, next_states, failures):
+    # The shard is written to a temporary file first and then renamed: a shard that exists on disk is always complete,
+    # even if the computation is interrupted while writing it
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, next_state_ids=next_state_ids, next_states=next_states,
+                 failures=failures)
+    os.replace(tmp_path, path)
+
+
+def _load_shard(path):
+    with np.load(path) as shard:
+        return shard['next_state_ids'], shard['next_states'], shard['failures']
+
+
+def _run_shard(task, arguments=None):
+    compute_block, stateaction_space, block_size = \
+        _worker_arguments if arguments is None else arguments
+    start, stop, path = task
+    results = _compute_shard(compute_block, stateaction_space, start, stop,
+                             block_size)
+    if path is not None:
+        _save_shard(path, *results)
+    return (start, stop) + results
+
+
+def compute_map_by_shards(compute_block, stateaction_space, block_size,
+                          transition_map, n_workers=None,
+                          shard_directory=None, shard_size=None,
+                          parameters=None):
+    """
+    Computes a transition map over the whole stateaction space. The flat indexes of the stateaction space are split in
+    shards, which are computed by a pool of worker processes. If a shard directory is given, the result of each shard is
+    saved there as soon as it is computed, and shards that are already on disk are loaded instead of being computed
+    again: an interrupted computation can then be resumed by calling this function again with the same parameters.
+    The shard directory records a fingerprint of the stateaction space, the parameters and the shard size (see
+    _shard_fingerprint). Shards computed with another fingerprint are deleted and computed again.
+    :param compute_block: function taking a np.ndarray of shape (N, stateaction_space.data_length) of stateactions and
+        returning the flat indexes of the next states (N,), the next states (N, state_space.data_length), and the
+        failure flags (N,). It should be picklable if the processes are not started by forking
+    :param stateaction_space: the StateActionSpace
+    :param block_size: the number of stateactions passed at once to compute_block
+    :param transition_map: the edge.dynamics.TransitionMap where the results are written
+    :param n_workers: the number of worker processes. If None or 1, the shards are computed in the current process
+    :param shard_directory: the directory where the shards are saved. If None, the shards are not saved
+    :param shard_size: the number of stateactions in one shard. Defaults to BLOCKS_PER_SHARD * block_size
+    :param parameters: dictionary or None: the parameters of the dynamics, used to check that the shards on disk can
+        be reused
+    :return: the transition map
+    """
+    if shard_size is None:
+        shard_size = BLOCKS_PER_SHARD * block_size
+    size = stateaction_space.size
+
+    if shard_directory is not None:
+        shard_directory = Path(shard_directory)
+        _prepare_shard_directory(
+            shard_directory,
+            _shard_fingerprint(stateaction_space, shard_size, parameters)
+        )
+
+    tasks = []
+    for start in range(0, size, shard_size):
+        stop = min(start + shard_size, size)
+        path = None
+        if shard_directory is not None:
+            path = _shard_path(shard_directory, start, stop)
+            if path.exists():
+                transition_map.write(start, stop, *_load_shard(path))
+                continue
+        tasks.append((start, stop, path))
+
+    arguments = (compute_block, stateaction_space, block_size)
+    if n_workers is None or n_workers <= 1:
+        for task in tasks:
+            transition_map.write(*_run_shard(task, arguments))
+    else:
+        # Forking lets the workers inherit the arguments instead of unpickling them
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            'fork' if 'fork' in methods else None
+        )
+        with context.Pool(n_workers, initializer=_initialize_worker,
+                          initargs=arguments) as pool:
+            for results in pool.imap_unordered(_run_shard, tasks):
+                transition_map.write(*results)
+
+    transition_map.flush()
+    return transition_map
@@ -30,6 +30,9 @@ AGENT_CONSTRUCTOR = {
     SAFETY_VALUES_SWITCHER: SafetyQLearningSwitcher,
 }
 VIBLY_DATA_PATH = Path('../../data/ground_truth/from_vibly')
+# Vibly files are converted once to the compact format of SafetyTruth.save, and loaded from there afterwards. The
+# converted files are written with the other results, so the tracked data directory stays untouched
+VIBLY_CACHE_PATH = Path(__file__).absolute().parent / 'results' / 'vibly_cache'
 SAFETY_TRUTH_PATH = {
     LOW_GOAL_SLIP: VIBLY_DATA_PATH / 'slip_map.pickle',
     PENALIZED_SLIP: VIBLY_DATA_PATH / 'slip_map.pickle',
@@ -88,7 +91,9 @@ class BenchmarkSingleSimulation(ModelLearningSimulation):
         safety_truth_path = SAFETY_TRUTH_PATH[envname]
         if envname in SAFETY_TRUTH_FROM_VIBLY:
             self.safety_truth = SafetyTruth(self.env)
-            self.safety_truth.from_vibly_file(safety_truth_path)
+            self.safety_truth.from_vibly_file(
+                safety_truth_path, cache_directory=VIBLY_CACHE_PATH
+            )
         else:
             self.safety_truth = SafetyTruth.load(safety_truth_path, self.env)
 
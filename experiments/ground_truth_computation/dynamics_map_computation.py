@@ -1,8 +1,8 @@
 from pathlib import Path
 import logging
 logger = logging.getLogger(__name__)
+import os
 import time
-from numpy import save as npsave
 
 from edge.envs import ContinuousCartPole
 from edge.utils.logging import config_msg
@@ -12,7 +12,8 @@ from ground_truth_computation_parameterization import \
 
 
 class DynamicsMapComputation(TruthComputationSimulation):
-    def __init__(self, name, env_name, discretization_shape, *args, **kwargs):
+    def __init__(self, name, env_name, discretization_shape, *args,
+                 n_workers=None, **kwargs):
         if env_name == 'cartpole':
             env_builder = ContinuousCartPole
         else:
@@ -25,23 +26,31 @@ class DynamicsMapComputation(TruthComputationSimulation):
             output_directory, name, Q_map_name(env_name)
         )
         self.save_path = self.output_directory / Q_map_name(env_name)
+        # The map is computed by shards saved in this directory, so an interrupted computation resumes where it stopped
+        self.shard_directory = self.output_directory / 'shards'
+        self.n_workers = n_workers if n_workers is not None else os.cpu_count()
 
         self.Q_map = None
         logger.info(config_msg(f"env_name='{env_name}'"))
         logger.info(
             config_msg(f"discretization_shape='{discretization_shape}'")
         )
+        logger.info(config_msg(f"n_workers={self.n_workers}"))
         logger.info((config_msg(f"args={args}")))
         logger.info((config_msg(f"kwargs={kwargs}")))
 
     def run(self):
         logger.info('Launched computation of dynamics map')
         tick = time.time()
-        self.Q_map = self.env.compute_dynamics_map()
+        # The map is written to memory-mapped files in save_path as it is computed
+        self.Q_map = self.env.compute_transition_map(
+            path=self.save_path,
+            n_workers=self.n_workers,
+            shard_directory=self.shard_directory
+        )
         tock = time.time()
         logger.info(f'Done in {tock-tick:.2f} s.')
-        npsave(str(self.save_path), self.Q_map, allow_pickle=True)
-        logger.info(f'Output saved in {str(self.save_path)}.npy')
+        logger.info(f'Output saved in {str(self.save_path)}')
 
 
 if __name__ == '__main__':
@@ -14,7 +14,8 @@ from ground_truth_computation_parameterization import \
 
 
 class SafetyTruthComputation(TruthComputationSimulation):
-    def __init__(self, name, env_name, discretization_shape, *args, **kwargs):
+    def __init__(self, name, env_name, discretization_shape, *args,
+                 memory_budget=None, **kwargs):
         if env_name == 'cartpole':
             env_builder = ContinuousCartPole
         else:
@@ -27,15 +28,18 @@ class SafetyTruthComputation(TruthComputationSimulation):
         self.env = env_builder(discretization_shape=discretization_shape,
                                *args, **kwargs)
         self.truth = SafetyTruth(self.env)
+        # If not None, the ground truth is computed out of core, and its arrays are written in save_path directly
+        self.memory_budget = memory_budget
 
-        self.Q_map_path = self.output_directory / (str(Q_map_name(env_name)) +
-                                                   '.npy')
+        # Directory where the transition map is stored (see edge.dynamics.TransitionMap)
+        self.Q_map_path = self.output_directory / Q_map_name(env_name)
         self.save_path = self.output_directory / safety_name(env_name)
 
         logger.info(config_msg(f"env_name='{env_name}'"))
         logger.info(
             config_msg(f"discretization_shape='{discretization_shape}'")
         )
+        logger.info(config_msg(f"memory_budget={memory_budget}"))
         logger.info((config_msg(f"args={args}")))
         logger.info((config_msg(f"kwargs={kwargs}")))
 
@@ -47,10 +51,16 @@ class SafetyTruthComputation(TruthComputationSimulation):
             logger.critical(errormsg)
             raise FileNotFoundError(errormsg)
         tick = time.time()
-        self.truth.compute(self.Q_map_path)
+        if self.memory_budget is None:
+            self.truth.compute(self.Q_map_path)
+        else:
+            self.truth.compute(self.Q_map_path, method='chunked',
+                               memory_budget=self.memory_budget,
+                               output_directory=self.save_path)
         tock = time.time()
         logger.info(f'Done in {tock - tick:.2f} s.')
-        self.truth.save(str(self.save_path))
+        if self.memory_budget is None:
+            self.truth.save(str(self.save_path))
         logger.info(f'Output saved in {str(self.save_path)}')
 
 
@@ -176,6 +176,40 @@ class HovershipTests(unittest.TestCase):
                 self.assertTrue(abs(previous_state[0] - new_state[0]) < TOL)
             previous_state, state = state, new_state
 
+    def test_rk4_integrator(self):
+        TOL = 1e-3
+        parameters = {
+            'ground_gravity': 0.1,
+            'gravity_gradient': 1,
+            'control_frequency': 1,
+            'max_thrust': 0.8,
+            'max_altitude': 2,
+            'shape': (20, 15)
+        }
+        reference = HovershipDynamics(**parameters)
+        hovership_dynamics = HovershipDynamics(integrator='rk4', **parameters)
+        self.assertTrue(hovership_dynamics.has_step_batch)
+
+        stateactions = hovership_dynamics.stateaction_space[:, :].reshape(
+            (-1, 2)
+        )
+        states, actions = hovership_dynamics.stateaction_space.get_tuple_batch(
+            stateactions
+        )
+        new_states, feasible = hovership_dynamics.step_batch(states, actions)
+        reference_states, reference_feasible = reference.step_batch(states,
+                                                                    actions)
+        self.assertTrue(np.abs(new_states - reference_states).max() < TOL)
+        self.assertTrue(np.all(feasible == reference_feasible))
+        # Some transitions stop at the ceiling
+        self.assertTrue(np.any(new_states[:, 0] == 2))
+
+        new_state, _ = hovership_dynamics.step(states[7], actions[7])
+        self.assertTrue(np.all(new_state == new_states[7]))
+
+        with self.assertRaises(ValueError):
+            HovershipDynamics(integrator='euler', **parameters)
+
 
 class DiscreteHovershipTests(unittest.TestCase):
     def test_still_hovership(self):
@@ -266,3 +300,64 @@ class DiscreteHovershipTests(unittest.TestCase):
             if previous_state is not None:
                 self.assertEqual(previous_state[0], new_state[0])
             previous_state, state = state, new_state
+
+
+class TransitionCacheTests(unittest.TestCase):
+    def get_dynamics(self):
+        return DiscreteHovershipDynamics(
+            ground_gravity=1,
+            gravity_gradient=1,
+            max_thrust=5,
+            max_altitude=10,
+            minimum_gravity_altitude=9,
+            maximum_gravity_altitude=3,
+        )
+
+    def test_cached_step(self):
+        reference = self.get_dynamics()
+        hovership_dynamics = self.get_dynamics()
+        hovership_dynamics.enable_transition_cache(max_size=3)
+        cache = hovership_dynamics.transition_cache
+
+        stateactions = [(np.atleast_1d(s), np.atleast_1d(a))
+                        for s, a in [(5, 2), (5, 2), (3, 1), (8, 0), (1, 4),
+                                     (5, 2)]]
+        for state, action in stateactions:
+            new_state, feasible = hovership_dynamics.step(state, action)
+            reference_state, reference_feasible = reference.step(state,
+                                                                 action)
+            self.assertTrue(np.all(new_state == reference_state))
+            self.assertEqual(feasible, reference_feasible)
+        # The first repetition is a hit, and (5, 2) is evicted before the
+        # second one
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 5)
+        self.assertEqual(len(cache), 3)
+
+        hovership_dynamics.disable_transition_cache()
+        self.assertIsNone(hovership_dynamics.transition_cache)
+        self.assertNotIn('step', hovership_dynamics.__dict__)
+
+    def test_preloaded_cache(self):
+        hovership_dynamics = self.get_dynamics()
+        Q_map = hovership_dynamics.compute_map()
+        hovership_dynamics.enable_transition_cache(Q_map=Q_map)
+        cache = hovership_dynamics.transition_cache
+        # The transitions are read from the map when they are queried
+        self.assertEqual(len(cache), 0)
+
+        reference = self.get_dynamics()
+        for _, stateaction in iter(hovership_dynamics.stateaction_space):
+            state, action = hovership_dynamics.stateaction_space.get_tuple(
+                stateaction
+            )
+            new_state, _ = hovership_dynamics.step(state, action)
+            reference_state, _ = reference.step(state, action)
+            self.assertTrue(np.all(new_state == reference_state))
+        self.assertEqual(cache.misses, 0)
+        self.assertEqual(cache.hits, Q_map.size)
+        self.assertEqual(len(cache), Q_map.size)
+
+        # The cache is always bounded
+        with self.assertRaises(ValueError):
+            hovership_dynamics.enable_transition_cache(max_size=None)
@@ -2,7 +2,9 @@ from numpy import atleast_1d
 
 import unittest
 
-from edge.envs import Hovership, DiscreteHovership
+import numpy as np
+
+from edge.envs import Hovership, DiscreteHovership, Slip, VectorEnvironment
 
 
 class TestHovership(unittest.TestCase):
@@ -46,6 +48,38 @@ class TestHovership(unittest.TestCase):
             s, r, failed = hovership.step(atleast_1d(0.))
             self.assertTrue(s in hovership.stateaction_space.state_space)
 
+    def test_trusted_mode(self):
+        class CountingHovership(Hovership):
+            n_failure_checks = 0
+
+            def is_failure_state(self, state):
+                CountingHovership.n_failure_checks += 1
+                return super(CountingHovership, self).is_failure_state(state)
+
+        reference = Hovership()
+        hovership = CountingHovership()
+        hovership.trusted = True
+        self.assertFalse(hovership.dynamics.validate)
+
+        CountingHovership.n_failure_checks = 0
+        for t in range(5):
+            s, r, failed = hovership.step(atleast_1d(0.))
+            reference_s, reference_r, reference_failed = reference.step(
+                atleast_1d(0.)
+            )
+            self.assertEqual(s, reference_s)
+            self.assertEqual(r, reference_r)
+            self.assertEqual(failed, reference_failed)
+            self.assertEqual(hovership.done, reference.done)
+        # The failure flag is computed at most once per step
+        self.assertLessEqual(CountingHovership.n_failure_checks, 5)
+
+        hovership.reset(atleast_1d(0))
+        self.assertTrue(hovership.has_failed)
+
+        hovership.trusted = False
+        self.assertTrue(hovership.dynamics.validate)
+
     def routine(self, hovership, initial_state):
         self.assertTrue(not hovership.in_failure_state)
         self.assertTrue(hovership.feasible)
@@ -147,5 +181,64 @@ class TestDiscreteHovership(unittest.TestCase):
         self.assertTrue(hovership.in_failure_state)
 
 
+class TestVectorEnvironment(unittest.TestCase):
+    def test_lockstep(self):
+        env = DiscreteHovership(steps_done_threshold=4)
+        vector_env = VectorEnvironment(env, n_envs=3)
+        self.assertEqual(vector_env.s.shape, (3, 1))
+        self.assertTrue(np.all(vector_env.s == env.default_initial_state))
+
+        thrusts = [0, 2, 5]
+        references = [DiscreteHovership(steps_done_threshold=4)
+                      for _ in thrusts]
+        actions = np.array(thrusts, dtype=float).reshape((-1, 1))
+        for t in range(3):
+            s, rewards, failed, done = vector_env.step(actions)
+            for n, reference in enumerate(references):
+                reference_s, reference_r, reference_failed = reference.step(
+                    atleast_1d(float(thrusts[n]))
+                )
+                self.assertEqual(s[n, 0], reference_s[0])
+                self.assertEqual(rewards[n], reference_r)
+                self.assertEqual(failed[n], reference_failed)
+                self.assertEqual(done[n], reference.done)
+
+    def test_auto_reset(self):
+        env = DiscreteHovership()
+        vector_env = VectorEnvironment(env, n_envs=2)
+        actions = np.array([[0.], [5.]])
+        for t in range(20):
+            s, rewards, failed, done = vector_env.step(actions)
+            if done[0]:
+                break
+        else:
+            self.assertTrue(False)
+        # The first ship fell and was reset, the second one is still flying
+        self.assertTrue(failed[0])
+        self.assertEqual(vector_env.final_states[0, 0], 0)
+        self.assertEqual(s[0, 0], env.default_initial_state[0])
+        self.assertEqual(vector_env.n_steps[0], 0)
+        self.assertFalse(failed[1])
+        self.assertEqual(vector_env.n_steps[1], t + 1)
+
+        vector_env.reset(mask=np.array([False, True]), s=[[3.]])
+        self.assertEqual(vector_env.s[1, 0], 3)
+        self.assertEqual(vector_env.n_steps[1], 0)
+
+    def test_loop_fallback(self):
+        env = Hovership(random_start=True)
+        vector_env = VectorEnvironment(env, n_envs=4, auto_reset=False)
+        states = vector_env.s.copy()
+        actions = np.full((4, 1), 0.5)
+        s, _, _, _ = vector_env.step(actions)
+        for state, action, new_state in zip(states, actions, s):
+            reference_state, _ = env.dynamics.step(state, action)
+            self.assertTrue(np.allclose(new_state, reference_state))
+
+    def test_side_effects_rejected(self):
+        with self.assertRaises(ValueError):
+            VectorEnvironment(Slip(), n_envs=2)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -458,3 +458,75 @@ class TestGP(unittest.TestCase):
         self.assertEqual(pred.shape, (27,))
         self.assertTrue(np.all(np.abs(pred - y_) < tol))
 
+    def test_incremental_cholesky(self):
+        np.random.seed(0)
+        initialization = {
+            'likelihood.noise_covar.noise': 1e-2,
+            'covar_module.base_kernel.lengthscale': 0.3,
+            'covar_module.outputscale': 1.
+        }
+        x = np.random.rand(40, 2).astype(np.float32)
+        y = np.sin(3 * x.sum(axis=1))
+        x_query = np.random.rand(30, 2).astype(np.float32)
+
+        def exact_prediction(gp):
+            # Switching to training mode clears the predictions cached by GPyTorch
+            gp.train()
+            gp.eval()
+            gp.likelihood.eval()
+            with torch.no_grad():
+                return gp.likelihood(gp(x_query))
+
+        datasets = [
+            (None, None),
+            ('timeforgetting', {'keep': 60}),
+            ('neighborerasing', {'radius': 0.05}),
+        ]
+        for dataset_type, dataset_params in datasets:
+            incremental = MaternGP(
+                x, y, dataset_type=dataset_type, dataset_params=dataset_params,
+                hyperparameters_initialization=initialization,
+                incremental_cholesky=True
+            )
+            standard = MaternGP(
+                x, y, dataset_type=dataset_type, dataset_params=dataset_params,
+                hyperparameters_initialization=initialization
+            )
+            incremental.predict(x_query)
+            for _ in range(10):
+                x_ = np.random.rand(5, 2).astype(np.float32)
+                y_ = np.sin(3 * x_.sum(axis=1))
+                incremental.append_data(x_, y_)
+                standard.append_data(x_, y_)
+                # The factor is updated, and not recomputed from scratch
+                self.assertIsNotNone(incremental._factorization)
+            self.assertTrue(torch.equal(incremental.train_x, standard.train_x))
+
+            covariance = incremental._covariance(incremental.train_x,
+                                                 incremental.train_x) + \
+                incremental._noise_covariance(incremental.train_x.shape[0])
+            self.assertTrue(torch.allclose(
+                incremental._factorization['cholesky'],
+                torch.linalg.cholesky(covariance),
+                atol=1e-5
+            ))
+
+            prediction = incremental.predict(x_query)
+            expected = exact_prediction(standard)
+            self.assertTrue(np.allclose(prediction.mean.numpy(),
+                                        expected.mean.numpy(), atol=1e-4))
+            self.assertTrue(np.allclose(prediction.variance.numpy(),
+                                        expected.variance.numpy(), atol=1e-4))
+
+            # Changing the hyperparameters or the dataset invalidates the factor
+            incremental.initialize(**{'covar_module.outputscale': 2.})
+            standard.initialize(**{'covar_module.outputscale': 2.})
+            self.assertTrue(np.allclose(incremental.predict(x_query).mean.numpy(),
+                                        exact_prediction(standard).mean.numpy(),
+                                        atol=1e-4))
+            incremental.set_data(x, y)
+            self.assertIsNone(incremental._factorization)
+            standard.set_data(x, y)
+            self.assertTrue(np.allclose(incremental.predict(x_query).mean.numpy(),
+                                        exact_prediction(standard).mean.numpy(),
+                                        atol=1e-4))
@@ -1,10 +1,13 @@
 import unittest
+import os
+import tempfile
+from pathlib import Path
 import numpy as np
 import gym
 
 from edge.model.safety_models import SafetyTruth
 from edge.envs import Hovership
-from edge.space import StateActionSpace
+from edge.space import StateActionSpace, Segment
 from edge.gym_wrappers import GymEnvironmentWrapper
 
 
@@ -49,6 +52,110 @@ class SafetyTruthTest(unittest.TestCase):
         self.assertTrue((train_y[:1200] > 0).all())
         self.assertTrue((train_y[1200:] == 0).all())
 
+    def test_queries(self):
+        env = Hovership()
+        truth = SafetyTruth(env)
+
+        vibly_file_path = '../data/ground_truth/from_vibly/hover_map.pickle'
+        truth.from_vibly_file(vibly_file_path)
+        space = truth.stateaction_space
+
+        index = np.stack([
+            np.random.randint(n, size=50) for n in space.shape
+        ], axis=1)
+        stateactions = space.get_element_of_index_batch(index)
+        states, actions = stateactions[:, :1], stateactions[:, 1:]
+        for query, values in [(truth.is_viable, truth.viable_set),
+                              (truth.is_unviable, truth.unviable_set),
+                              (truth.is_failure, truth.failure_set)]:
+            expected = values[tuple(index.T)] == 1
+            self.assertTrue(np.all(query(stateaction=stateactions) == expected))
+            self.assertTrue(np.all(query(states, actions) == expected))
+            self.assertEqual(query(states[0], actions[0]), expected[0])
+        self.assertTrue(np.all(
+            truth.measure(states, actions) ==
+            truth.measure_value[tuple(index.T)]
+        ))
+        self.assertEqual(truth.measure(states[0], slice(None)).shape,
+                         (space.action_space.shape[0],))
+
+        target = StateActionSpace(
+            Segment(*space.state_space.limits[0], 31),
+            Segment(*space.action_space.limits[0], 11)
+        )
+        resampled = truth.viable_set_like(target)
+        self.assertEqual(resampled.shape, target.shape)
+        target_stateactions = target[:, :].reshape((-1, 2))
+        self.assertTrue(np.all(
+            resampled.reshape(-1) == truth.is_viable(
+                stateaction=space.closest_in_batch(target_stateactions)
+            )
+        ))
+        self.assertIs(truth.viable_set_like(target), resampled)
+        # Modifying the viable set in place invalidates the cache
+        viable_set = np.array(truth.viable_set)
+        truth.viable_set = viable_set
+        viable_set[:] = False
+        self.assertFalse(truth.viable_set_like(target).any())
+        viable_set[0, 0] = True
+        self.assertTrue(truth.viable_set_like(target)[0, 0])
+        truth.viable_set = np.zeros_like(truth.viable_set)
+        self.assertFalse(truth.viable_set_like(target).any())
+
+    def test_compact_format(self):
+        env = Hovership()
+        vibly_file_path = '../data/ground_truth/from_vibly/hover_map.pickle'
+        truth = SafetyTruth(env)
+        truth.from_vibly_file(vibly_file_path)
+
+        with tempfile.TemporaryDirectory() as directory:
+            cached_truth = SafetyTruth(env)
+            cached_truth.from_vibly_file(vibly_file_path,
+                                         cache_directory=directory)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            cached_truth = SafetyTruth(env)
+            cached_truth.from_vibly_file(vibly_file_path,
+                                         cache_directory=directory)
+            self.assertIsInstance(cached_truth.measure_value, np.memmap)
+            self.assertEqual(cached_truth.measure_value.dtype, np.float32)
+            self.assertEqual(cached_truth.stateaction_space.shape,
+                             truth.stateaction_space.shape)
+
+            compact_path = Path(directory) / 'truth'
+            truth.save(compact_path, compact=True)
+            loaded_truth = SafetyTruth.load(compact_path, env)
+            for loaded in [cached_truth, loaded_truth]:
+                for name in ['viable_set', 'failure_set', 'unviable_set']:
+                    self.assertEqual(getattr(loaded, name).dtype, bool)
+                    self.assertTrue(np.all(
+                        getattr(loaded, name) == getattr(truth, name)
+                    ))
+                self.assertTrue(np.allclose(loaded.measure_value,
+                                            truth.measure_value))
+                self.assertTrue(np.allclose(loaded.state_measure,
+                                            truth.state_measure))
+
+            other_env = Hovership(dynamics_parameters={'max_thrust': 0.5})
+            with self.assertRaises(ValueError):
+                SafetyTruth.load(compact_path, other_env)
+
+            # Ground truths computed on the grid of the environment
+            small_env = Hovership(dynamics_parameters={'shape': (41, 21)})
+            computed_truth = SafetyTruth(small_env)
+            computed_truth.compute()
+            npz_path = Path(directory) / 'computed_truth.npz'
+            computed_truth.save(npz_path.with_suffix(''))
+            # Without the compact format, a path without suffix gives a .npz file, as np.savez does
+            self.assertTrue(npz_path.is_file())
+            computed_truth.save(npz_path.with_suffix(''), compact=True)
+            for path in [npz_path, npz_path.with_suffix('')]:
+                loaded = SafetyTruth.load(path, small_env)
+                self.assertTrue(np.all(
+                    loaded.viable_set == computed_truth.viable_set
+                ))
+                self.assertTrue(np.allclose(loaded.measure_value,
+                                            computed_truth.measure_value))
+
     def test_gym_truth_computation(self):
         env = CartPole((50, 50, 50, 50, 50))
         print('Computing map...')
@@ -1,8 +1,16 @@
 import unittest
+import tempfile
+from pathlib import Path
 import numpy as np
 
 from edge.envs import Hovership, DiscreteHovership
-from edge.model.safety_models import SafetyTruth
+from edge.envs.continuous_cartpole import ContinuousCartPole
+from edge.gym_wrappers import GymEnvironmentWrapper
+from edge.dynamics import DiscreteTimeDynamics, TransitionMap
+from edge.model.safety_models import SafetyTruth, compute_truth_sweep
+from edge.model.safety_models.viability import viable_set_by_worklist, \
+    viable_set_by_sweeps, viable_set_by_blocks
+from edge.utils.map_computation import _shard_fingerprint
 
 
 class MyDiscreteHovership(DiscreteHovership):
@@ -39,6 +47,220 @@ class MyTestCase(unittest.TestCase):
             f'{Q_map}\nGround truth:\n{true_Q_map}'
         )
 
+    def test_batch_dynamics_map(self):
+        env = MyDiscreteHovership()
+        dynamics = env.dynamics
+        self.assertTrue(dynamics.has_step_batch)
+
+        stateactions = dynamics.stateaction_space[:, :].reshape((-1, 2))
+        states, actions = dynamics.stateaction_space.get_tuple_batch(
+            stateactions
+        )
+        new_states, feasible = dynamics.step_batch(states, actions)
+        loop_states, loop_feasible = DiscreteTimeDynamics.step_batch(
+            dynamics, states, actions
+        )
+        self.assertTrue(np.all(new_states == loop_states))
+        self.assertTrue(np.all(feasible == loop_feasible))
+
+        Q_map, failures = dynamics.compute_map(block_size=5,
+                                               return_failures=True)
+        self.assertTrue(np.all(Q_map == dynamics.compute_map()))
+        self.assertEqual(failures.shape, Q_map.shape)
+        self.assertTrue(not failures.any())
+
+    def test_sharded_dynamics_map(self):
+        env = MyDiscreteHovership()
+        dynamics = env.dynamics
+        Q_map = dynamics.compute_map()
+        with tempfile.TemporaryDirectory() as shard_directory:
+            sharded_Q_map = env.compute_dynamics_map(
+                n_workers=2, shard_directory=shard_directory, block_size=3,
+                shard_size=7
+            )
+            self.assertTrue(np.all(Q_map == sharded_Q_map))
+            self.assertEqual(len(list(Path(shard_directory).glob('shard_*'))),
+                             int(np.ceil(Q_map.size / 7)))
+            shards = [Path(shard_directory) / 'shard_0_7.npz',
+                      Path(shard_directory) / 'shard_7_14.npz']
+
+            # Finished shards are loaded instead of being computed again
+            with np.load(shards[0]) as shard:
+                next_state_ids = shard['next_state_ids']
+                next_states = shard['next_states']
+                failures = shard['failures']
+            np.savez(shards[0], next_state_ids=next_state_ids + 1,
+                     next_states=next_states, failures=failures)
+            shards[1].unlink()
+            resumed_Q_map = dynamics.compute_map(
+                shard_directory=shard_directory, block_size=3, shard_size=7
+            )
+            self.assertTrue(np.all(
+                resumed_Q_map.reshape(-1)[:7] == next_state_ids + 1
+            ))
+            self.assertTrue(np.all(
+                resumed_Q_map.reshape(-1)[7:] == Q_map.reshape(-1)[7:]
+            ))
+            self.assertTrue(shards[1].exists())
+
+            # Shards computed with other dynamics parameters are not reused
+            other_env = DiscreteHovership(dynamics_parameters=dict(
+                env.dynamics.parameters, ground_gravity=2
+            ))
+            other_Q_map = other_env.dynamics.compute_map()
+            self.assertFalse(np.all(other_Q_map == Q_map))
+            self.assertTrue(np.all(other_env.compute_dynamics_map(
+                shard_directory=shard_directory, block_size=3, shard_size=7
+            ) == other_Q_map))
+            # Neither are shards of another size
+            self.assertTrue(np.all(dynamics.compute_map(
+                shard_directory=shard_directory, block_size=3, shard_size=5
+            ) == Q_map))
+            self.assertFalse(shards[0].exists())
+
+        # Large arrays of parameters are hashed by content, and not through their truncated representation
+        parameters = np.zeros(10000)
+        other_parameters = parameters.copy()
+        other_parameters[5000] = 1
+        self.assertNotEqual(
+            _shard_fingerprint(env.stateaction_space, 7, {'p': parameters}),
+            _shard_fingerprint(env.stateaction_space, 7,
+                               {'p': other_parameters})
+        )
+
+    def test_transition_map(self):
+        env = MyDiscreteHovership()
+        dynamics = env.dynamics
+        Q_map = dynamics.compute_map()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'map'
+            transition_map = env.compute_transition_map(path=path,
+                                                        block_size=5)
+            del transition_map
+            self.assertTrue(TransitionMap.is_transition_map(path))
+            transition_map = TransitionMap.load(path)
+            self.assertIsInstance(transition_map.next_state_ids, np.memmap)
+            self.assertEqual(transition_map.next_state_ids.dtype, np.int32)
+            self.assertEqual(transition_map.next_states.dtype, np.float32)
+            self.assertTrue(np.all(transition_map.next_state_ids == Q_map))
+            self.assertEqual(transition_map.shape, Q_map.shape)
+            self.assertTrue(not transition_map.failures.any())
+
+            stateactions = dynamics.stateaction_space[:, :].reshape((-1, 2))
+            states, actions = dynamics.stateaction_space.get_tuple_batch(
+                stateactions
+            )
+            next_states, _ = dynamics.step_batch(states, actions)
+            self.assertTrue(np.all(
+                transition_map.next_states.reshape((-1, 1)) == next_states
+            ))
+
+            truth = SafetyTruth(env)
+            truth.compute(path)
+            reference = SafetyTruth(env)
+            reference.compute()
+            self.assertTrue(np.all(truth.viable_set == reference.viable_set))
+
+    def test_failure_mask(self):
+        env = MyDiscreteHovership()
+        transition_map = TransitionMap.empty(env.stateaction_space)
+        failures = np.random.rand(transition_map.size) < 0.5
+        # Blocks that do not start on a byte boundary
+        for start in range(0, transition_map.size, 5):
+            stop = min(start + 5, transition_map.size)
+            transition_map.write(start, stop, np.zeros(stop - start),
+                                 np.zeros((stop - start, 1)),
+                                 failures[start:stop])
+        self.assertTrue(np.all(
+            transition_map.failures.reshape(-1) == failures
+        ))
+        self.assertEqual(transition_map.packed_failures.size,
+                         int(np.ceil(transition_map.size / 8)))
+
+    def test_gym_dynamics_map(self):
+        env = ContinuousCartPole(discretization_shape=(3, 3, 3, 3, 3))
+        env.reset()
+        state = env.s.copy()
+        gym_state = np.array(env.gym_env.state)
+
+        Q_map = env.compute_dynamics_map()
+        # The live state of the environment is not modified
+        self.assertTrue(np.all(env.s == state))
+        self.assertTrue(np.all(np.array(env.gym_env.state) == gym_state))
+        self.assertEqual(env.reward_accumulator, 0)
+
+        parallel_Q_map = env.compute_dynamics_map(n_workers=2, block_size=10)
+        self.assertTrue(np.all(Q_map == parallel_Q_map))
+
+        # Shards computed with other physics parameters are not reused
+        other_env = ContinuousCartPole(discretization_shape=(3, 3, 3, 3, 3))
+        other_env.gym_env.unwrapped.tau = 0.1
+        self.assertNotEqual(other_env.map_parameters, env.map_parameters)
+        other_Q_map = other_env.compute_dynamics_map()
+        self.assertFalse(np.all(other_Q_map == Q_map))
+        with tempfile.TemporaryDirectory() as shard_directory:
+            self.assertTrue(np.all(env.compute_dynamics_map(
+                shard_directory=shard_directory, shard_size=100
+            ) == Q_map))
+            self.assertTrue(np.all(other_env.compute_dynamics_map(
+                shard_directory=shard_directory, shard_size=100
+            ) == other_Q_map))
+
+        # Each transition is computed from the state given by the grid
+        stateaction = env.stateaction_space[1, 0, 2, 1, 2]
+        s, a = env.stateaction_space.get_tuple(stateaction)
+        env.gym_env.state = env.state_space.to_gym(s)
+        env.s = s
+        next_state, _, _ = env.step(a)
+        self.assertEqual(
+            Q_map[1, 0, 2, 1, 2],
+            env.state_space.flat_index_of(next_state, around_ok=True)[0]
+        )
+
+    def test_gym_transition_batch(self):
+        env = ContinuousCartPole(discretization_shape=(3, 3, 3, 3, 3))
+        stateactions = env.stateaction_space[:, :, :, :, :].reshape((-1, 5))
+        states, actions = env.stateaction_space.get_tuple_batch(stateactions)
+        next_states, failures = env.transition_batch(states, actions)
+        loop_next_states, loop_failures = GymEnvironmentWrapper.\
+            transition_batch(env, states, actions)
+        self.assertTrue(np.allclose(next_states, loop_next_states))
+        self.assertTrue(np.all(failures == loop_failures))
+        self.assertTrue(failures.any() and not failures.all())
+
+        # The generic implementation gives the same transitions as sequential calls to `step` from the same states
+        order = np.argsort(np.logical_not(failures))
+        env.reset()
+        live_state = env.s.copy()
+        batch_next_states, batch_failures = GymEnvironmentWrapper.\
+            transition_batch(env, states[order], actions[order])
+        transition_env = env._transition_env
+        for n in order[:30]:
+            reference = ContinuousCartPole(discretization_shape=(3, 3, 3, 3, 3))
+            reference.gym_env.state = reference.state_space.to_gym(states[n])
+            reference.s = states[n]
+            next_state, _, failed = reference.step(actions[n])
+            position = np.flatnonzero(order == n)[0]
+            self.assertTrue(np.allclose(batch_next_states[position],
+                                        reference.state_space.closest_in(
+                                            next_state)))
+            self.assertEqual(batch_failures[position], failed)
+        self.assertTrue(np.all(env.s == live_state))
+        # The copy of the environment is made once, unless its parameters change
+        GymEnvironmentWrapper.transition_batch(env, states[:2], actions[:2])
+        self.assertIs(env._transition_env, transition_env)
+        env.gym_env.unwrapped.tau = 0.1
+        GymEnvironmentWrapper.transition_batch(env, states[:2], actions[:2])
+        self.assertEqual(env._transition_env.gym_env.unwrapped.tau, 0.1)
+        env.gym_env.unwrapped.tau = 0.02
+
+        forces = np.linspace(-1, 1, len(states))
+        physics = env.gym_env.step_physics_batch(states, forces)
+        for state, force, next_state in zip(states, forces, physics):
+            env.gym_env.state = state
+            self.assertTrue(np.allclose(env.gym_env.stepPhysics(force),
+                                        next_state))
+
     def test_safety_map(self):
         env = MyDiscreteHovership()
         safety = SafetyTruth(env)
@@ -59,6 +281,136 @@ class MyTestCase(unittest.TestCase):
             f'Computed:\n{safety.viable_set}\nGround truth:\n{true_safety_map}'
         )
 
+        sweep_safety = SafetyTruth(env)
+        sweep_safety.compute(method='sweep')
+        self.assertTrue(np.all(sweep_safety.viable_set == true_safety_map))
+        with self.assertRaises(ValueError):
+            safety.compute(method='unknown')
+
+    def test_warm_start(self):
+        def env_builder(parameterization):
+            return Hovership(dynamics_parameters=dict(shape=(40, 30),
+                                                      **parameterization))
+
+        parameterizations = [{'ground_gravity': ground_gravity}
+                             for ground_gravity in [0.2, 0.1, 0.15]]
+        results = compute_truth_sweep(
+            env_builder, parameterizations,
+            permissiveness=lambda p: -p['ground_gravity'],
+            compare_cold_start=True
+        )
+        self.assertEqual([p['ground_gravity'] for p, _, _ in results],
+                         [0.1, 0.15, 0.2])
+        for parameterization, truth, report in results:
+            cold_truth = SafetyTruth(env_builder(parameterization))
+            cold_truth.compute()
+            self.assertTrue(np.all(truth.viable_set == cold_truth.viable_set))
+            self.assertEqual(report['cold_n_sweeps'], cold_truth.n_sweeps)
+            self.assertEqual(report['sweeps_saved'],
+                             report['cold_n_sweeps'] - report['n_sweeps'])
+        self.assertEqual(results[0][2]['sweeps_saved'], 0)
+        self.assertTrue(results[-1][2]['sweeps_saved'] > 0)
+
+        truth = SafetyTruth(env_builder(parameterizations[0]))
+        with self.assertRaises(ValueError):
+            truth.compute(initial_viable_set=np.ones((2, 2), dtype=bool))
+
+        # Changing the maximal thrust changes the limits of the action space, but not its shape
+        with self.assertRaises(ValueError):
+            compute_truth_sweep(
+                env_builder, [{'max_thrust': 0.8}, {'max_thrust': 0.7}],
+                permissiveness=lambda p: p['max_thrust']
+            )
+
+    def test_multiresolution(self):
+        env = Hovership(dynamics_parameters={'shape': (81, 41)})
+        truth = SafetyTruth(env)
+        truth.compute()
+        multiresolution_truth = SafetyTruth(env)
+        multiresolution_truth.compute_multiresolution(coarsening=4, margin=1)
+
+        self.assertLess(multiresolution_truth.n_dynamics_evaluations,
+                        0.5 * env.stateaction_space.size)
+        for name in ['viable_set', 'failure_set', 'unviable_set',
+                     'measure_value']:
+            self.assertEqual(getattr(multiresolution_truth, name).shape,
+                             env.stateaction_space.shape)
+        self.assertGreater(
+            np.mean(multiresolution_truth.viable_set == truth.viable_set), 0.99
+        )
+        self.assertGreater(
+            np.mean(multiresolution_truth.failure_set == truth.failure_set),
+            0.99
+        )
+        self.assertLess(np.mean(np.abs(
+            multiresolution_truth.measure_value - truth.measure_value
+        )), 0.05)
+
+    def test_viability_methods(self):
+        env = ContinuousCartPole(discretization_shape=(3, 3, 3, 3, 3))
+        worklist_truth = SafetyTruth(env)
+        worklist_truth.compute()
+        sweep_truth = SafetyTruth(env)
+        sweep_truth.compute(method='sweep')
+        self.assertTrue(np.all(
+            worklist_truth.viable_set == sweep_truth.viable_set
+        ))
+        self.assertTrue(np.all(
+            worklist_truth.measure_value == sweep_truth.measure_value
+        ))
+
+        with tempfile.TemporaryDirectory() as directory:
+            chunked_truth = SafetyTruth(env)
+            # Blocks of 2 states
+            chunked_truth.compute(
+                method='chunked', output_directory=directory,
+                memory_budget=2 * 3 * SafetyTruth.BYTES_PER_ENTRY
+            )
+            self.assertIsInstance(chunked_truth.viable_set, np.memmap)
+            self.assertTrue(
+                (Path(directory) / SafetyTruth.VIABLE_SET).exists()
+            )
+            self.assertTrue(TransitionMap.is_transition_map(
+                Path(directory) / SafetyTruth.TRANSITION_MAP
+            ))
+            for name in ['viable_set', 'failure_set', 'unviable_set',
+                         'state_measure', 'measure_value']:
+                self.assertTrue(np.all(
+                    getattr(chunked_truth, name) ==
+                    getattr(worklist_truth, name)
+                ), name)
+            loaded_truth = SafetyTruth.load(directory, env)
+            self.assertTrue(np.all(
+                loaded_truth.viable_set == worklist_truth.viable_set
+            ))
+            del chunked_truth, loaded_truth
+
+        # Random maps where unviability propagates through several states
+        n_states, n_actions = 30, 3
+        for _ in range(20):
+            next_state_ids = np.random.randint(n_states,
+                                               size=(n_states, n_actions))
+            initial_viable_set = np.random.rand(n_states, n_actions) < 0.8
+            viable_set = initial_viable_set.copy()
+            changed = True
+            while changed:
+                viability_kernel = viable_set.any(axis=1)
+                new_viable_set = viable_set & viability_kernel[next_state_ids]
+                changed = np.any(new_viable_set != viable_set)
+                viable_set = new_viable_set
+            worklist_viable_set, _ = viable_set_by_worklist(
+                next_state_ids, initial_viable_set.copy()
+            )
+            sweep_viable_set, _ = viable_set_by_sweeps(
+                next_state_ids, initial_viable_set.copy()
+            )
+            blocks_viable_set, _ = viable_set_by_blocks(
+                next_state_ids, initial_viable_set.copy(), block_size=7
+            )
+            self.assertTrue(np.all(worklist_viable_set == viable_set))
+            self.assertTrue(np.all(sweep_viable_set == viable_set))
+            self.assertTrue(np.all(blocks_viable_set == viable_set))
+
 
 if __name__ == '__main__':
     unittest.main()
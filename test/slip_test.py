@@ -31,3 +31,89 @@ class SlipTests(unittest.TestCase):
         self.assertTrue(slip_dynamics.is_feasible_state(initial_state))
         self.assertTrue(slip_dynamics.is_feasible_state(new_state))
         self.assertTrue(np.isclose(initial_state-new_state, 0.0)[0])
+
+    def test_analytic_flight(self):
+        parameters = {
+            'gravity': 9.81,
+            'mass': 80,
+            'stiffness': 8200,
+            'resting_length': 1.,
+            'energy': 1877.0
+        }
+        numeric = SlipDynamics(**parameters)
+        analytic = SlipDynamics(analytic_flight=True, **parameters)
+        for state in [0.1, 0.5, 0.9]:
+            for action in [-0.1, 0.3, 1.]:
+                state = np.atleast_1d(state)
+                action = np.atleast_1d(action)
+                numeric.failed = False
+                analytic.failed = False
+                numeric_state, _ = numeric.step(state, action)
+                analytic_state, _ = analytic.step(state, action)
+                self.assertTrue(np.allclose(numeric_state, analytic_state))
+                self.assertEqual(numeric.failed, analytic.failed)
+
+    def test_stance_jacobian(self):
+        slip_dynamics = SlipDynamics(
+            gravity=9.81,
+            mass=80,
+            stiffness=8200,
+            resting_length=1.,
+            energy=1877.0
+        )
+        y = np.array([0.1, 0.9, 3., -1., 0.3, 0.])
+        jacobian = slip_dynamics.stance_jacobian(0, y)
+        eps = 1e-6
+        for i in range(6):
+            dy = np.zeros(6)
+            dy[i] = eps
+            finite_difference = (slip_dynamics.stance_dynamics(0, y + dy) -
+                                 slip_dynamics.stance_dynamics(0, y - dy)
+                                 ) / (2 * eps)
+            self.assertTrue(np.allclose(jacobian[:, i], finite_difference,
+                                        atol=1e-4))
+
+    def test_stance_solvers(self):
+        parameters = {
+            'gravity': 9.81,
+            'mass': 80,
+            'stiffness': 8200,
+            'resting_length': 1.,
+            'energy': 1877.0,
+            'shape': (5, 3),
+            'analytic_flight': True
+        }
+        slip_dynamics = SlipDynamics(**parameters)
+        stateactions = [stateaction for _, stateaction
+                        in iter(slip_dynamics.stateaction_space)]
+        for stance_solver in ['fast', 'very_fast']:
+            report = slip_dynamics.get_stance_solver_error(stance_solver,
+                                                           stateactions)
+            self.assertTrue(report['max_error'] < 1e-3)
+            self.assertEqual(report['failure_mismatches'], 0)
+        self.assertEqual(slip_dynamics.stance_solver, 'accurate')
+
+        with self.assertRaises(ValueError):
+            SlipDynamics(stance_solver='exact', **parameters)
+
+    def test_cached_failure(self):
+        slip_dynamics = SlipDynamics(
+            gravity=9.81,
+            mass=80,
+            stiffness=8200,
+            resting_length=1.,
+            energy=1877.0,
+            shape=(5, 3),
+            analytic_flight=True
+        )
+        slip_dynamics.enable_transition_cache()
+        state = slip_dynamics.stateaction_space.state_space[1]
+        action = slip_dynamics.stateaction_space.action_space[0]
+        slip_dynamics.step(state, action)
+        self.assertTrue(slip_dynamics.failed)
+
+        # The failure is replayed when the transition is read from the cache
+        slip_dynamics.failed = False
+        slip_dynamics.step(state, action)
+        self.assertEqual(slip_dynamics.transition_cache.hits, 1)
+        self.assertTrue(slip_dynamics.failed)
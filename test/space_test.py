@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 
-from edge.space import Space, Segment, Box, ProductSpace
+from edge.space import Space, Segment, Box, ProductSpace, Discrete
+from edge import error
 
 
 class TestSpaces(unittest.TestCase):
@@ -169,3 +170,141 @@ class TestSpaces(unittest.TestCase):
     def test_indexing_involution(self):
         b = Box(0, 1, (2, 2))
         self.assertTrue((b[0,0] == b[b[0,0]]).all())
+
+    def test_batch_indexing(self):
+        p = ProductSpace(Discrete(5), Box(0, 1, (3, 11)))
+        points = p[:, :, :].reshape((-1, p.data_length))
+
+        index = p.get_index_of_batch(points)
+        self.assertEqual(index.shape, (points.shape[0], p.index_dim))
+        for i, x in zip(index, points):
+            self.assertEqual(tuple(i), p.get_index_of(x))
+        self.assertTrue(p.contains_batch(points).all())
+        self.assertTrue(p.is_on_grid_batch(points).all())
+
+        off_grid = points + np.array([0, 0, 0.01])
+        off_grid[:, 2] = np.clip(off_grid[:, 2], 0, 0.99)
+        self.assertTrue(not p.is_on_grid_batch(off_grid).any())
+        with self.assertRaises(error.NotOnGrid):
+            p.get_index_of_batch(off_grid)
+        around_index = p.get_index_of_batch(off_grid, around_ok=True)
+        for i, x in zip(around_index, off_grid):
+            self.assertEqual(tuple(i), p.get_index_of(x, around_ok=True))
+
+        outside = np.array([[0, 0.5, 2.], [1, 0.5, 0.5]])
+        self.assertEqual(list(p.contains_batch(outside)), [False, True])
+        with self.assertRaises(error.OutOfSpace):
+            p.get_index_of_batch(outside)
+        closest = p.closest_in_batch(np.array([[7.2, -1, 0.3]]))
+        self.assertTrue(np.all(closest == np.array([[4, 0, 0.3]])))
+
+    def test_grid_view(self):
+        s = Box(0, 1, (4, 5))
+        full = s[:, :]
+        view = s.get_grid_view((slice(None), slice(None)))
+        self.assertTrue(np.all(view == full))
+        self.assertTrue(not view.flags.writeable)
+        self.assertTrue(full.flags.writeable)
+        again = s.get_grid_view((slice(None), slice(None)))
+        self.assertTrue(np.shares_memory(view, again))
+
+        sliced = s.get_grid_view((np.array([0.15]), slice(None)))
+        self.assertTrue(np.all(sliced == s[np.array([0.15]), :]))
+        self.assertTrue(not sliced.flags.writeable)
+
+        # The cache is bounded in bytes, and grids larger than the budget are not cached
+        s.GRID_VIEW_CACHE_BYTES = full.nbytes
+        row = s.get_grid_view((0, slice(None)))
+        self.assertTrue(np.shares_memory(row, s.get_grid_view((0, slice(None)))))
+        self.assertFalse(np.shares_memory(
+            view, s.get_grid_view((slice(None), slice(None)))
+        ))
+        self.assertLessEqual(s._grid_view_cache_nbytes, full.nbytes)
+        s.GRID_VIEW_CACHE_BYTES = full.nbytes - 1
+        s._grid_view_cache.clear()
+        s._grid_view_cache_nbytes = 0
+        s.get_grid_view((slice(None), slice(None)))
+        self.assertEqual(len(s._grid_view_cache), 0)
+
+    def test_iter_blocks(self):
+        p = ProductSpace(Discrete(3), Box(0, 1, (4, 5)))
+        elements = np.array([v for _, v in iter(p)])
+
+        blocks = p.iter_blocks(7)
+        self.assertEqual(len(blocks), 9)
+        flat_ids, values = zip(*blocks)
+        for ids, v in zip(flat_ids, values):
+            self.assertTrue(len(ids) <= 7)
+            self.assertEqual(v.shape, (len(ids), p.data_length))
+        self.assertTrue(np.all(np.hstack(flat_ids) == np.arange(60)))
+        self.assertTrue(np.all(np.vstack(values) == elements))
+
+    def test_flat_indexes(self):
+        p = ProductSpace(Discrete(3), Box(0, 1, (4, 5)))
+        self.assertEqual(p.size, 60)
+        for flat_id, (i, v) in enumerate(iter(p)):
+            self.assertEqual(p.ravel_index(i), flat_id)
+            self.assertEqual(p.unravel_index(flat_id), i)
+        indexes = np.array([i for i, _ in iter(p)])
+        flat_ids = p.ravel_index(indexes)
+        self.assertTrue(np.all(flat_ids == np.arange(60)))
+        self.assertTrue(np.all(p.unravel_index(flat_ids) == indexes))
+
+        elements = p.element_at_flat(flat_ids)
+        self.assertTrue(np.all(elements == np.array([v for _, v in iter(p)])))
+        self.assertTrue(np.all(p.flat_index_of(elements) == flat_ids))
+
+        s = Segment(0, 1, 11)
+        self.assertEqual(s.unravel_index(3), 3)
+        self.assertEqual(s.ravel_index(3), 3)
+        with self.assertRaises(IndexError):
+            p.ravel_index((3, 0, 0))
+        with self.assertRaises(IndexError):
+            p.unravel_index(60)
+
+    def test_discrete_indexing(self):
+        d = Discrete(5, 2, 7.5)
+        values = np.linspace(2, 7.5, 5)
+        for i, v in enumerate(values):
+            self.assertTrue(Space.element(v) in d)
+            self.assertEqual(d.get_index_of(Space.element(v)), i)
+        self.assertTrue(Space.element(3) not in d)
+        with self.assertRaises(error.OutOfSpace):
+            d.get_index_of(Space.element(3))
+        self.assertEqual(d.closest_in(Space.element(3))[0], 3.375)
+        self.assertEqual(d.closest_in(Space.element(100))[0], 7.5)
+
+        x = np.array([2, 3.375, 3, 7.5, 10]).reshape((-1, 1))
+        self.assertEqual(list(d.contains_batch(x)), [True, True, False, True, False])
+        self.assertEqual(list(d.closest_in_batch(x)[:, 0]), [2, 3.375, 3.375, 7.5, 7.5])
+        self.assertEqual(list(d.get_index_of_batch(x[[0, 1, 3]])[:, 0]), [0, 1, 4])
+        with self.assertRaises(error.OutOfSpace):
+            d.get_index_of_batch(x)
+
+        for v in [np.inf, -np.inf, np.nan]:
+            self.assertTrue(Space.element(v) not in d)
+        self.assertEqual(d.closest_in(Space.element(np.inf))[0], 7.5)
+        self.assertEqual(d.closest_in(Space.element(-np.inf))[0], 2)
+        x = np.array([np.inf, -np.inf, np.nan]).reshape((-1, 1))
+        self.assertEqual(list(d.contains_batch(x)), [False, False, False])
+        self.assertEqual(list(d.closest_in_batch(x)[:, 0]), [7.5, 2, 2])
+
+    def test_batch_sampling(self):
+        p = ProductSpace(Discrete(3), Box(0, 1, (4, 5)))
+        rng = np.random.default_rng(0)
+        idx = p.sample_idx(1000, rng)
+        self.assertEqual(idx.shape, (1000, 3))
+        self.assertTrue(np.all(idx >= 0))
+        self.assertTrue(np.all(idx < np.array(p.index_shape)))
+        self.assertEqual(len(np.unique(p.ravel_index(idx))), p.size)
+
+        x = p.sample(1000, np.random.default_rng(1))
+        self.assertEqual(x.shape, (1000, p.data_length))
+        self.assertTrue(p.is_on_grid_batch(x).all())
+        y = p.sample(1000, np.random.default_rng(1))
+        self.assertTrue(np.all(x == y))
+
+        x = p.sample(rng=rng)
+        self.assertTrue(x in p)
+        x = p.sample(10)
+        self.assertEqual(x.shape, (10, p.data_length))
@@ -2,6 +2,7 @@ import unittest
 import numpy as np
 
 from edge.model.value_models import QLearning, GPQLearning
+from edge.model.safety_models import MaternSafety
 from edge.envs import DiscreteHovership, Hovership
 from edge.space import Discrete, StateActionSpace
 from edge.reward import ConstantReward
@@ -144,3 +145,72 @@ class TestGPQLearning(unittest.TestCase):
 
         pred = gpqlearning.gp.predict(query).mean.numpy()
         self.assertEqual(pred.shape, (5,))
+
+    def test_prediction_cache(self):
+        env = Hovership(dynamics_parameters={'shape': (20, 5)})
+        hyperparameters = {
+            'outputscale_prior': (1, 0.1),
+            'lengthscale_prior': (0.2, 0.05),
+            'noise_prior': (0.001, 0.001)
+        }
+        gpqlearning = GPQLearning(env.stateaction_space, 0.9, 0.9,
+                                  x_seed=np.array([1., 1.]),
+                                  y_seed=np.array([1]),
+                                  gp_params=hyperparameters)
+        state = np.array([0.5])
+
+        first = gpqlearning[state, :]
+        second = gpqlearning[state, :]
+        self.assertTrue(np.all(first == second))
+        self.assertEqual(gpqlearning.prediction_cache_misses, 1)
+        self.assertEqual(gpqlearning.prediction_cache_hits, 1)
+        # The output is a copy of the cached prediction
+        second[:] = 0
+        self.assertTrue(np.all(gpqlearning[state, :] == first))
+        self.assertEqual(gpqlearning.prediction_cache_hits, 2)
+
+        # Appending data invalidates the cache
+        gpqlearning.update(state, np.array([0.5]), state, 1, False)
+        updated = gpqlearning[state, :]
+        self.assertEqual(gpqlearning.prediction_cache_misses, 3)
+        expected = gpqlearning.gp.predict(
+            gpqlearning._get_query_from_index((state, slice(None)))
+        ).mean.numpy()
+        self.assertTrue(np.allclose(updated, expected))
+
+        # So does changing the hyperparameters, directly or by fitting them
+        gpqlearning.gp.initialize(**{'covar_module.outputscale': 2.})
+        changed = gpqlearning[state, :]
+        self.assertEqual(gpqlearning.prediction_cache_misses, 4)
+        self.assertFalse(np.allclose(changed, updated))
+        gpqlearning[state, :]
+        self.assertEqual(gpqlearning.prediction_cache_misses, 4)
+        gpqlearning.gp.optimize_hyperparameters(epochs=1, lr=0.1)
+        fitted = gpqlearning[state, :]
+        self.assertEqual(gpqlearning.prediction_cache_misses, 5)
+        expected = gpqlearning.gp.predict(
+            gpqlearning._get_query_from_index((state, slice(None)))
+        ).mean.numpy()
+        self.assertTrue(np.allclose(fitted, expected))
+
+        # The cache is bounded
+        gpqlearning.prediction_cache_size = 10
+        gpqlearning[:, :]
+        gpqlearning[np.array([0.1]), :]
+        gpqlearning[np.array([0.2]), :]
+        gpqlearning[np.array([0.3]), :]
+        self.assertEqual(len(gpqlearning._prediction_cache), 2)
+        gpqlearning[np.array([0.2]), :]
+        self.assertEqual(gpqlearning.prediction_cache_misses, 9)
+
+        # The safety measure queries the same stateactions as the level set it is computed from
+        safety = MaternSafety(env.stateaction_space, 0.7,
+                              x_seed=np.array([1., 1.]),
+                              y_seed=np.array([1.]),
+                              gp_params=hyperparameters)
+        safety.measure(state)
+        self.assertEqual(safety.prediction_cache_hits, 0)
+        level_set = safety.level_set(state, 0, safety.gamma_measure)
+        self.assertEqual(safety.prediction_cache_misses, 1)
+        self.assertEqual(safety.prediction_cache_hits, 1)
+        self.assertEqual(safety.measure(state)[0], level_set.mean())